@@ -2,10 +2,27 @@
 # -*- coding: utf-8 -*-
 
 import click
-import yaml
+import secrets
 
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from .controllers.apply_controller import ApplyController
 from .controllers.cluster_controller import ClusterController
+from .controllers.exporter_controller import ExporterController
+from .controllers.inventory_controller import InventoryController
 from .controllers.service_controller import ServiceController
+from .dry_run import CallRecorder
+from .journal import Journal
+from .locking import DynamoDbLeaseStore
+from .locking import Locker
+from .locking import NullLocker
+from .parameters import ParameterLoader
+from .server import Server
+from .server import create_http_server
+
+parameter_loader = ParameterLoader()
 
 
 @click.group(chain=True)
@@ -21,20 +38,87 @@ def cli():
 @click.option('--ami', help='ID of AMI to be used for the instances of the cluster')
 @click.option('--instance-type', default='t2.micro', help='EC2 instance type (default = t2.micro)')
 @click.option('--max-instances', default='1', help='Maximum number of EC2 instances in auto-scaling group')
-def cluster(command, cluster_name, ami, instance_type, max_instances):
+@click.option('--min-instances', default='1', help='Minimum number of EC2 instances in auto-scaling group')
+@click.option('--target-utilization', default='75',
+              help='Target CPU and memory reservation of the cluster in percent for auto-scaling (default = 75)')
+@click.option('--schemes', default='internal,internet-facing',
+              help='Comma-separated load balancer schemes to create (default = internal,internet-facing)')
+@click.option('--listeners', default='http',
+              help='Comma-separated load balancer listeners: http, https (default = http)')
+@click.option('--certificate-arn', help='ARN of the ACM certificate for HTTPS listeners')
+@click.option('--ssl-policy', help='Security policy of HTTPS listeners')
+@click.option('--http2/--no-http2', default=None, help='Enable or disable HTTP/2 on the load balancers (default = on)')
+@click.option('--idle-timeout', type=int, help='Idle timeout of the load balancers in seconds (default = 60)')
+@click.option('--deregistration-delay', type=int,
+              help='Connection draining time of deregistering targets in seconds (default = 300)')
+@click.option('--health-check-path', help='Health check path of the target groups (default = /)')
+@click.option('--health-check-interval', type=int, help='Health check interval in seconds (default = 30)')
+@click.option('--healthy-threshold', type=int, help='Successful health checks until a target is healthy (default = 5)')
+@click.option('--unhealthy-threshold', type=int,
+              help='Failed health checks until a target is unhealthy (default = 2)')
+@click.option('--instance-types',
+              help='Comma-separated EC2 instance types the auto-scaling group may launch, in order of priority')
+@click.option('--on-demand-base', type=int, help='Number of on-demand instances before Spot instances (default = 0)')
+@click.option('--on-demand-percentage', type=int,
+              help='Percentage of on-demand instances above the on-demand base, the rest is Spot (default = 100)')
+@click.option('--spot-allocation-strategy',
+              help='Allocation strategy of Spot instances (default = price-capacity-optimized)')
+@click.option('--warm-pool-size', type=int, help='Number of pre-initialized instances in a warm pool (default = none)')
+@click.option('--warm-pool-state', type=click.Choice(['Stopped', 'Running', 'Hibernated']),
+              help='State of the instances in the warm pool (default = Stopped)')
+@click.option('--image-pull-behavior', type=click.Choice(['default', 'always', 'once', 'prefer-cached']),
+              help='Image pull behavior of the ECS agent (default = default)')
+@click.option('--agent-setting', multiple=True, help='Additional ECS agent setting as KEY=VALUE (repeatable)')
+@click.option('--dry-run', is_flag=True, help='Only print the AWS API calls the command would make')
+@click.option('--lock-table', envvar='CLOUDCRANE_LOCK_TABLE',
+              help='DynamoDB table for locks shared between hosts (default = lock files on this host only)')
+@click.option('--lock-timeout', type=int, help='Maximum time in seconds to wait for a shared lock (default = none)')
+@click.option('--resume', is_flag=True, help='Resume an interrupted create or delete, skipping its completed steps')
+@click.option('--journal-dir', envvar='CLOUDCRANE_JOURNAL_DIR',
+              help='Directory of the step journals of create and delete (default = cloudcrane-<uid>/journals in temp)')
+def cluster(command, cluster_name, ami, instance_type, max_instances, min_instances, target_utilization, schemes,
+            listeners, certificate_arn, ssl_policy, http2, idle_timeout, deregistration_delay, health_check_path,
+            health_check_interval, healthy_threshold, unhealthy_threshold, instance_types, on_demand_base,
+            on_demand_percentage, spot_allocation_strategy, warm_pool_size, warm_pool_state, image_pull_behavior,
+            agent_setting, dry_run, lock_table, lock_timeout, resume, journal_dir):
     """
     Manage ECS clusters.
 
-    Possible commands: create, list, delete
+    Possible commands: create, list, delete, usage
     """
-    cluster_controller = ClusterController()
+    recorder = CallRecorder() if dry_run else None
+    locker = __get_locker(lock_table, lock_timeout, dry_run)
+    cluster_controller = ClusterController(recorder=recorder, locker=locker,
+                                           journal=Journal(directory=journal_dir, read_only=dry_run))
 
     if command == 'create':
         cluster_controller.create(
             cluster_name=cluster_name,
             ami=ami,
             instance_type=instance_type,
-            max_instances=max_instances
+            max_instances=max_instances,
+            min_instances=min_instances,
+            target_utilization=target_utilization,
+            schemes=schemes.split(','),
+            listeners=listeners.split(','),
+            certificate_arn=certificate_arn,
+            ssl_policy=ssl_policy,
+            http2=http2,
+            idle_timeout=idle_timeout,
+            deregistration_delay=deregistration_delay,
+            health_check_path=health_check_path,
+            health_check_interval=health_check_interval,
+            healthy_threshold=healthy_threshold,
+            unhealthy_threshold=unhealthy_threshold,
+            instance_types=instance_types.split(',') if instance_types else (),
+            on_demand_base=on_demand_base,
+            on_demand_percentage=on_demand_percentage,
+            spot_allocation_strategy=spot_allocation_strategy,
+            warm_pool_size=warm_pool_size,
+            warm_pool_state=warm_pool_state,
+            image_pull_behavior=image_pull_behavior,
+            agent_settings=agent_setting,
+            resume=resume
         )
 
     elif command == 'list':
@@ -47,6 +131,15 @@ def cluster(command, cluster_name, ami, instance_type, max_instances):
             cluster_name=cluster_name
         )
 
+    elif command == 'usage':
+        cluster_controller.usage(
+            cluster_name=cluster_name,
+            target_utilization=target_utilization
+        )
+
+    if recorder:
+        recorder.print_report()
+
 
 @cli.command('service')
 @click.argument('command')
@@ -56,13 +149,42 @@ def cluster(command, cluster_name, ami, instance_type, max_instances):
 @click.option('--region', default='eu-central-1', help='AWS region to create the new stack in')
 @click.option('--parameters', default='cloudcrane.yaml',
               help='YAML file with parameters for deployment of service to ECS')
-def service(command, cluster_name, application, version, region, parameters):
+@click.option('--environment', help='Environment section of the parameter file to apply on top of it')
+@click.option('--overlay', multiple=True, help='Additional YAML file to merge on top of the parameters (repeatable)')
+@click.option('--wait-healthy', is_flag=True, help='Wait until the deployed tasks are healthy in their target groups')
+@click.option('--timeout', default=600, help='Maximum time in seconds to wait for healthy tasks (default = 600)')
+@click.option('--healthy-share', default=1.0,
+              help='Share of desired tasks that must be healthy when waiting (default = 1.0)')
+@click.option('--previous-version',
+              help='Version of the application to replace with a blue/green deployment of --version')
+@click.option('--traffic-steps', default='10,50,100',
+              help='Comma-separated traffic shares in percent for blue/green deployments (default = 10,50,100)')
+@click.option('--bake-time', default=30, help='Seconds to watch health after each blue/green traffic step')
+@click.option('--since', type=int, help='Only show events or logs of the last given number of minutes')
+@click.option('--follow', is_flag=True, help='Keep streaming new events or logs')
+@click.option('--services', help='Comma-separated names or globs of services to scale (default = the application)')
+@click.option('--count', help='Desired count to scale to: absolute (5) or relative (+2, -1)')
+@click.option('--wait', is_flag=True, help='Wait until scaled services run their desired count')
+@click.option('--workers', default=10, help='Number of services scaled concurrently (default = 10)')
+@click.option('--dry-run', is_flag=True, help='Only print the AWS API calls the command would make')
+@click.option('--lock-table', envvar='CLOUDCRANE_LOCK_TABLE',
+              help='DynamoDB table for locks shared between hosts (default = lock files on this host only)')
+@click.option('--lock-timeout', type=int, help='Maximum time in seconds to wait for a shared lock (default = none)')
+@click.option('--resume', is_flag=True, help='Resume an interrupted create or delete, skipping its completed steps')
+@click.option('--journal-dir', envvar='CLOUDCRANE_JOURNAL_DIR',
+              help='Directory of the step journals of create and delete (default = cloudcrane-<uid>/journals in temp)')
+def service(command, cluster_name, application, version, region, parameters, environment, overlay, wait_healthy,
+            timeout, healthy_share, previous_version, traffic_steps, bake_time, since, follow, services, count, wait,
+            workers, dry_run, lock_table, lock_timeout, resume, journal_dir):
     """
     Manage services in ECS cluster.
 
-    Possible commands: deploy, delete, list
+    Possible commands: deploy, delete, list, rollback, scale, events, logs
     """
-    service_controller = ServiceController()
+    recorder = CallRecorder() if dry_run else None
+    locker = __get_locker(lock_table, lock_timeout, dry_run)
+    service_controller = ServiceController(recorder=recorder, locker=locker,
+                                           journal=Journal(directory=journal_dir, read_only=dry_run))
 
     if version:
         service_name = application + '-' + version
@@ -71,8 +193,27 @@ def service(command, cluster_name, application, version, region, parameters):
 
     if command == 'deploy':
 
-        with open(parameters, 'rb') as f:
-            service_parameters = yaml.load(f)
+        service_parameters = parameter_loader.load(parameters, environment=environment, overlays=overlay)
+
+        if previous_version:
+            if dry_run:
+                print('ERROR: Blue/green deployments cannot be run dry')
+                exit(1)
+            try:
+                service_controller.blue_green_deploy(
+                    cluster_name=cluster_name,
+                    service_name=service_name,
+                    previous_service_name=application + '-' + previous_version,
+                    region=region,
+                    parameters=service_parameters,
+                    traffic_steps=[int(i) for i in traffic_steps.split(',')],
+                    bake_time=bake_time,
+                    timeout=timeout
+                )
+            except Exception as e:
+                print('ERROR: Blue/green deployment of service [{}] failed: {}'.format(service_name, e))
+                exit(1)
+            return
 
         service_controller.deploy(
             cluster_name=cluster_name,
@@ -81,11 +222,61 @@ def service(command, cluster_name, application, version, region, parameters):
             parameters=service_parameters
         )
 
+        if wait_healthy:
+            try:
+                service_controller.wait_healthy(
+                    cluster_name=cluster_name,
+                    service_name=service_name,
+                    timeout=timeout,
+                    healthy_share=healthy_share
+                )
+            except Exception as e:
+                print('ERROR: Service [{}] did not become healthy: {}'.format(service_name, e))
+                try:
+                    service_controller.rollback(
+                        cluster_name=cluster_name,
+                        service_name=service_name
+                    )
+                    print('Rolled back service [{}] to previous deployment'.format(service_name))
+                except Exception as e:
+                    print('ERROR: Error rolling back service [{}]: {}'.format(service_name, e))
+                exit(1)
+
+    elif command == 'rollback':
+        try:
+            service_controller.rollback(
+                cluster_name=cluster_name,
+                service_name=service_name
+            )
+        except Exception as e:
+            print('ERROR: Error rolling back service [{}]: {}'.format(service_name, e))
+            __print_usage(service)
+            exit(1)
+
+    elif command == 'scale':
+        if not count or not (services or service_name):
+            print('ERROR: Services to scale (--services or --application) and a count (--count) are required')
+            __print_usage(service)
+            exit(1)
+        try:
+            service_controller.scale_services(
+                cluster_name=cluster_name,
+                patterns=services.split(',') if services else [service_name],
+                count=count,
+                max_workers=workers,
+                wait=wait,
+                timeout=timeout
+            )
+        except Exception as e:
+            print('ERROR: Error scaling services: {}'.format(e))
+            exit(1)
+
     elif command == 'delete':
         try:
             service_controller.delete(
                 cluster_name=cluster_name,
-                service_name=service_name
+                service_name=service_name,
+                resume=resume
             )
         except Exception as e:
             print('ERROR: Error deleting service [{}]: {}'.format(service_name, e))
@@ -97,6 +288,177 @@ def service(command, cluster_name, application, version, region, parameters):
             cluster_name=cluster_name
         )
 
+    elif command == 'logs':
+        try:
+            service_controller.logs(
+                cluster_name=cluster_name,
+                service_name=service_name,
+                since=datetime.now(timezone.utc) - timedelta(minutes=since) if since else None,
+                follow=follow
+            )
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print('ERROR: Error getting logs of service [{}]: {}'.format(service_name, e))
+            exit(1)
+
+    elif command == 'events':
+        try:
+            service_controller.events(
+                cluster_name=cluster_name,
+                service_name=service_name,
+                since=datetime.now(timezone.utc) - timedelta(minutes=since) if since else None,
+                follow=follow
+            )
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print('ERROR: Error getting events of service [{}]: {}'.format(service_name, e))
+            exit(1)
+
+    if recorder:
+        recorder.print_report()
+
+
+@cli.command('inventory')
+@click.argument('command')
+@click.option('--output', default='inventory.jsonl', help='Snapshot file to write (default = inventory.jsonl)')
+@click.option('--old', help='Older snapshot file to compare')
+@click.option('--new', help='Newer snapshot file to compare')
+@click.option('--workers', default=10, help='Number of concurrent requests while crawling (default = 10)')
+def inventory(command, output, old, new, workers):
+    """
+    Inventory of all cloudcrane clusters.
+
+    Possible commands: snapshot, diff
+    """
+    inventory_controller = InventoryController(max_workers=workers)
+
+    if command == 'snapshot':
+        inventory_controller.snapshot(
+            output=output
+        )
+
+    elif command == 'diff':
+        if not old or not new:
+            print('ERROR: Snapshots to compare are required (--old, --new)')
+            __print_usage(inventory)
+            exit(1)
+        inventory_controller.diff(
+            old=old,
+            new=new
+        )
+
+
+@cli.command('apply')
+@click.argument('directory')
+@click.option('--cluster-name', default='default', help='Name of the ECS cluster (default = "default")')
+@click.option('--region', default='eu-central-1', help='AWS region of the cluster')
+@click.option('--environment', help='Environment section of the parameter files to apply on top of them')
+@click.option('--prune', is_flag=True, help='Delete services of the cluster without a parameter file')
+@click.option('--wait-healthy', is_flag=True, help='Wait until services are healthy before applying dependent ones')
+@click.option('--timeout', default=600, help='Maximum time in seconds to wait for healthy tasks (default = 600)')
+@click.option('--workers', default=10, help='Number of services applied concurrently (default = 10)')
+@click.option('--dry-run', is_flag=True, help='Only print the AWS API calls applying would make')
+@click.option('--lock-table', envvar='CLOUDCRANE_LOCK_TABLE',
+              help='DynamoDB table for locks shared between hosts (default = lock files on this host only)')
+@click.option('--lock-timeout', type=int, help='Maximum time in seconds to wait for a shared lock (default = none)')
+@click.option('--journal-dir', envvar='CLOUDCRANE_JOURNAL_DIR',
+              help='Directory of the step journals of pruned services (default = cloudcrane-<uid>/journals in temp)')
+def apply(directory, cluster_name, region, environment, prune, wait_healthy, timeout, workers, dry_run, lock_table,
+          lock_timeout, journal_dir):
+    """
+    Reconcile the services of an ECS cluster with a directory of parameter files (one file per service).
+    """
+    recorder = CallRecorder() if dry_run else None
+    apply_controller = ApplyController(max_workers=workers, recorder=recorder,
+                                       locker=__get_locker(lock_table, lock_timeout, dry_run),
+                                       journal=Journal(directory=journal_dir, read_only=dry_run))
+
+    try:
+        apply_controller.apply(
+            cluster_name=cluster_name,
+            directory=directory,
+            region=region,
+            environment=environment,
+            prune=prune,
+            wait_healthy=wait_healthy,
+            timeout=timeout
+        )
+    except Exception as e:
+        print('ERROR: Error applying directory [{}]: {}'.format(directory, e))
+        exit(1)
+
+    if recorder:
+        recorder.print_report()
+
+
+@cli.command('serve')
+@click.option('--host', default='127.0.0.1', help='Address to listen on (default = 127.0.0.1)')
+@click.option('--port', default=8080, help='Port to listen on (default = 8080)')
+@click.option('--socket', 'socket_path', help='Unix socket to listen on instead of a port')
+@click.option('--token', envvar='CLOUDCRANE_API_TOKEN',
+              help='Bearer token required by the API on a port (default = generated and printed on start)')
+@click.option('--workers', default=4, help='Number of operations run concurrently (default = 4)')
+@click.option('--max-queue', default=100, help='Maximum number of queued operations (default = 100)')
+@click.option('--lock-table', envvar='CLOUDCRANE_LOCK_TABLE',
+              help='DynamoDB table for locks shared between hosts (default = lock files on this host only)')
+@click.option('--lock-timeout', type=int, help='Maximum time in seconds to wait for a shared lock (default = none)')
+@click.option('--journal-dir', envvar='CLOUDCRANE_JOURNAL_DIR',
+              help='Directory of the step journals of create and delete (default = cloudcrane-<uid>/journals in temp)')
+def serve(host, port, socket_path, token, workers, max_queue, lock_table, lock_timeout, journal_dir):
+    """
+    Serve cluster and service operations as local JSON API (POST /<cluster|service>/<operation>).
+    """
+    locker = __get_locker(lock_table, lock_timeout)
+    journal = Journal(directory=journal_dir)
+    server = Server(
+        cluster_controller=ClusterController(locker=locker, journal=journal),
+        service_controller=ServiceController(locker=locker, journal=journal),
+        parameter_loader=parameter_loader,
+        max_workers=workers,
+        max_queue=max_queue
+    )
+    if not socket_path and not token:
+        token = secrets.token_urlsafe(32)
+        print('API token: {0}'.format(token))
+    http_server = create_http_server(server, host=host, port=port, socket_path=socket_path, token=token)
+
+    print('Serving on [{0}]'.format(socket_path or '{0}:{1}'.format(host, port)))
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        server.shutdown()
+
+
+@cli.command('exporter')
+@click.option('--host', default='0.0.0.0', help='Address to serve metrics on (default = 0.0.0.0)')
+@click.option('--port', default=9102, help='Port to serve metrics on (default = 9102)')
+@click.option('--interval', default=60, help='Seconds between refreshes of cluster and service state (default = 60)')
+@click.option('--workers', default=10, help='Number of concurrent requests while refreshing (default = 10)')
+def exporter(host, port, interval, workers):
+    """
+    Export the state of all cloudcrane clusters and services as Prometheus metrics.
+    """
+    ExporterController(max_workers=workers).serve(
+        host=host,
+        port=port,
+        interval=interval
+    )
+
+
+def __get_locker(lock_table, lock_timeout, dry_run=False):
+    """
+    Get the locker of a command: lock files on this host and, with a lock table, leases in DynamoDB. Dry runs take
+    no locks.
+    """
+    if dry_run:
+        return NullLocker()
+    return Locker(store=DynamoDbLeaseStore(lock_table) if lock_table else None, timeout=lock_timeout)
+
 
 def __print_usage(command):
     """
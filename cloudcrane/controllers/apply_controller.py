@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import boto3
+import clickclick.console
+import glob
+import os
+
+from abc import ABCMeta
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from cloudcrane.controllers.service_controller import PARAMETERS_TAG
+from cloudcrane.controllers.service_controller import ServiceController
+from cloudcrane.controllers.service_controller import get_parameters_hash
+from cloudcrane.dry_run import record_calls
+from cloudcrane.parameters import ParameterLoader
+from cloudcrane.rate_limiter import limit_rate
+
+STYLES = {
+    'create': {'fg': 'green'},
+    'update': {'fg': 'yellow', 'bold': True},
+    'scale': {'fg': 'yellow'},
+    'delete': {'fg': 'red'},
+    'done': {'fg': 'green'},
+    'failed': {'fg': 'red'},
+    'skipped': {'fg': 'red'},
+}
+
+TITLES = {}
+
+# Keys of service parameter files, which only control 'apply' and are not passed on to the deployment.
+SERVICE_NAME_KEY = 'serviceName'
+DEPENDS_ON_KEY = 'dependsOn'
+
+
+class ApplyController(metaclass=ABCMeta):
+
+    __ecs = None
+    __service_controller = None
+    __parameter_loader = None
+    __max_workers = None
+
+    def __init__(self, max_workers=10, recorder=None, locker=None, journal=None):
+        """
+        With a recorder (dry run), write calls are only recorded, not sent. Changes of a service wait for its lock;
+        pruned services are deleted with a step journal.
+        """
+        self.__ecs = limit_rate(boto3.client('ecs'), 'ecs')
+        if recorder is not None:
+            record_calls(self.__ecs, recorder)
+        self.__service_controller = ServiceController(recorder=recorder, locker=locker, journal=journal)
+        self.__parameter_loader = ParameterLoader()
+        self.__max_workers = max_workers
+
+    def apply(self, cluster_name, directory, region, environment=None, prune=False, wait_healthy=False,
+              timeout=600):
+        """
+        Reconcile the services of a cluster with a directory of parameter files. Every YAML file of the directory
+        (except files starting with '_', e.g. shared bases) is a service named after the file or its 'serviceName'.
+        Services are created, updated (changed parameters), scaled (changed desired count only) or, with 'prune',
+        deleted (no parameter file). Unchanged services are left alone. Actions run concurrently, but not before
+        the services in 'dependsOn' of a service are applied (and healthy, with 'wait_healthy'); deletions run last.
+        """
+        desired = self.load(directory, environment)
+        actual = self.__get_services(cluster_name)
+        plan = get_plan(desired, actual, prune)
+
+        rows = [{'action': action, 'service_name': service_name, 'reason': reason}
+                for action, service_name, reason in plan]
+        clickclick.console.print_table(['action', 'service_name', 'reason'], rows, styles=STYLES, titles=TITLES)
+
+        results = self.__execute(cluster_name, region, plan, desired, wait_healthy, timeout)
+
+        rows = [{'service_name': service_name, 'result': result, 'error': error}
+                for service_name, (result, error) in sorted(results.items())]
+        if rows:
+            clickclick.console.print_table(['service_name', 'result', 'error'], rows, styles=STYLES, titles=TITLES)
+
+        failed = sorted(service_name for service_name, (result, _) in results.items() if result != 'done')
+        if failed:
+            raise Exception('Applying services failed: [{0}]'.format(', '.join(failed)))
+        return plan
+
+    def load(self, directory, environment=None):
+        """
+        Load the parameter files of a directory into a dict of service name to parameters.
+        """
+        services = dict()
+        paths = sorted(glob.glob(os.path.join(directory, '*.yaml')) + glob.glob(os.path.join(directory, '*.yml')))
+        for path in paths:
+            file_name = os.path.basename(path)
+            if file_name.startswith('_'):
+                continue
+
+            parameters = self.__parameter_loader.load(path, environment=environment)
+            service_name = parameters.get(SERVICE_NAME_KEY, os.path.splitext(file_name)[0])
+            if service_name in services:
+                raise Exception('Duplicate service in directory [{0}]: [{1}]'.format(directory, service_name))
+            services[service_name] = parameters
+
+        for service_name, parameters in services.items():
+            for dependency in parameters.get(DEPENDS_ON_KEY, []):
+                if dependency not in services:
+                    raise Exception('Unknown dependency of service [{0}]: [{1}]'.format(service_name, dependency))
+        get_dependency_order(services)
+
+        return services
+
+    def __get_services(self, cluster_name):
+        """
+        Get active services of a cluster with their tags (paginated, described in batches of 10).
+        """
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+
+        services = dict()
+        for i in range(0, len(service_arns), 10):
+            for service in self.__ecs.describe_services(
+                    cluster=cluster_name,
+                    services=service_arns[i:i + 10],
+                    include=['TAGS'])['services']:
+                if service['status'] == 'ACTIVE':
+                    services[service['serviceName']] = service
+        return services
+
+    def __execute(self, cluster_name, region, plan, desired, wait_healthy, timeout):
+        """
+        Run the actions of a plan concurrently in dependency order. Actions depending on a failed action are
+        skipped. Returns a dict of service name to (result, error).
+        """
+        actions = {service_name: action for action, service_name, _ in plan}
+        dependencies = {service_name: [i for i in desired.get(service_name, {}).get(DEPENDS_ON_KEY, [])
+                                       if i in actions]
+                        for service_name in actions}
+        deletions = [service_name for service_name, action in actions.items() if action == 'delete']
+        for service_name in deletions:
+            dependencies[service_name] = [i for i in actions if actions[i] != 'delete']
+
+        results = dict()
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            while len(results) < len(actions):
+                for service_name in actions:
+                    if service_name in results or service_name in running.values():
+                        continue
+                    states = [results[i][0] if i in results else None for i in dependencies[service_name]]
+                    if any(state not in [None, 'done'] for state in states):
+                        results[service_name] = ('skipped', 'dependency failed')
+                        continue
+                    if None in states:
+                        continue
+                    future = executor.submit(self.__run_action, cluster_name, region, actions[service_name],
+                                             service_name, desired.get(service_name), wait_healthy, timeout)
+                    running[future] = service_name
+
+                if not running:
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    service_name = running.pop(future)
+                    try:
+                        future.result()
+                        results[service_name] = ('done', '')
+                    except Exception as e:
+                        results[service_name] = ('failed', str(e))
+
+        return results
+
+    def __run_action(self, cluster_name, region, action, service_name, parameters, wait_healthy, timeout):
+        if action == 'delete':
+            self.__service_controller.delete(cluster_name=cluster_name, service_name=service_name)
+            return
+
+        if action == 'scale':
+            self.__service_controller.scale(
+                cluster_name=cluster_name,
+                service_name=service_name,
+                desired_count=parameters['desiredCount']
+            )
+        else:
+            self.__service_controller.deploy(
+                cluster_name=cluster_name,
+                service_name=service_name,
+                region=region,
+                parameters=get_deployment_parameters(parameters)
+            )
+
+        if wait_healthy:
+            self.__service_controller.wait_healthy(cluster_name=cluster_name, service_name=service_name,
+                                                   timeout=timeout)
+
+
+def get_deployment_parameters(parameters):
+    """
+    Get the parameters of a service without the keys that only control 'apply'.
+    """
+    return {key: value for key, value in parameters.items() if key not in [SERVICE_NAME_KEY, DEPENDS_ON_KEY]}
+
+
+def get_plan(desired, actual, prune=False):
+    """
+    Get the actions (action, service name, reason) that turn the actual services of a cluster (descriptions with
+    tags) into the desired ones (parameters), in dependency order. Services whose recorded parameters hash matches
+    are unchanged; their desired count is only compared without auto-scaling.
+    """
+    plan = list()
+    for service_name in get_dependency_order(desired):
+        parameters = get_deployment_parameters(desired[service_name])
+        service = actual.get(service_name)
+        if service is None:
+            plan.append(('create', service_name, 'new service'))
+            continue
+
+        tags = {tag['key']: tag['value'] for tag in service.get('tags', [])}
+        if tags.get(PARAMETERS_TAG) != get_parameters_hash(parameters):
+            plan.append(('update', service_name, 'parameters changed'))
+        elif 'autoScaling' not in parameters and service['desiredCount'] != parameters['desiredCount']:
+            plan.append(('scale', service_name, 'desired count {0} -> {1}'.format(
+                service['desiredCount'], parameters['desiredCount'])))
+
+    if prune:
+        for service_name in sorted(set(actual) - set(desired)):
+            plan.append(('delete', service_name, 'no parameter file'))
+
+    return plan
+
+
+def get_dependency_order(services):
+    """
+    Get the names of services ordered so that every service follows the services it depends on ('dependsOn').
+    """
+    order = list()
+    visiting = set()
+
+    def visit(service_name, chain):
+        if service_name in order:
+            return
+        if service_name in visiting:
+            raise Exception('Circular dependency of services: [{0}]'.format(' -> '.join(chain + (service_name,))))
+        visiting.add(service_name)
+        for dependency in services[service_name].get(DEPENDS_ON_KEY, []):
+            if dependency in services:
+                visit(dependency, chain + (service_name,))
+        visiting.discard(service_name)
+        order.append(service_name)
+
+    for service_name in sorted(services):
+        visit(service_name, ())
+    return order
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# Network and instance resources shared by all clusters. Load balancer resources are added per scheme by
+# cf_template_generator.render_cf_template().
 BASE_CF_TEMPLATE = '''
-AWSTemplateFormatVersion: 2010-09-09
+AWSTemplateFormatVersion: '2010-09-09'
 Description: AWS CloudFormation template
 Parameters:
   EcsAmiId:
@@ -21,13 +23,39 @@ Parameters:
     Default: 'ecs-ssh'
   AsgMaxSize:
     Type: Number
-    Description: Maximum size and initial Desired Capacity of ECS Auto Scaling Group
+    Description: Maximum size of ECS Auto Scaling Group
     Default: '1'
+  AsgMinSize:
+    Type: Number
+    Description: Minimum size and initial Desired Capacity of ECS Auto Scaling Group
+    Default: '1'
+  CpuReservationTarget:
+    Type: Number
+    Description: Target CPU reservation of the ECS cluster in percent for scaling the Auto Scaling Group
+    Default: '75'
+  MemoryReservationTarget:
+    Type: Number
+    Description: Target memory reservation of the ECS cluster in percent for scaling the Auto Scaling Group
+    Default: '75'
+  OnDemandBaseCapacity:
+    Type: Number
+    Description: Optional - Number of on-demand instances before Spot instances are used - defaults to 0
+    Default: '0'
+  OnDemandPercentageAboveBaseCapacity:
+    Type: Number
+    Description: >-
+      Optional - Percentage of on-demand instances above the on-demand base capacity, the rest are Spot
+      instances - defaults to 100
+    Default: '100'
+  SpotAllocationStrategy:
+    Type: String
+    Description: Optional - Allocation strategy of Spot instances - defaults to price-capacity-optimized
+    Default: price-capacity-optimized
+    AllowedValues: ['lowest-price', 'capacity-optimized', 'capacity-optimized-prioritized', 'price-capacity-optimized']
   IamRoleInstanceProfile:
     Type: String
     Description: >-
-      Name or the Amazon Resource Name (ARN) of the instance profile associated
-      with the IAM role for the instance
+      Name of the instance profile associated with the IAM role for the instance
     Default: ecsInstanceRole
   EcsClusterName:
     Type: String
@@ -44,6 +72,35 @@ Parameters:
       Optional - Security Group port to open on ELB - port 80 will be open by
       default
     Default: '80'
+  ElbIdleTimeout:
+    Type: Number
+    Description: Optional - Idle timeout of the ELBs in seconds - defaults to 60
+    Default: '60'
+  ElbHttp2Enabled:
+    Type: String
+    Description: Optional - Enable HTTP/2 on the ELBs - defaults to true
+    Default: 'true'
+    AllowedValues: ['true', 'false']
+  HealthCheckPath:
+    Type: String
+    Description: Optional - Health check path of the target groups - defaults to /
+    Default: /
+  HealthCheckIntervalSeconds:
+    Type: Number
+    Description: Optional - Health check interval of the target groups in seconds - defaults to 30
+    Default: '30'
+  HealthyThresholdCount:
+    Type: Number
+    Description: Optional - Consecutive successful health checks until a target is healthy - defaults to 5
+    Default: '5'
+  UnhealthyThresholdCount:
+    Type: Number
+    Description: Optional - Consecutive failed health checks until a target is unhealthy - defaults to 2
+    Default: '2'
+  DeregistrationDelay:
+    Type: Number
+    Description: Optional - Connection draining time of deregistering targets in seconds - defaults to 300
+    Default: '300'
   ElbHealthCheckTarget:
     Type: String
     Description: 'Optional - Health Check Target for ELB - defaults to HTTP:80/'
@@ -56,6 +113,28 @@ Parameters:
     Type: String
     Description: 'Optional : ECS Endpoint for the ECS Agent to connect to'
     Default: ''
+  EcsImagePullBehavior:
+    Type: String
+    Description: >-
+      Optional - Image pull behavior of the ECS Agent, prefer-cached and once reuse images cached on the
+      instance - defaults to default
+    Default: default
+    AllowedValues: ['default', 'always', 'once', 'prefer-cached']
+  EcsAgentSettings:
+    Type: CommaDelimitedList
+    Description: Optional - Additional ECS Agent settings as KEY=VALUE, written to /etc/ecs/ecs.config
+    Default: ''
+  WarmPoolMinSize:
+    Type: String
+    Description: >-
+      Optional - Minimum number of pre-initialized instances in the warm pool of the ECS Auto Scaling
+      Group - no warm pool by default
+    Default: ''
+  WarmPoolState:
+    Type: String
+    Description: Optional - State of the instances in the warm pool - defaults to Stopped
+    Default: Stopped
+    AllowedValues: ['Stopped', 'Running', 'Hibernated']
   VpcAvailabilityZones:
     Type: CommaDelimitedList
     Description: >-
@@ -82,6 +161,10 @@ Conditions:
     - !Equals
       - !Ref KeyName
       - ''
+  UseWarmPool: !Not
+    - !Equals
+      - !Ref WarmPoolMinSize
+      - ''
   UseSpecifiedVpcAvailabilityZones: !Not
     - !Equals
       - !Join
@@ -151,147 +234,47 @@ Resources:
     Properties:
       SubnetId: !Ref PubSubnetAz2
       RouteTableId: !Ref RouteViaIgw
-  EcsInternalSecurityGroup:
-    Type: 'AWS::EC2::SecurityGroup'
-    Properties:
-      GroupDescription: ECS Allowed Ports
-      VpcId: !Ref Vpc
-      SecurityGroupIngress:
-        - IpProtocol: tcp
-          FromPort: '1'
-          ToPort: '65535'
-          SourceSecurityGroupId: !Ref AlbInternalSecurityGroup
-  AlbInternalSecurityGroup:
-    Type: 'AWS::EC2::SecurityGroup'
-    Properties:
-      GroupDescription: ELB Allowed Ports
-      VpcId: !Ref Vpc
-      SecurityGroupIngress:
-        - IpProtocol: tcp
-          FromPort: !Ref ElbPort
-          ToPort: !Ref ElbPort
-          CidrIp: !Ref SourceCidr
-  InternalTargetGroup:
-    Type: 'AWS::ElasticLoadBalancingV2::TargetGroup'
-    Properties:
-      Name: !Join
-            - ''
-            - - !Ref 'AWS::StackName'
-              - '-internal-tg'
-      VpcId: !Ref Vpc
-      Port: !Ref ElbPort
-      Protocol: HTTP
-  EcsInternalElasticLoadBalancer:
-    Type: 'AWS::ElasticLoadBalancingV2::LoadBalancer'
-    Properties:
-      Name: !Join
-            - ''
-            - - !Ref 'AWS::StackName'
-              - '-internal-alb'
-      SecurityGroups:
-        - !Ref AlbInternalSecurityGroup
-      Subnets:
-        - !Ref PubSubnetAz1
-        - !Ref PubSubnetAz2
-      Scheme: internal
-  InternalLoadBalancerListener:
-    Type: 'AWS::ElasticLoadBalancingV2::Listener'
-    Properties:
-      LoadBalancerArn: !Ref EcsInternalElasticLoadBalancer
-      Port: !Ref ElbPort
-      Protocol: HTTP
-      DefaultActions:
-        - Type: forward
-          TargetGroupArn: !Ref InternalTargetGroup
-  EcsInternetFacingSecurityGroup:
-    Type: 'AWS::EC2::SecurityGroup'
-    Properties:
-      GroupDescription: ECS Allowed Ports
-      VpcId: !Ref Vpc
-      SecurityGroupIngress:
-        - IpProtocol: tcp
-          FromPort: '1'
-          ToPort: '65535'
-          SourceSecurityGroupId: !Ref AlbInternetFacingSecurityGroup
-  AlbInternetFacingSecurityGroup:
-    Type: 'AWS::EC2::SecurityGroup'
-    Properties:
-      GroupDescription: ELB Allowed Ports
-      VpcId: !Ref Vpc
-      SecurityGroupIngress:
-        - IpProtocol: tcp
-          FromPort: !Ref ElbPort
-          ToPort: !Ref ElbPort
-          CidrIp: !Ref SourceCidr
-  InternetFacingTargetGroup:
-    Type: 'AWS::ElasticLoadBalancingV2::TargetGroup'
-    Properties:
-      Name: !Join
-            - ''
-            - - !Ref 'AWS::StackName'
-              - '-internet-facing-tg'
-      VpcId: !Ref Vpc
-      Port: !Ref ElbPort
-      Protocol: HTTP
-  EcsInternetFacingElasticLoadBalancer:
-    Type: 'AWS::ElasticLoadBalancingV2::LoadBalancer'
+  EcsInstanceLt:
+    Type: 'AWS::EC2::LaunchTemplate'
     Properties:
-      Name: !Join
-            - ''
-            - - !Ref 'AWS::StackName'
-              - '-internet-facing-alb'
-      SecurityGroups:
-        - !Ref AlbInternetFacingSecurityGroup
-      Subnets:
-        - !Ref PubSubnetAz1
-        - !Ref PubSubnetAz2
-      Scheme: internet-facing
-  InternetFacingLoadBalancerListener:
-    Type: 'AWS::ElasticLoadBalancingV2::Listener'
-    Properties:
-      LoadBalancerArn: !Ref EcsInternetFacingElasticLoadBalancer
-      Port: !Ref ElbPort
-      Protocol: HTTP
-      DefaultActions:
-        - Type: forward
-          TargetGroupArn: !Ref InternetFacingTargetGroup
-  EcsInstanceLc:
-    Type: 'AWS::AutoScaling::LaunchConfiguration'
-    Properties:
-      ImageId: !Ref EcsAmiId
-      InstanceType: !Ref EcsInstanceType
-      AssociatePublicIpAddress: true
-      IamInstanceProfile: !Ref IamRoleInstanceProfile
-      KeyName: !If
-        - CreateEC2LCWithKeyPair
-        - !Ref KeyName
-        - !Ref 'AWS::NoValue'
-      SecurityGroups:
-        - !Ref EcsInternalSecurityGroup
-        - !Ref EcsInternetFacingSecurityGroup
-      UserData: !If
-        - SetEndpointToECSAgent
-        - !Base64
-          'Fn::Join':
-            - ''
-            - - |
-                #!/bin/bash
-              - echo ECS_CLUSTER=
-              - !Ref EcsClusterName
-              - ' >> /etc/ecs/ecs.config'
-              - |-
-
-                echo ECS_BACKEND_HOST=
-              - !Ref EcsEndpoint
-              - ' >> /etc/ecs/ecs.config'
-        - !Base64
+      LaunchTemplateData:
+        ImageId: !Ref EcsAmiId
+        InstanceType: !Ref EcsInstanceType
+        IamInstanceProfile:
+          Name: !Ref IamRoleInstanceProfile
+        KeyName: !If
+          - CreateEC2LCWithKeyPair
+          - !Ref KeyName
+          - !Ref 'AWS::NoValue'
+        NetworkInterfaces:
+          - DeviceIndex: 0
+            AssociatePublicIpAddress: true
+            Groups: []
+        UserData: !Base64
           'Fn::Join':
             - ''
-            - - |
-                #!/bin/bash
-              - echo ECS_CLUSTER=
+            - - "#!/bin/bash\\ncat >> /etc/ecs/ecs.config <<'EOF'\\n"
+              - ECS_CLUSTER=
               - !Ref EcsClusterName
-              - ' >> /etc/ecs/ecs.config'
+              - "\\nECS_IMAGE_PULL_BEHAVIOR="
+              - !Ref EcsImagePullBehavior
+              - "\\n"
+              - !If
+                - SetEndpointToECSAgent
+                - !Join
+                  - ''
+                  - - ECS_BACKEND_HOST=
+                    - !Ref EcsEndpoint
+                    - "\\n"
+                - ''
+              - !If
+                - UseWarmPool
+                - "ECS_WARM_POOLS_CHECK=true\\n"
+                - ''
+              - !Join
+                - "\\n"
+                - !Ref EcsAgentSettings
+              - "\\nEOF\\n"
   EcsInstanceAsg:
     Type: 'AWS::AutoScaling::AutoScalingGroup'
     Properties:
@@ -300,10 +283,17 @@ Resources:
           - ','
           - - !Ref PubSubnetAz1
             - !Ref PubSubnetAz2
-      LaunchConfigurationName: !Ref EcsInstanceLc
-      MinSize: '0'
+      MixedInstancesPolicy:
+        LaunchTemplate:
+          LaunchTemplateSpecification:
+            LaunchTemplateId: !Ref EcsInstanceLt
+            Version: !GetAtt EcsInstanceLt.LatestVersionNumber
+        InstancesDistribution:
+          OnDemandBaseCapacity: !Ref OnDemandBaseCapacity
+          OnDemandPercentageAboveBaseCapacity: !Ref OnDemandPercentageAboveBaseCapacity
+          SpotAllocationStrategy: !Ref SpotAllocationStrategy
+      MinSize: !Ref AsgMinSize
       MaxSize: !Ref AsgMaxSize
-      DesiredCapacity: !Ref AsgMaxSize
       Tags:
         - Key: Name
           Value: !Join
@@ -311,14 +301,73 @@ Resources:
             - - 'ECS Instance - '
               - !Ref 'AWS::StackName'
           PropagateAtLaunch: 'true'
+  EcsInstanceWarmPool:
+    Type: 'AWS::AutoScaling::WarmPool'
+    Condition: UseWarmPool
+    Properties:
+      AutoScalingGroupName: !Ref EcsInstanceAsg
+      MinSize: !Ref WarmPoolMinSize
+      PoolState: !Ref WarmPoolState
+      InstanceReusePolicy:
+        ReuseOnScaleIn: true
+  EcsCapacityProvider:
+    Type: 'AWS::ECS::CapacityProvider'
+    Properties:
+      AutoScalingGroupProvider:
+        AutoScalingGroupArn: !Ref EcsInstanceAsg
+        ManagedScaling:
+          Status: DISABLED
+        ManagedTerminationProtection: DISABLED
+  EcsClusterCapacityProviders:
+    Type: 'AWS::ECS::ClusterCapacityProviderAssociations'
+    Properties:
+      Cluster: !Ref EcsClusterName
+      CapacityProviders:
+        - FARGATE
+        - FARGATE_SPOT
+        - !Ref EcsCapacityProvider
+      DefaultCapacityProviderStrategy:
+        - CapacityProvider: !Ref EcsCapacityProvider
+          Weight: 1
+  EcsCpuReservationScalingPolicy:
+    Type: 'AWS::AutoScaling::ScalingPolicy'
+    Properties:
+      AutoScalingGroupName: !Ref EcsInstanceAsg
+      PolicyType: TargetTrackingScaling
+      TargetTrackingConfiguration:
+        TargetValue: !Ref CpuReservationTarget
+        CustomizedMetricSpecification:
+          MetricName: CPUReservation
+          Namespace: AWS/ECS
+          Statistic: Average
+          Dimensions:
+            - Name: ClusterName
+              Value: !Ref EcsClusterName
+  EcsMemoryReservationScalingPolicy:
+    Type: 'AWS::AutoScaling::ScalingPolicy'
+    Properties:
+      AutoScalingGroupName: !Ref EcsInstanceAsg
+      PolicyType: TargetTrackingScaling
+      TargetTrackingConfiguration:
+        TargetValue: !Ref MemoryReservationTarget
+        CustomizedMetricSpecification:
+          MetricName: MemoryReservation
+          Namespace: AWS/ECS
+          Statistic: Average
+          Dimensions:
+            - Name: ClusterName
+              Value: !Ref EcsClusterName
 Outputs:
   EcsInstanceAsgName:
     Description: Auto Scaling Group Name for ECS Instances
     Value: !Ref EcsInstanceAsg
-  EcsInternalElbName:
-    Description: Internal Load Balancer for ECS Service
-    Value: !Ref EcsInternalElasticLoadBalancer
-  EcsInternetFacingElbName:
-    Description: Internet-facing Load Balancer for ECS Service
-    Value: !Ref EcsInternetFacingElasticLoadBalancer
+  EcsCapacityProviderName:
+    Description: Capacity Provider of the ECS Instances
+    Value: !Ref EcsCapacityProvider
+  EcsSubnets:
+    Description: Subnets of awsvpc tasks
+    Value: !Join
+      - ','
+      - - !Ref PubSubnetAz1
+        - !Ref PubSubnetAz2
 '''
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import hashlib
+import json
+import yaml
+
+from cloudcrane.controllers.base_cf_template import BASE_CF_TEMPLATE
+
+SCHEMES = {
+    'internal': 'Internal',
+    'internet-facing': 'InternetFacing',
+}
+
+LISTENERS = ['http', 'https']
+
+__base_template = None
+__rendered_templates = dict()
+
+
+class CfTemplateLoader(yaml.SafeLoader):
+    """
+    YAML loader for AWS CloudFormation templates, which turns short-form intrinsic functions (e.g. !Ref)
+    into their long form (e.g. {'Ref': ...}).
+    """
+
+
+def __construct_intrinsic_function(loader, tag_suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+
+    if tag_suffix == 'Ref':
+        return {'Ref': value}
+    if tag_suffix == 'GetAtt' and isinstance(value, str):
+        value = value.split('.', 1)
+    return {'Fn::' + tag_suffix: value}
+
+
+CfTemplateLoader.add_multi_constructor('!', __construct_intrinsic_function)
+
+
+def render_cf_template(schemes=('internal', 'internet-facing'), listeners=('http',), instance_types=(),
+                       warm_pool=False):
+    """
+    Render the AWS CloudFormation template of a cluster with load balancers for the given schemes and listeners
+    (http, https) only. With instance types, the auto-scaling group launches any of them (on-demand or Spot, in
+    order of priority) instead of only the instance type of the launch template. With warm_pool, the auto-scaling
+    group gets a warm pool and launches on-demand instances of the launch template only, as EC2 Auto Scaling
+    rejects warm pools of groups with a mixed instances policy. Rendered templates are cached by the hash of
+    their options.
+    """
+    options = {'schemes': sorted(set(schemes)), 'listeners': sorted(set(listeners)),
+               'instance_types': list(dict.fromkeys(instance_types)), 'warm_pool': bool(warm_pool)}
+    key = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+    if key not in __rendered_templates:
+        __rendered_templates[key] = json.dumps(__build_cf_template(**options))
+
+    return __rendered_templates[key]
+
+
+def __build_cf_template(schemes, listeners, instance_types, warm_pool):
+    """
+    Build the template from the shared base template and the load balancer resources of each scheme.
+    """
+    if not schemes:
+        raise Exception('At least one load balancer scheme is required')
+    for scheme in schemes:
+        if scheme not in SCHEMES:
+            raise Exception('Unknown load balancer scheme: [{0}]'.format(scheme))
+    if not listeners:
+        raise Exception('At least one listener is required')
+    for listener in listeners:
+        if listener not in LISTENERS:
+            raise Exception('Unknown listener: [{0}]'.format(listener))
+    if warm_pool and instance_types:
+        raise Exception('Warm pools cannot be combined with multiple instance types')
+
+    template = copy.deepcopy(__get_base_template())
+
+    if 'https' in listeners:
+        template['Parameters']['ElbHttpsPort'] = {
+            'Type': 'String',
+            'Description': 'Optional - Port of the HTTPS listeners of the ELBs - defaults to 443',
+            'Default': '443'
+        }
+        template['Parameters']['CertificateArn'] = {
+            'Type': 'String',
+            'Description': 'ARN of the ACM certificate of the HTTPS listeners'
+        }
+        template['Parameters']['SslPolicy'] = {
+            'Type': 'String',
+            'Description': 'Optional - Security policy of the HTTPS listeners',
+            'Default': 'ELBSecurityPolicy-TLS13-1-2-2021-06'
+        }
+
+    asg_properties = template['Resources']['EcsInstanceAsg']['Properties']
+    if instance_types:
+        asg_properties['MixedInstancesPolicy']['LaunchTemplate']['Overrides'] = [
+            {'InstanceType': instance_type} for instance_type in instance_types
+        ]
+    if warm_pool:
+        mixed_instances_policy = asg_properties.pop('MixedInstancesPolicy')
+        asg_properties['LaunchTemplate'] = mixed_instances_policy['LaunchTemplate']['LaunchTemplateSpecification']
+        for parameter in ['OnDemandBaseCapacity', 'OnDemandPercentageAboveBaseCapacity', 'SpotAllocationStrategy']:
+            del template['Parameters'][parameter]
+    else:
+        del template['Resources']['EcsInstanceWarmPool']
+
+    launch_template_data = template['Resources']['EcsInstanceLt']['Properties']['LaunchTemplateData']
+    instance_security_groups = launch_template_data['NetworkInterfaces'][0]['Groups']
+    for scheme in schemes:
+        prefix = SCHEMES[scheme]
+        template['Resources'].update(__build_load_balancer_resources(scheme, prefix, listeners))
+        instance_security_groups.append({'Ref': 'Ecs' + prefix + 'SecurityGroup'})
+        template['Outputs']['Ecs' + prefix + 'ElbName'] = {
+            'Description': scheme.capitalize() + ' Load Balancer for ECS Service',
+            'Value': {'Ref': 'Ecs' + prefix + 'ElasticLoadBalancer'}
+        }
+        template['Outputs']['Ecs' + prefix + 'SecurityGroupId'] = {
+            'Description': 'Security Group of ECS instances and awsvpc tasks behind the ' + scheme + ' Load Balancer',
+            'Value': {'Ref': 'Ecs' + prefix + 'SecurityGroup'}
+        }
+
+    return template
+
+
+def __build_load_balancer_resources(scheme, prefix, listeners):
+    """
+    Build security groups, target group, load balancer and listeners of one load balancer scheme.
+    """
+    listener_ports = list()
+    if 'http' in listeners:
+        listener_ports.append({'Ref': 'ElbPort'})
+    if 'https' in listeners:
+        listener_ports.append({'Ref': 'ElbHttpsPort'})
+
+    resources = {
+        'Ecs' + prefix + 'SecurityGroup': {
+            'Type': 'AWS::EC2::SecurityGroup',
+            'Properties': {
+                'GroupDescription': 'ECS Allowed Ports',
+                'VpcId': {'Ref': 'Vpc'},
+                'SecurityGroupIngress': [{
+                    'IpProtocol': 'tcp',
+                    'FromPort': '1',
+                    'ToPort': '65535',
+                    'SourceSecurityGroupId': {'Ref': 'Alb' + prefix + 'SecurityGroup'}
+                }]
+            }
+        },
+        'Alb' + prefix + 'SecurityGroup': {
+            'Type': 'AWS::EC2::SecurityGroup',
+            'Properties': {
+                'GroupDescription': 'ELB Allowed Ports',
+                'VpcId': {'Ref': 'Vpc'},
+                'SecurityGroupIngress': [{
+                    'IpProtocol': 'tcp',
+                    'FromPort': port,
+                    'ToPort': port,
+                    'CidrIp': {'Ref': 'SourceCidr'}
+                } for port in listener_ports]
+            }
+        },
+        prefix + 'TargetGroup': {
+            'Type': 'AWS::ElasticLoadBalancingV2::TargetGroup',
+            'Properties': {
+                'Name': {'Fn::Join': ['', [{'Ref': 'AWS::StackName'}, '-' + scheme + '-tg']]},
+                'VpcId': {'Ref': 'Vpc'},
+                'Port': {'Ref': 'ElbPort'},
+                'Protocol': 'HTTP',
+                'HealthCheckPath': {'Ref': 'HealthCheckPath'},
+                'HealthCheckIntervalSeconds': {'Ref': 'HealthCheckIntervalSeconds'},
+                'HealthyThresholdCount': {'Ref': 'HealthyThresholdCount'},
+                'UnhealthyThresholdCount': {'Ref': 'UnhealthyThresholdCount'},
+                'TargetGroupAttributes': [
+                    {'Key': 'deregistration_delay.timeout_seconds', 'Value': {'Ref': 'DeregistrationDelay'}}
+                ]
+            }
+        },
+        'Ecs' + prefix + 'ElasticLoadBalancer': {
+            'Type': 'AWS::ElasticLoadBalancingV2::LoadBalancer',
+            'Properties': {
+                'Name': {'Fn::Join': ['', [{'Ref': 'AWS::StackName'}, '-' + scheme + '-alb']]},
+                'SecurityGroups': [{'Ref': 'Alb' + prefix + 'SecurityGroup'}],
+                'Subnets': [{'Ref': 'PubSubnetAz1'}, {'Ref': 'PubSubnetAz2'}],
+                'Scheme': scheme,
+                'LoadBalancerAttributes': [
+                    {'Key': 'idle_timeout.timeout_seconds', 'Value': {'Ref': 'ElbIdleTimeout'}},
+                    {'Key': 'routing.http2.enabled', 'Value': {'Ref': 'ElbHttp2Enabled'}}
+                ]
+            }
+        }
+    }
+
+    default_actions = [{'Type': 'forward', 'TargetGroupArn': {'Ref': prefix + 'TargetGroup'}}]
+
+    if 'http' in listeners:
+        resources[prefix + 'LoadBalancerListener'] = {
+            'Type': 'AWS::ElasticLoadBalancingV2::Listener',
+            'Properties': {
+                'LoadBalancerArn': {'Ref': 'Ecs' + prefix + 'ElasticLoadBalancer'},
+                'Port': {'Ref': 'ElbPort'},
+                'Protocol': 'HTTP',
+                'DefaultActions': default_actions
+            }
+        }
+
+    if 'https' in listeners:
+        resources[prefix + 'HttpsLoadBalancerListener'] = {
+            'Type': 'AWS::ElasticLoadBalancingV2::Listener',
+            'Properties': {
+                'LoadBalancerArn': {'Ref': 'Ecs' + prefix + 'ElasticLoadBalancer'},
+                'Port': {'Ref': 'ElbHttpsPort'},
+                'Protocol': 'HTTPS',
+                'Certificates': [{'CertificateArn': {'Ref': 'CertificateArn'}}],
+                'SslPolicy': {'Ref': 'SslPolicy'},
+                'DefaultActions': default_actions
+            }
+        }
+
+    return resources
+
+
+def __get_base_template():
+    """
+    Get the parsed base template. The base template is only parsed once.
+    """
+    global __base_template
+    if __base_template is None:
+        __base_template = yaml.load(BASE_CF_TEMPLATE, Loader=CfTemplateLoader)
+    return __base_template
@@ -4,10 +4,20 @@
 import boto3
 import calendar
 import clickclick.console
+import math
+import re
 
 from abc import ABCMeta
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 
-from cloudcrane.controllers.base_cf_template import BASE_CF_TEMPLATE
+from cloudcrane.controllers.cf_template_generator import render_cf_template
+from cloudcrane.dry_run import record_calls
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
+from cloudcrane.locking import NullLocker
+from cloudcrane.rate_limiter import limit_rate
 
 STYLES = {
     'DELETE_COMPLETE': {'fg': 'red'},
@@ -30,57 +40,152 @@ STYLES = {
 
 TITLES = {}
 
+# CPU units and memory (MiB) available to tasks on EC2 instance types considered for right-sizing. Memory is
+# about 90% of the instance memory, the rest is taken by the operating system and the ECS agent.
+INSTANCE_TYPES = {
+    't3.micro': (2048, 900),
+    't3.small': (2048, 1800),
+    't3.medium': (2048, 3700),
+    't3.large': (2048, 7400),
+    'c5.large': (2048, 3700),
+    'c5.xlarge': (4096, 7400),
+    'c5.2xlarge': (8192, 14800),
+    'c5.4xlarge': (16384, 29600),
+    'm5.large': (2048, 7400),
+    'm5.xlarge': (4096, 14800),
+    'm5.2xlarge': (8192, 29600),
+    'm5.4xlarge': (16384, 59200),
+    'r5.large': (2048, 14800),
+    'r5.xlarge': (4096, 29600),
+    'r5.2xlarge': (8192, 59200),
+}
+
 
 class ClusterController(metaclass=ABCMeta):
 
     __cf = None
     __ecs = None
+    __cloudwatch = None
+    __locker = None
+    __journal = None
 
-    def __init__(self):
-        self.__cf = boto3.client('cloudformation')
-        self.__ecs = boto3.client('ecs')
+    def __init__(self, recorder=None, locker=None, journal=None):
+        """
+        With a recorder (dry run), write calls are only recorded, not sent. Changes of a cluster wait for its lock
+        (by default a lock file on this host), writes fail once its lease was lost. Multi-step operations record
+        their progress in the journal.
+        """
+        self.__locker = locker or (Locker() if recorder is None else NullLocker())
+        self.__cf = self.__locker.fence(limit_rate(boto3.client('cloudformation'), 'cloudformation'))
+        self.__ecs = self.__locker.fence(limit_rate(boto3.client('ecs'), 'ecs'))
+        self.__cloudwatch = self.__locker.fence(limit_rate(boto3.client('cloudwatch'), 'cloudwatch'))
+        self.__journal = journal or Journal(read_only=recorder is not None)
+        if recorder is not None:
+            for client in [self.__cf, self.__ecs, self.__cloudwatch]:
+                record_calls(client, recorder)
 
-    def create(self, cluster_name, ami, instance_type, max_instances):
+    def create(self, cluster_name, ami, instance_type, max_instances, min_instances='1', target_utilization='75',
+               schemes=('internal', 'internet-facing'), listeners=('http',), certificate_arn=None, ssl_policy=None,
+               http2=None, idle_timeout=None, deregistration_delay=None, health_check_path=None,
+               health_check_interval=None, healthy_threshold=None, unhealthy_threshold=None, instance_types=(),
+               on_demand_base=None, on_demand_percentage=None, spot_allocation_strategy=None, warm_pool_size=None,
+               warm_pool_state=None, image_pull_behavior=None, agent_settings=(), resume=False):
         """
-        Create AWS ECS cluster from an AWS CloudFormation template.
+        Create AWS ECS cluster from an AWS CloudFormation template. The auto-scaling group of the cluster scales
+        between min_instances and max_instances to keep CPU and memory reservation at target_utilization percent.
+        Load balancers are only created for the given schemes, with the given listeners (http, https).
+        Load balancer and target group settings that are not given keep the defaults of the template.
+        The auto-scaling group launches any of the given instance types, on-demand up to on_demand_base instances
+        and on_demand_percentage percent above, Spot otherwise. Services can run on the instances or on Fargate
+        (Spot) through the capacity providers of the cluster. With warm_pool_size, the auto-scaling group keeps that
+        many pre-initialized instances (warm_pool_state Stopped, Running or Hibernated) to scale out from; warm
+        pools only support on-demand instances of the launch template's instance type.
+        ECS agent settings (KEY=VALUE) and the image pull behavior are written to the agent configuration.
+        With resume, the steps an interrupted create completed are skipped.
         """
-        self.__ecs.create_cluster(clusterName=cluster_name)
+        if 'https' in listeners and not certificate_arn:
+            raise Exception('HTTPS listeners require a certificate ARN')
+        for setting in agent_settings:
+            if not re.match('^ECS_[A-Z0-9_]+=[^,\n]*$', setting):
+                raise Exception('Invalid ECS agent setting: [{0}]'.format(setting))
+        if warm_pool_size is not None and (instance_types or on_demand_base is not None or
+                                           on_demand_percentage is not None or spot_allocation_strategy is not None):
+            raise Exception('Warm pools cannot be combined with instance types or Spot instances')
+
+        cf_template = render_cf_template(schemes=schemes, listeners=listeners, instance_types=instance_types,
+                                         warm_pool=warm_pool_size is not None)
 
         cf_parameters = dict()
         cf_parameters['EcsClusterName'] = cluster_name
         cf_parameters['EcsAmiId'] = ami
         cf_parameters['EcsInstanceType'] = instance_type
         cf_parameters['AsgMaxSize'] = max_instances
+        cf_parameters['AsgMinSize'] = min_instances
+        cf_parameters['CpuReservationTarget'] = target_utilization
+        cf_parameters['MemoryReservationTarget'] = target_utilization
+        if 'https' in listeners:
+            cf_parameters['CertificateArn'] = certificate_arn
 
-        cf_template = BASE_CF_TEMPLATE
+        optional_cf_parameters = [
+            ('SslPolicy', ssl_policy if 'https' in listeners else None),
+            ('ElbHttp2Enabled', None if http2 is None else str(http2).lower()),
+            ('ElbIdleTimeout', idle_timeout),
+            ('DeregistrationDelay', deregistration_delay),
+            ('HealthCheckPath', health_check_path),
+            ('HealthCheckIntervalSeconds', health_check_interval),
+            ('HealthyThresholdCount', healthy_threshold),
+            ('UnhealthyThresholdCount', unhealthy_threshold),
+            ('OnDemandBaseCapacity', on_demand_base),
+            ('OnDemandPercentageAboveBaseCapacity', on_demand_percentage),
+            ('SpotAllocationStrategy', spot_allocation_strategy),
+            ('WarmPoolMinSize', warm_pool_size),
+            ('WarmPoolState', warm_pool_state),
+            ('EcsImagePullBehavior', image_pull_behavior),
+            ('EcsAgentSettings', ','.join(agent_settings) if agent_settings else None)
+        ]
+        for key, value in optional_cf_parameters:
+            if value is not None:
+                cf_parameters[key] = str(value)
 
         cf_parameters_list = list()
         for key, value in cf_parameters.items():
             cf_parameters_list.append({'ParameterKey': key, 'ParameterValue': value})
 
-        self.__cf.create_stack(
-            StackName=cluster_name,
-            TemplateBody=cf_template,
-            Parameters=cf_parameters_list,
-            DisableRollback=False,
-            NotificationARNs=[],
-            Capabilities=[
-                'CAPABILITY_IAM',
-            ],
-            Tags=[
-                {
-                    'Key': 'name',
-                    'Value': cluster_name
-                }
-            ]
-        )
+        with self.__locker.lock('cluster/' + cluster_name):
+            operation = self.__journal.operation('cluster-create/' + cluster_name, resume=resume)
+
+            if not operation.done('create-cluster'):
+                self.__ecs.create_cluster(clusterName=cluster_name)
+                operation.complete('create-cluster')
+
+            if not operation.done('create-stack'):
+                self.__cf.create_stack(
+                    StackName=cluster_name,
+                    TemplateBody=cf_template,
+                    Parameters=cf_parameters_list,
+                    DisableRollback=False,
+                    NotificationARNs=[],
+                    Capabilities=[
+                        'CAPABILITY_IAM',
+                    ],
+                    Tags=[
+                        {
+                            'Key': 'name',
+                            'Value': cluster_name
+                        }
+                    ]
+                )
+                operation.complete('create-stack')
+
+            operation.finish()
 
     def delete(self, cluster_name):
         """
         Delete AWS ECS cluster including the corresponding AWS CloudFormation stack.
         """
-        self.__cf.delete_stack(StackName=cluster_name)
-        self.__ecs.delete_cluster(cluster=cluster_name)
+        with self.__locker.lock('cluster/' + cluster_name):
+            self.__cf.delete_stack(StackName=cluster_name)
+            self.__ecs.delete_cluster(cluster=cluster_name)
 
     def list(self, all):
         """
@@ -123,3 +228,156 @@ class ClusterController(metaclass=ABCMeta):
 
         columns = ['cluster_name', 'status', 'creation_time', 'description']
         clickclick.console.print_table(columns, rows, styles=STYLES, titles=TITLES)
+
+    def usage(self, cluster_name, target_utilization='75', period=3600):
+        """
+        Show CPU and memory reservation of the container instances of a cluster, average utilization of its
+        services over the last 'period' seconds, and suggest an instance type and maximum number of instances
+        that fit the current reservation at the target utilization (percent).
+        """
+        instances = list()
+        instance_arns = list()
+        for page in self.__ecs.get_paginator('list_container_instances').paginate(cluster=cluster_name):
+            instance_arns.extend(page['containerInstanceArns'])
+        for i in range(0, len(instance_arns), 100):
+            instances.extend(self.__ecs.describe_container_instances(
+                cluster=cluster_name,
+                containerInstances=instance_arns[i:i + 100]
+            )['containerInstances'])
+
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+        services = list()
+        for i in range(0, len(service_arns), 10):
+            services.extend(self.__ecs.describe_services(
+                cluster=cluster_name,
+                services=service_arns[i:i + 10]
+            )['services'])
+
+        totals = {'registered_cpu': 0, 'registered_memory': 0, 'reserved_cpu': 0, 'reserved_memory': 0}
+        instance_rows = list()
+        for instance in instances:
+            registered = get_resources(instance['registeredResources'])
+            remaining = get_resources(instance['remainingResources'])
+            reserved_cpu = registered['CPU'] - remaining['CPU']
+            reserved_memory = registered['MEMORY'] - remaining['MEMORY']
+            totals['registered_cpu'] += registered['CPU']
+            totals['registered_memory'] += registered['MEMORY']
+            totals['reserved_cpu'] += reserved_cpu
+            totals['reserved_memory'] += reserved_memory
+            instance_rows.append({
+                'instance': instance['ec2InstanceId'],
+                'instance_type': next((i['value'] for i in instance.get('attributes', [])
+                                       if i['name'] == 'ecs.instance-type'), ''),
+                'tasks': instance['runningTasksCount'],
+                'cpu': get_percentage(reserved_cpu, registered['CPU']),
+                'memory': get_percentage(reserved_memory, registered['MEMORY'])
+            })
+        instance_rows.sort(key=lambda x: x['instance'])
+
+        utilization = self.__get_service_utilization(cluster_name, [i['serviceName'] for i in services], period)
+        service_rows = list()
+        for service in services:
+            service_rows.append({
+                'service_name': service['serviceName'],
+                'tasks': str(service['runningCount']) + '/' + str(service['desiredCount']),
+                'cpu_utilization': format_percentage(utilization.get((service['serviceName'], 'CPUUtilization'))),
+                'memory_utilization': format_percentage(utilization.get((service['serviceName'],
+                                                                         'MemoryUtilization')))
+            })
+        service_rows.sort(key=lambda x: x['service_name'])
+
+        clickclick.console.print_table(['instance', 'instance_type', 'tasks', 'cpu', 'memory'], instance_rows,
+                                       styles=STYLES, titles=TITLES)
+        clickclick.console.print_table(['service_name', 'tasks', 'cpu_utilization', 'memory_utilization'],
+                                       service_rows, styles=STYLES, titles=TITLES)
+
+        cpu_reservation = get_percentage(totals['reserved_cpu'], totals['registered_cpu'])
+        memory_reservation = get_percentage(totals['reserved_memory'], totals['registered_memory'])
+        print('CPU reservation: {0}%, memory reservation: {1}%, packing efficiency: {2}%'.format(
+            cpu_reservation, memory_reservation, max(cpu_reservation, memory_reservation)))
+
+        suggestion = suggest_instances(totals['reserved_cpu'], totals['reserved_memory'], float(target_utilization))
+        if suggestion:
+            print('Suggested size: --instance-type={0} --max-instances={1}'.format(*suggestion))
+
+        return {
+            'instances': instance_rows,
+            'services': service_rows,
+            'cpu_reservation': cpu_reservation,
+            'memory_reservation': memory_reservation,
+            'suggestion': suggestion
+        }
+
+    def __get_service_utilization(self, cluster_name, service_names, period):
+        """
+        Get average CPU and memory utilization of services from CloudWatch, in batches of 500 metric queries.
+        """
+        queries = list()
+        for index, service_name in enumerate(service_names):
+            for metric_name in ['CPUUtilization', 'MemoryUtilization']:
+                queries.append(({
+                    'Id': 'm' + str(len(queries)),
+                    'MetricStat': {
+                        'Metric': {
+                            'Namespace': 'AWS/ECS',
+                            'MetricName': metric_name,
+                            'Dimensions': [
+                                {'Name': 'ClusterName', 'Value': cluster_name},
+                                {'Name': 'ServiceName', 'Value': service_name}
+                            ]
+                        },
+                        'Period': period,
+                        'Stat': 'Average'
+                    }
+                }, (service_name, metric_name)))
+
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(seconds=period)
+        keys = {query['Id']: key for query, key in queries}
+        utilization = dict()
+        for i in range(0, len(queries), 500):
+            paginator = self.__cloudwatch.get_paginator('get_metric_data')
+            for page in paginator.paginate(MetricDataQueries=[query for query, _ in queries[i:i + 500]],
+                                           StartTime=start_time, EndTime=end_time):
+                for result in page['MetricDataResults']:
+                    if result['Values']:
+                        utilization[keys[result['Id']]] = sum(result['Values']) / len(result['Values'])
+        return utilization
+
+
+def get_resources(resources):
+    """
+    Get CPU and MEMORY of registered or remaining resources of a container instance.
+    """
+    return {i['name']: i.get('integerValue', 0) for i in resources if i['name'] in ['CPU', 'MEMORY']}
+
+
+def get_percentage(value, total):
+    return round(100.0 * value / total, 1) if total else 0.0
+
+
+def format_percentage(value):
+    return '' if value is None else str(round(value, 1)) + '%'
+
+
+def suggest_instances(reserved_cpu, reserved_memory, target_utilization):
+    """
+    Suggest the instance type and number of instances that fit reserved CPU units and memory at the target
+    utilization (percent) with the least unused capacity. Returns None if nothing is reserved.
+    """
+    if not reserved_cpu and not reserved_memory:
+        return None
+
+    needed_cpu = reserved_cpu * 100.0 / target_utilization
+    needed_memory = reserved_memory * 100.0 / target_utilization
+
+    candidates = list()
+    for instance_type, (cpu, memory) in INSTANCE_TYPES.items():
+        count = max(1, math.ceil(max(needed_cpu / cpu, needed_memory / memory)))
+        unused = (count * cpu - needed_cpu) / cpu + (count * memory - needed_memory) / memory
+        candidates.append((unused, count, instance_type))
+
+    _, count, instance_type = min(candidates)
+    return instance_type, count
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import boto3
+import threading
+import time
+
+from abc import ABCMeta
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudcrane.controllers.inventory_controller import ACTIVE_STACK_STATUSES
+from cloudcrane.metrics import Metric
+from cloudcrane.metrics import create_metrics_server
+from cloudcrane.metrics import format_metrics
+from cloudcrane.metrics import get_api_metrics
+from cloudcrane.metrics import record_api_metrics
+from cloudcrane.rate_limiter import get_rate_limiters
+from cloudcrane.rate_limiter import limit_rate
+
+
+class ExporterController(metaclass=ABCMeta):
+
+    __cf = None
+    __ecs = None
+    __max_workers = None
+    __metrics = None
+    __refresh = None
+    __lock = None
+
+    def __init__(self, max_workers=10):
+        self.__cf = record_api_metrics(limit_rate(boto3.client('cloudformation'), 'cloudformation'))
+        self.__ecs = record_api_metrics(limit_rate(boto3.client('ecs'), 'ecs'))
+        self.__max_workers = max_workers
+        self.__metrics = list()
+        self.__refresh = {'duration': 0.0, 'timestamp': 0.0, 'errors': 0}
+        self.__lock = threading.Lock()
+
+    def serve(self, host='0.0.0.0', port=9102, interval=60):
+        """
+        Refresh the state of all cloudcrane clusters every 'interval' seconds and serve it with cloudcrane's own API
+        metrics on GET /metrics. Scrapes return the last refreshed state and cost no API calls.
+        """
+        http_server = create_metrics_server(self.render, host=host, port=port)
+
+        def refresh_loop():
+            while True:
+                started = time.monotonic()
+                self.refresh()
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+        threading.Thread(target=refresh_loop, daemon=True).start()
+
+        print('Serving metrics on [{0}:{1}/metrics]'.format(host, port))
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            http_server.server_close()
+
+    def refresh(self):
+        """
+        Refresh the state of all cloudcrane clusters. On errors, the state of the last refresh is kept.
+        """
+        started = time.monotonic()
+        try:
+            metrics = self.collect()
+        except Exception as e:
+            print('ERROR: Error refreshing metrics: {0}'.format(e))
+            with self.__lock:
+                self.__refresh['errors'] += 1
+            return
+
+        with self.__lock:
+            self.__metrics = metrics
+            self.__refresh['duration'] = time.monotonic() - started
+            self.__refresh['timestamp'] = time.time()
+
+    def render(self):
+        """
+        Render the last refreshed state, the refresh statistics and the API metrics of cloudcrane in the Prometheus
+        text format.
+        """
+        with self.__lock:
+            metrics = list(self.__metrics)
+            refresh = dict(self.__refresh)
+
+        metrics.extend([
+            Metric('cloudcrane_refresh_duration_seconds', 'gauge', 'Duration of the last refresh.',
+                   [('', {}, refresh['duration'])]),
+            Metric('cloudcrane_refresh_timestamp_seconds', 'gauge', 'Time of the last successful refresh.',
+                   [('', {}, refresh['timestamp'])]),
+            Metric('cloudcrane_refresh_errors_total', 'counter', 'Failed refreshes.',
+                   [('', {}, refresh['errors'])]),
+            Metric('cloudcrane_rate_limiter_wait_seconds_total', 'counter',
+                   'Time AWS API calls waited for the client-side rate limiter.',
+                   [('', {'service': service_name}, rate_limiter.waited)
+                    for service_name, rate_limiter in sorted(get_rate_limiters().items())])
+        ])
+        metrics.extend(get_api_metrics().metrics())
+        return format_metrics(metrics)
+
+    def collect(self):
+        """
+        Collect the stack status of all cloudcrane clusters (ECS clusters with a CloudFormation stack of the same
+        name) and the task counts of their services. Clusters are crawled concurrently, services are described in
+        batches of 10.
+        """
+        stacks = dict()
+        for page in self.__cf.get_paginator('list_stacks').paginate(StackStatusFilter=ACTIVE_STACK_STATUSES):
+            for stack in page['StackSummaries']:
+                stacks[stack['StackName']] = stack['StackStatus']
+
+        cluster_names = list()
+        for page in self.__ecs.get_paginator('list_clusters').paginate():
+            for cluster_arn in page['clusterArns']:
+                cluster_name = cluster_arn.split('/')[-1]
+                if cluster_name in stacks:
+                    cluster_names.append(cluster_name)
+        cluster_names.sort()
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            services = [service for cluster_services in executor.map(self.__get_services, cluster_names)
+                        for service in cluster_services]
+
+        def service_samples(field):
+            return [('', {'cluster': service['clusterArn'].split('/')[-1], 'service': service['serviceName']},
+                     field(service)) for service in services]
+
+        return [
+            Metric('cloudcrane_cluster_stack_status', 'gauge', 'CloudFormation stack status of the cluster.',
+                   [('', {'cluster': name, 'status': stacks[name]}, 1) for name in cluster_names]),
+            Metric('cloudcrane_service_desired_tasks', 'gauge', 'Desired number of tasks of the service.',
+                   service_samples(lambda x: x['desiredCount'])),
+            Metric('cloudcrane_service_running_tasks', 'gauge', 'Running tasks of the service.',
+                   service_samples(lambda x: x['runningCount'])),
+            Metric('cloudcrane_service_pending_tasks', 'gauge', 'Pending tasks of the service.',
+                   service_samples(lambda x: x['pendingCount'])),
+            Metric('cloudcrane_service_deployments', 'gauge', 'Deployments of the service (more than 1 while rolling).',
+                   service_samples(lambda x: len(x.get('deployments', []))))
+        ]
+
+    def __get_services(self, cluster_name):
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+
+        services = list()
+        for i in range(0, len(service_arns), 10):
+            services.extend(self.__ecs.describe_services(cluster=cluster_name,
+                                                         services=service_arns[i:i + 10])['services'])
+        return sorted((i for i in services if i['status'] == 'ACTIVE'), key=lambda x: x['serviceName'])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import boto3
+import clickclick.console
+import json
+
+from abc import ABCMeta
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudcrane.rate_limiter import limit_rate
+
+STYLES = {
+    'ADDED': {'fg': 'green'},
+    'REMOVED': {'fg': 'red'},
+    'CHANGED': {'fg': 'yellow', 'bold': True},
+}
+
+TITLES = {}
+
+ACTIVE_STACK_STATUSES = [
+    'CREATE_IN_PROGRESS',
+    'CREATE_COMPLETE',
+    'ROLLBACK_IN_PROGRESS',
+    'ROLLBACK_FAILED',
+    'ROLLBACK_COMPLETE',
+    'DELETE_IN_PROGRESS',
+    'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS',
+    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_IN_PROGRESS',
+    'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE',
+]
+
+
+class InventoryController(metaclass=ABCMeta):
+
+    __cf = None
+    __ecs = None
+    __elb = None
+    __max_workers = None
+
+    def __init__(self, max_workers=10):
+        self.__cf = limit_rate(boto3.client('cloudformation'), 'cloudformation')
+        self.__ecs = limit_rate(boto3.client('ecs'), 'ecs')
+        self.__elb = limit_rate(boto3.client('elbv2'), 'elbv2')
+        self.__max_workers = max_workers
+
+    def snapshot(self, output):
+        """
+        Write a snapshot of all cloudcrane clusters with their services, task definitions and target groups
+        to a JSON lines file (one record per line, sorted by kind and id).
+        """
+        records = self.crawl()
+        with open(output, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n')
+
+    def crawl(self):
+        """
+        Crawl all cloudcrane clusters (ECS clusters with a CloudFormation stack of the same name) concurrently.
+        """
+        stacks = dict()
+        for page in self.__cf.get_paginator('list_stacks').paginate(StackStatusFilter=ACTIVE_STACK_STATUSES):
+            for stack in page['StackSummaries']:
+                stacks[stack['StackName']] = stack['StackStatus']
+
+        cluster_names = list()
+        for page in self.__ecs.get_paginator('list_clusters').paginate():
+            for cluster_arn in page['clusterArns']:
+                cluster_name = cluster_arn.split('/')[-1]
+                if cluster_name in stacks:
+                    cluster_names.append(cluster_name)
+
+        records = [{'kind': 'cluster', 'id': name, 'stackStatus': stacks[name]} for name in cluster_names]
+
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            services = [service for cluster_services in executor.map(self.__get_services, cluster_names)
+                        for service in cluster_services]
+
+            task_definition_arns = sorted(set(service['taskDefinition'] for service in services))
+            task_definitions = list(executor.map(self.__get_task_definition, task_definition_arns))
+
+            target_group_arns = sorted(set(load_balancer['targetGroupArn'] for service in services
+                                           for load_balancer in service.get('loadBalancers', [])))
+            target_groups = [target_group for batch in executor.map(
+                self.__get_target_groups, [target_group_arns[i:i + 20] for i in range(0, len(target_group_arns), 20)]
+            ) for target_group in batch]
+
+        for service in services:
+            records.append({
+                'kind': 'service',
+                'id': service['clusterArn'].split('/')[-1] + '/' + service['serviceName'],
+                'status': service['status'],
+                'taskDefinition': service['taskDefinition'],
+                'desiredCount': service['desiredCount'],
+                'runningCount': service['runningCount'],
+                'launchType': service.get('launchType'),
+                'targetGroups': sorted(i['targetGroupArn'] for i in service.get('loadBalancers', []))
+            })
+
+        for task_definition in task_definitions:
+            records.append({
+                'kind': 'task-definition',
+                'id': task_definition['taskDefinitionArn'],
+                'containers': [{
+                    'name': container['name'],
+                    'image': container['image'],
+                    'cpu': container.get('cpu'),
+                    'memory': container.get('memory')
+                } for container in task_definition['containerDefinitions']]
+            })
+
+        for target_group in target_groups:
+            records.append({
+                'kind': 'target-group',
+                'id': target_group['TargetGroupArn'],
+                'name': target_group['TargetGroupName'],
+                'port': target_group.get('Port'),
+                'healthCheckPath': target_group.get('HealthCheckPath'),
+                'loadBalancers': sorted(target_group.get('LoadBalancerArns', []))
+            })
+
+        records.sort(key=lambda x: (x['kind'], x['id']))
+        return records
+
+    def diff(self, old, new):
+        """
+        Show records added, removed or changed between two snapshot files.
+        """
+        old_records = read_snapshot(old)
+        new_records = read_snapshot(new)
+
+        rows = list()
+        for key in sorted(set(old_records) | set(new_records)):
+            if key not in old_records:
+                change, fields = 'ADDED', []
+            elif key not in new_records:
+                change, fields = 'REMOVED', []
+            else:
+                fields = sorted(field for field in set(old_records[key]) | set(new_records[key])
+                                if old_records[key].get(field) != new_records[key].get(field))
+                if not fields:
+                    continue
+                change = 'CHANGED'
+            rows.append({'change': change, 'kind': key[0], 'id': key[1], 'fields': ', '.join(fields)})
+
+        columns = ['change', 'kind', 'id', 'fields']
+        clickclick.console.print_table(columns, rows, styles=STYLES, titles=TITLES)
+        return rows
+
+    def __get_services(self, cluster_name):
+        """
+        Get descriptions of all services of a cluster (paginated, described in batches of 10).
+        """
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+
+        services = list()
+        for i in range(0, len(service_arns), 10):
+            services.extend(self.__ecs.describe_services(
+                cluster=cluster_name,
+                services=service_arns[i:i + 10]
+            )['services'])
+        return services
+
+    def __get_task_definition(self, task_definition_arn):
+        return self.__ecs.describe_task_definition(taskDefinition=task_definition_arn)['taskDefinition']
+
+    def __get_target_groups(self, target_group_arns):
+        return self.__elb.describe_target_groups(TargetGroupArns=target_group_arns)['TargetGroups']
+
+
+def read_snapshot(path):
+    """
+    Read a snapshot file into a dict of records keyed by (kind, id).
+    """
+    records = dict()
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[(record['kind'], record['id'])] = record
+    return records
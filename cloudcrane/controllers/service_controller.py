@@ -3,9 +3,29 @@
 
 import boto3
 import clickclick.console
+import collections
+import fnmatch
+import hashlib
+import heapq
+import json
+import math
+import re
 import time
 
 from abc import ABCMeta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from cloudcrane.controllers.cf_template_generator import SCHEMES as SCHEME_PREFIXES
+from cloudcrane.dry_run import record_calls
+from cloudcrane.images import ImageResolver
+from cloudcrane.images import get_ecr_registries
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
+from cloudcrane.locking import NullLocker
+from cloudcrane.rate_limiter import limit_rate
 
 STYLES = {
     'ACTIVE': {'fg': 'green'},
@@ -15,73 +35,480 @@ STYLES = {
 
 TITLES = {}
 
+TARGET_GROUP_SETTINGS = {
+    'healthCheckPath': 'HealthCheckPath',
+    'healthCheckIntervalSeconds': 'HealthCheckIntervalSeconds',
+    'healthCheckTimeoutSeconds': 'HealthCheckTimeoutSeconds',
+    'healthyThresholdCount': 'HealthyThresholdCount',
+    'unhealthyThresholdCount': 'UnhealthyThresholdCount',
+}
+
+TARGET_GROUP_ATTRIBUTES = {
+    'deregistrationDelay': 'deregistration_delay.timeout_seconds',
+    'slowStart': 'slow_start.duration_seconds',
+}
+
+SCHEMES = ['internal', 'internet-facing']
+
+PREVIOUS_TASK_DEFINITION_TAG = 'cloudcrane:previous-task-definition'
+PREVIOUS_DESIRED_COUNT_TAG = 'cloudcrane:previous-desired-count'
+PARAMETERS_TAG = 'cloudcrane:parameters'
+
+PLACEMENT_FIELDS = {
+    'availability-zone': 'attribute:ecs.availability-zone',
+    'instance-type': 'attribute:ecs.instance-type',
+    'instance': 'instanceId',
+}
+
+TASK_DEFINITION_PARAMETERS = ['cpu', 'memory', 'executionRoleArn']
+
+# Statuses of SSM commands that are not finished yet.
+PENDING_COMMAND_STATUSES = ['Pending', 'InProgress', 'Cancelling']
+
+PRE_PULL_TIMEOUT = 300
+
+# Seconds between health checks while a blue/green traffic step bakes.
+BAKE_INTERVAL = 5
+
+# Attempts to create a listener rule with the next free priority while other deployments take priorities.
+RULE_PRIORITY_ATTEMPTS = 10
+
 
 class ServiceController(metaclass=ABCMeta):
 
+    __cf = None
     __ecs = None
     __elb = None
+    __autoscaling = None
+    __logs = None
+    __ssm = None
+    __recorder = None
+    __locker = None
+    __journal = None
+    __image_resolver = None
 
-    def __init__(self):
-        self.__ecs = boto3.client('ecs')
-        self.__elb = boto3.client('elbv2')
+    def __init__(self, recorder=None, locker=None, journal=None, image_resolver=None):
+        """
+        With a recorder (dry run), write calls are only recorded, not sent. Changes of a service wait for its lock
+        (by default a lock file on this host), writes fail once its lease was lost. Multi-step operations record
+        their progress in the journal. Deployments pin ECR images to their digests with the image resolver.
+        """
+        self.__locker = locker or (Locker() if recorder is None else NullLocker())
+        self.__cf = self.__locker.fence(limit_rate(boto3.client('cloudformation'), 'cloudformation'))
+        self.__ecs = self.__locker.fence(limit_rate(boto3.client('ecs'), 'ecs'))
+        self.__elb = self.__locker.fence(limit_rate(boto3.client('elbv2'), 'elbv2'))
+        self.__autoscaling = self.__locker.fence(limit_rate(boto3.client('application-autoscaling'),
+                                                            'application-autoscaling'))
+        self.__logs = self.__locker.fence(limit_rate(boto3.client('logs'), 'logs'))
+        self.__ssm = self.__locker.fence(limit_rate(boto3.client('ssm'), 'ssm'))
+        self.__recorder = recorder
+        self.__journal = journal or Journal(read_only=recorder is not None)
+        self.__image_resolver = image_resolver or ImageResolver(recorder=recorder)
+        if recorder is not None:
+            for client in [self.__cf, self.__ecs, self.__elb, self.__autoscaling, self.__logs, self.__ssm]:
+                record_calls(client, recorder)
 
     def deploy(self, cluster_name, service_name, region, parameters):
         """
         Deploy
         """
-        container_definitions = list()
-        container_definitions.append(parameters['containerDefinition'])
+        with self.__locker.lock(get_lock_name(cluster_name, service_name)):
+            self.__deploy(cluster_name, service_name, region, parameters)
+
+    def __deploy(self, cluster_name, service_name, region, parameters):
+        container_definitions = self.__get_container_definitions(parameters)
+        if parameters.get('pinImageDigests', True):
+            container_definitions = self.__pin_images(container_definitions)
+        if parameters.get('prePullImages') and not is_fargate(parameters):
+            self.__pre_pull_images(cluster_name, [i['image'] for i in container_definitions if 'image' in i])
+        bindings = self.__get_load_balancer_bindings(parameters, container_definitions)
+        launch_options = self.__get_launch_options(parameters)
+        if get_network_mode(parameters) == 'awsvpc':
+            launch_options['networkConfiguration'] = self.__get_network_configuration(cluster_name, parameters,
+                                                                                      bindings)
+        if region:
+            container_definitions = self.__configure_logging(cluster_name, service_name, region, parameters,
+                                                             container_definitions)
 
-        self.__ecs.register_task_definition(
+        task_definition = self.__ecs.register_task_definition(
             family=service_name,
             taskRoleArn='',
             volumes=[],
-            containerDefinitions=container_definitions
-        )
+            containerDefinitions=container_definitions,
+            **self.__get_task_definition_options(parameters)
+        )['taskDefinition']
 
-        target_groups = self.__elb.describe_target_groups(
-            Names=[cluster_name + '-' + parameters['loadBalancer'] + '-tg']
-        )['TargetGroups']
+        shared_target_groups = dict()
+        target_groups = list()
+        load_balancers = list()
+        for binding in bindings:
+            scheme = binding['loadBalancer']
+            if scheme not in shared_target_groups:
+                shared_target_groups[scheme] = self.__elb.describe_target_groups(
+                    Names=[cluster_name + '-' + scheme + '-tg']
+                )['TargetGroups'][0]
 
-        self.__ecs.create_service(
-            cluster=cluster_name,
-            serviceName=service_name,
-            taskDefinition=service_name,
-            loadBalancers=[
-                {
-                    'targetGroupArn': target_groups[0]['TargetGroupArn'],
-                    'containerName': parameters['containerDefinition']['name'],
-                    'containerPort': parameters['containerDefinition']['portMappings'][0]['containerPort']
-                }
-            ],
-            desiredCount=parameters['desiredCount'],
-            launchType='EC2'
+            if binding['conditions']:
+                target_group = self.__create_target_group(
+                    cluster_name=cluster_name,
+                    service_name=service_name,
+                    binding=binding,
+                    shared_target_group=shared_target_groups[scheme]
+                )
+            else:
+                target_group = shared_target_groups[scheme]
+
+            target_groups.append(target_group)
+            load_balancers.append({
+                'targetGroupArn': target_group['TargetGroupArn'],
+                'containerName': binding['containerName'],
+                'containerPort': binding['containerPort']
+            })
+
+        parameters_tags = [{'key': PARAMETERS_TAG, 'value': get_parameters_hash(parameters)}]
+        service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+        if service:
+            self.__record_deployment(service)
+            # auto-scaling owns the desired count of a running service, so a redeploy must not reset it
+            update_options = dict() if 'autoScaling' in parameters else {'desiredCount': parameters['desiredCount']}
+            self.__ecs.update_service(
+                cluster=cluster_name,
+                service=service_name,
+                taskDefinition=task_definition['taskDefinitionArn'],
+                loadBalancers=load_balancers,
+                **update_options,
+                **self.__get_update_options(launch_options)
+            )
+            self.__ecs.tag_resource(resourceArn=service['serviceArn'], tags=parameters_tags)
+        else:
+            self.__ecs.create_service(
+                cluster=cluster_name,
+                serviceName=service_name,
+                taskDefinition=service_name,
+                loadBalancers=load_balancers,
+                desiredCount=parameters['desiredCount'],
+                tags=parameters_tags,
+                **launch_options,
+                **self.__get_placement(parameters)
+            )
+
+        if 'autoScaling' in parameters:
+            self.__register_auto_scaling(
+                cluster_name=cluster_name,
+                service_name=service_name,
+                auto_scaling=parameters['autoScaling'],
+                target_group=target_groups[0] if target_groups else None
+            )
+
+    def blue_green_deploy(self, cluster_name, service_name, previous_service_name, region, parameters,
+                          traffic_steps=(10, 50, 100), bake_time=30, timeout=600):
+        """
+        Deploy a service next to its previous version and shift traffic from the listener rules of the previous
+        version to the new one in weighted steps (percent), checking the health of the new version after each
+        step. Afterwards the rules of the previous version and the previous version itself are removed. If the
+        new version does not become or stay healthy, all traffic is shifted back and the new version is deleted.
+        """
+        with self.__locker.lock(get_lock_name(cluster_name, service_name),
+                                get_lock_name(cluster_name, previous_service_name)):
+            self.__blue_green_deploy(cluster_name, service_name, previous_service_name, region, parameters,
+                                     traffic_steps, bake_time, timeout)
+
+    def __blue_green_deploy(self, cluster_name, service_name, previous_service_name, region, parameters,
+                            traffic_steps, bake_time, timeout):
+        previous_service = self.__get_service_description(
+            cluster_name=cluster_name,
+            service_name=previous_service_name
         )
+        if not previous_service:
+            raise Exception('Unknown service: [{0}]'.format(previous_service_name))
 
-    def delete(self, cluster_name, service_name):
+        shifts = list()
+        for load_balancer in previous_service.get('loadBalancers', []):
+            target_group = self.__elb.describe_target_groups(
+                TargetGroupArns=[load_balancer['targetGroupArn']]
+            )['TargetGroups'][0]
+            shifts.append((target_group, self.__get_forward_rules(target_group)))
+        if not shifts or not all(rules for _, rules in shifts):
+            raise Exception('Blue/green deployment requires path or host routing rules for service: [{0}]'.format(
+                previous_service_name))
+
+        # Rules of the new version are created behind the ones of the previous version and take over once those
+        # are removed; configured priorities are applied afterwards.
+        priorities = [binding.get('priority') for binding in parameters.get('loadBalancers', [])]
+        if 'loadBalancers' in parameters:
+            parameters = dict(parameters, loadBalancers=[
+                {key: value for key, value in binding.items() if key != 'priority'}
+                for binding in parameters['loadBalancers']
+            ])
+        self.deploy(cluster_name=cluster_name, service_name=service_name, region=region, parameters=parameters)
+
+        service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+        new_target_group_arns = [i['targetGroupArn'] for i in service['loadBalancers']]
+        if len(new_target_group_arns) != len(shifts):
+            self.delete(cluster_name=cluster_name, service_name=service_name)
+            raise Exception('Load balancer bindings of service [{0}] do not match [{1}]'.format(
+                service_name, previous_service_name))
+
+        weight = 0
+        try:
+            self.wait_healthy(cluster_name=cluster_name, service_name=service_name, timeout=timeout)
+            for weight in traffic_steps:
+                self.__shift_traffic(shifts, new_target_group_arns, weight)
+                self.__bake(cluster_name, service_name, bake_time)
+        except Exception:
+            if weight > 0:
+                self.__restore_traffic(shifts)
+            self.delete(cluster_name=cluster_name, service_name=service_name)
+            raise
+
+        priorities += [None] * (len(shifts) - len(priorities))
+        for (_, rules), new_target_group_arn, priority in zip(shifts, new_target_group_arns, priorities):
+            for rule in rules:
+                self.__elb.delete_rule(RuleArn=rule['RuleArn'])
+            if priority is not None:
+                new_target_group = self.__elb.describe_target_groups(
+                    TargetGroupArns=[new_target_group_arn]
+                )['TargetGroups'][0]
+                self.__elb.set_rule_priorities(RulePriorities=[
+                    {'RuleArn': rule['RuleArn'], 'Priority': priority}
+                    for rule in self.__get_forward_rules(new_target_group)
+                ])
+
+        self.delete(cluster_name=cluster_name, service_name=previous_service_name)
+
+    def __shift_traffic(self, shifts, new_target_group_arns, weight):
+        """
+        Forward the given share (percent) of the traffic of the rules of the previous version to the new version.
+        """
+        for (target_group, rules), new_target_group_arn in zip(shifts, new_target_group_arns):
+            for rule in rules:
+                self.__elb.modify_rule(
+                    RuleArn=rule['RuleArn'],
+                    Actions=[{
+                        'Type': 'forward',
+                        'ForwardConfig': {
+                            'TargetGroups': [
+                                {'TargetGroupArn': target_group['TargetGroupArn'], 'Weight': 100 - weight},
+                                {'TargetGroupArn': new_target_group_arn, 'Weight': weight}
+                            ]
+                        }
+                    }]
+                )
+
+    def __restore_traffic(self, shifts):
         """
-        Delete
+        Forward all traffic of the rules of the previous version to it again. The rules no longer refer to the new
+        version, so deleting the new version keeps them.
         """
-        service_description = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
-        if not service_description:
+        for target_group, rules in shifts:
+            for rule in rules:
+                self.__elb.modify_rule(
+                    RuleArn=rule['RuleArn'],
+                    Actions=[{'Type': 'forward', 'TargetGroupArn': target_group['TargetGroupArn']}]
+                )
+
+    def __bake(self, cluster_name, service_name, bake_time):
+        """
+        Check the health of a service every few seconds for 'bake_time' seconds, failing as soon as it is unhealthy.
+        """
+        deadline = time.time() + bake_time
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(BAKE_INTERVAL, remaining))
+            self.wait_healthy(cluster_name=cluster_name, service_name=service_name, timeout=0)
+
+    def rollback(self, cluster_name, service_name):
+        """
+        Roll a service back to the task definition and desired count recorded before its last update.
+        """
+        with self.__locker.lock(get_lock_name(cluster_name, service_name)):
+            self.__rollback(cluster_name, service_name)
+
+    def __rollback(self, cluster_name, service_name):
+        service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+        if not service:
             raise Exception('Unknown service: [{0}]'.format(service_name))
 
+        tags = self.__ecs.list_tags_for_resource(resourceArn=service['serviceArn'])['tags']
+        previous = {tag['key']: tag['value'] for tag in tags}
+        if PREVIOUS_TASK_DEFINITION_TAG not in previous:
+            raise Exception('No previous deployment recorded for service: [{0}]'.format(service_name))
+
+        self.__record_deployment(service)
         self.__ecs.update_service(
             cluster=cluster_name,
             service=service_name,
-            desiredCount=0
+            taskDefinition=previous[PREVIOUS_TASK_DEFINITION_TAG],
+            desiredCount=int(previous[PREVIOUS_DESIRED_COUNT_TAG])
         )
+        # The service no longer matches its parameters, the next apply deploys them again.
+        self.__ecs.untag_resource(resourceArn=service['serviceArn'], tagKeys=[PARAMETERS_TAG])
 
-        running_count = 1
-        while running_count > 0:
-            service_description = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
-            running_count = service_description['runningCount']
-            time.sleep(1)
+    def scale(self, cluster_name, service_name, desired_count):
+        """
+        Set the desired count of a service: absolute (3) or relative to its current desired count ('+2', '-1').
+        Services registered with Application Auto Scaling are kept within its minimum and maximum capacity, which
+        it would restore otherwise. Returns the new desired count.
+        """
+        return self.__scale(cluster_name, service_name, desired_count)[1]
 
-        self.__ecs.delete_service(
-            cluster=cluster_name,
-            service=service_name
-        )
+    def __scale(self, cluster_name, service_name, count):
+        """
+        Scale a service and get its previous and new desired count. The current desired count is read under the
+        lock of the service, so concurrent changes are not overwritten with an outdated relative count.
+        """
+        with self.__locker.lock(get_lock_name(cluster_name, service_name)):
+            service = next((i for i in self.__describe_services(cluster_name, [service_name])
+                            if i['status'] == 'ACTIVE'), None)
+            if not service:
+                raise Exception('Unknown service: [{0}]'.format(service_name))
+            desired_count = get_desired_count(service['desiredCount'], count)
+
+            scalable_targets = self.__autoscaling.describe_scalable_targets(
+                ServiceNamespace='ecs',
+                ResourceIds=['service/' + cluster_name + '/' + service_name],
+                ScalableDimension='ecs:service:DesiredCount'
+            )['ScalableTargets']
+            if scalable_targets:
+                capacity = (scalable_targets[0]['MinCapacity'], scalable_targets[0]['MaxCapacity'])
+                if not capacity[0] <= desired_count <= capacity[1]:
+                    print('Desired count {0} of service [{1}] limited to its auto-scaling capacity {2}-{3}'.format(
+                        desired_count, service_name, capacity[0], capacity[1]))
+                    desired_count = min(max(desired_count, capacity[0]), capacity[1])
+
+            self.__ecs.update_service(
+                cluster=cluster_name,
+                service=service_name,
+                desiredCount=desired_count
+            )
+            return service['desiredCount'], desired_count
+
+    def scale_services(self, cluster_name, patterns, count, max_workers=10, wait=False, timeout=600):
+        """
+        Scale the services of a cluster matching any of the patterns (service names or globs, e.g. 'api-*') to
+        count: absolute ('5') or relative to the current desired count ('+2', '-1'). Services are updated
+        concurrently; with 'wait', until all of them run their new desired count, polled together.
+        """
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+        services = [i['serviceName'] for i in self.__describe_services(cluster_name, service_arns)
+                    if i['status'] == 'ACTIVE']
+
+        service_names = set()
+        for pattern in patterns:
+            matches = fnmatch.filter(services, pattern)
+            if not matches:
+                raise Exception('No service matches [{0}]'.format(pattern))
+            service_names.update(matches)
+        # Fail on an invalid count before any service is scaled.
+        get_desired_count(0, count)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {service_name: executor.submit(self.__scale, cluster_name, service_name, count)
+                       for service_name in service_names}
+
+        rows = list()
+        failed = list()
+        desired_counts = dict()
+        for service_name in sorted(service_names):
+            error = futures[service_name].exception()
+            if error is not None:
+                failed.append(service_name)
+                rows.append({'service_name': service_name, 'desired_count': '', 'error': str(error)})
+                continue
+            previous_count, desired_counts[service_name] = futures[service_name].result()
+            rows.append({'service_name': service_name,
+                         'desired_count': '{0} -> {1}'.format(previous_count, desired_counts[service_name]),
+                         'error': ''})
+        clickclick.console.print_table(['service_name', 'desired_count', 'error'], rows, styles=STYLES,
+                                       titles=TITLES)
+        if failed:
+            raise Exception('Scaling services failed: [{0}]'.format(', '.join(failed)))
+
+        # Nothing is scaled in a dry run.
+        if wait and self.__recorder is None:
+            self.__wait_for_counts(cluster_name, desired_counts, timeout)
+
+        return desired_counts
+
+    def __wait_for_counts(self, cluster_name, desired_counts, timeout, interval=5):
+        """
+        Wait until services run their desired counts (no pending tasks), describing all of them per poll.
+        """
+        deadline = time.time() + timeout
+        waiting = sorted(desired_counts)
+        while True:
+            waiting = [i['serviceName'] for i in self.__describe_services(cluster_name, waiting)
+                       if i['runningCount'] != desired_counts[i['serviceName']] or i['pendingCount'] > 0]
+            if not waiting:
+                return
+            if time.time() >= deadline:
+                raise Exception('Services did not reach their desired count within {0}s: [{1}]'.format(
+                    timeout, ', '.join(waiting)))
+            print('Waiting for {0} services to reach their desired count'.format(len(waiting)))
+            time.sleep(interval)
+
+    def delete(self, cluster_name, service_name, resume=False):
+        """
+        Delete a service: scale it down, wait until its tasks are stopped, delete it and its target groups. With
+        resume, the steps an interrupted delete completed are skipped.
+        """
+        with self.__locker.lock(get_lock_name(cluster_name, service_name)):
+            self.__delete(cluster_name, service_name, resume)
+
+    def __delete(self, cluster_name, service_name, resume):
+        operation = self.__journal.operation('service-delete/{0}/{1}'.format(cluster_name, service_name),
+                                             resume=resume)
+
+        if not operation.done('describe'):
+            service_description = self.__get_service_description(cluster_name=cluster_name,
+                                                                 service_name=service_name)
+            if not service_description:
+                raise Exception('Unknown service: [{0}]'.format(service_name))
+            # The target groups are recorded, the service description is gone once the service is deleted.
+            operation.complete('describe', {
+                'targetGroupArns': [i['targetGroupArn'] for i in service_description.get('loadBalancers', [])]
+            })
+
+        if not operation.done('deregister-auto-scaling'):
+            self.__deregister_auto_scaling(cluster_name=cluster_name, service_name=service_name)
+            operation.complete('deregister-auto-scaling')
+
+        if not operation.done('scale-down'):
+            self.__ecs.update_service(
+                cluster=cluster_name,
+                service=service_name,
+                desiredCount=0
+            )
+            operation.complete('scale-down')
+
+        if not operation.done('drain'):
+            # Nothing is scaled down in a dry run.
+            running_count = 0 if self.__recorder is not None else 1
+            while running_count > 0:
+                service_description = self.__get_service_description(cluster_name=cluster_name,
+                                                                     service_name=service_name)
+                running_count = service_description['runningCount']
+                time.sleep(1)
+            operation.complete('drain')
+
+        if not operation.done('delete-service'):
+            self.__ecs.delete_service(
+                cluster=cluster_name,
+                service=service_name
+            )
+            operation.complete('delete-service')
+
+        for target_group_arn in operation.data('describe')['targetGroupArns']:
+            step = 'delete-target-group/' + target_group_arn
+            if not operation.done(step):
+                self.__delete_target_group(cluster_name=cluster_name, target_group_arn=target_group_arn)
+                operation.complete(step)
+
+        operation.finish()
 
     def list(self, cluster_name):
         """
@@ -101,30 +528,863 @@ class ServiceController(metaclass=ABCMeta):
         columns = ['service_name', 'status', 'tasks']
         clickclick.console.print_table(columns, rows, styles=STYLES, titles=TITLES)
 
-    def __get_service_description(self, cluster_name, service_name):
+    def events(self, cluster_name, service_name, since=None, follow=False, interval=5):
+        """
+        Print service events and reasons of stopped tasks in chronological order. Only events newer than the
+        cursor (initially 'since') are printed and stopped tasks are only described once. With 'follow', keep
+        polling every 'interval' seconds.
+        """
+        cursor = since
+        seen_task_arns = set()
+
+        while True:
+            service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+            if not service:
+                raise Exception('Unknown service: [{0}]'.format(service_name))
+
+            new_events = [(event['createdAt'], event['message']) for event in service.get('events', [])
+                          if cursor is None or event['createdAt'] > cursor]
+
+            task_arns = list()
+            for page in self.__ecs.get_paginator('list_tasks').paginate(
+                    cluster=cluster_name, serviceName=service_name, desiredStatus='STOPPED'):
+                task_arns.extend(i for i in page['taskArns'] if i not in seen_task_arns)
+
+            for i in range(0, len(task_arns), 100):
+                for task in self.__ecs.describe_tasks(cluster=cluster_name, tasks=task_arns[i:i + 100])['tasks']:
+                    # Tasks still stopping have no final reason and exit codes yet, they are described once stopped.
+                    if task.get('lastStatus') != 'STOPPED':
+                        continue
+                    seen_task_arns.add(task['taskArn'])
+                    stopped_at = task.get('stoppedAt') or task.get('stoppingAt')
+                    if stopped_at is None or (since is not None and stopped_at <= since):
+                        continue
+                    new_events.append((stopped_at, get_stopped_task_message(task)))
+
+            new_events.sort(key=lambda x: x[0])
+            for timestamp, message in new_events:
+                print('{0} {1}'.format(timestamp.isoformat(), message))
+            if new_events:
+                cursor = new_events[-1][0]
+
+            if not follow:
+                return
+            time.sleep(interval)
+
+    def logs(self, cluster_name, service_name, since=None, follow=False, interval=5, limit=1000, max_workers=10):
+        """
+        Print CloudWatch Logs of all running tasks of a service merged in timestamp order. Log events of the tasks
+        are fetched concurrently, at most 'limit' events per log stream and poll. With 'follow', keep polling every
+        'interval' seconds for newer events, each log stream from its last printed event on. 'since' defaults to
+        ten minutes ago.
+        """
+        service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+        if not service:
+            raise Exception('Unknown service: [{0}]'.format(service_name))
+
+        task_definition = self.__ecs.describe_task_definition(
+            taskDefinition=service['taskDefinition']
+        )['taskDefinition']
+        log_options = list()
+        for container in task_definition['containerDefinitions']:
+            if container.get('logConfiguration', {}).get('logDriver') != 'awslogs':
+                continue
+            options = container['logConfiguration'].get('options', {})
+            # Without a stream prefix, log streams are named after Docker container IDs, not after the task.
+            if 'awslogs-stream-prefix' not in options:
+                print('WARNING: Skipping logs of container [{0}] without awslogs-stream-prefix'.format(
+                    container['name']))
+                continue
+            log_options.append((container['name'], options))
+        if not log_options:
+            raise Exception('No CloudWatch Logs configuration for service: [{0}]'.format(service_name))
+
+        since = since or datetime.now(timezone.utc) - timedelta(minutes=10)
+        start_times = dict()
+        seen_event_ids = set()
+        seen_event_order = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                task_ids = [task_arn.split('/')[-1] for task_arn in self.__get_task_arns(
+                    cluster_name, service_name, desired_status='RUNNING')]
+
+                streams = [(options['awslogs-group'], options['awslogs-stream-prefix'] + '/' + container_name + '/' +
+                            task_id) for task_id in task_ids for container_name, options in log_options]
+                # A log stream with more than 'limit' new events continues from its own last event on the next
+                # poll, streams of stopped tasks are dropped.
+                start_times = {stream: start_times.get(stream, int(since.timestamp() * 1000)) for stream in streams}
+
+                results = list(executor.map(lambda stream: self.__filter_log_events(
+                    stream[0], [stream[1]], start_times[stream], limit), streams))
+                for stream, events in zip(streams, results):
+                    if events:
+                        start_times[stream] = max(start_times[stream], events[-1]['timestamp'])
+
+                for event in heapq.merge(*results, key=lambda x: x['timestamp']):
+                    if event['eventId'] in seen_event_ids:
+                        continue
+                    seen_event_ids.add(event['eventId'])
+                    seen_event_order.append(event['eventId'])
+                    if len(seen_event_order) > limit * 10:
+                        seen_event_ids.discard(seen_event_order.popleft())
+
+                    timestamp = datetime.fromtimestamp(event['timestamp'] / 1000, timezone.utc)
+                    _, container_name, task_id = event['logStreamName'].rsplit('/', 2)
+                    print('{0} {1}/{2} {3}'.format(timestamp.isoformat(), task_id[:8], container_name,
+                                                   event['message'].rstrip('\n')))
+
+                if not follow:
+                    return
+                time.sleep(interval)
+
+    def __filter_log_events(self, log_group_name, log_stream_names, start_time, limit):
+        """
+        Get up to 'limit' log events of the given log streams from 'start_time' on, sorted by timestamp.
+        """
+        events = list()
+        paginator = self.__logs.get_paginator('filter_log_events')
+        for page in paginator.paginate(logGroupName=log_group_name, logStreamNames=log_stream_names,
+                                       startTime=start_time, PaginationConfig={'MaxItems': limit}):
+            events.extend(page['events'])
+        events.sort(key=lambda x: x['timestamp'])
+        return events
+
+    def wait_healthy(self, cluster_name, service_name, timeout=600, healthy_share=1.0, max_failed_tasks=3):
+        """
+        Wait until the given share of the desired tasks of the primary deployment of a service is running and
+        healthy in all of its target groups. Polls with exponential backoff and fails fast when tasks of the
+        primary deployment keep stopping (crash loop) or the deployment failed.
+        """
+        if self.__recorder is not None:
+            # Nothing is deployed in a dry run.
+            return
+
+        deadline = time.time() + timeout
+        delay = 2
+
+        while True:
+            service = self.__get_service_description(cluster_name=cluster_name, service_name=service_name)
+            if not service:
+                raise Exception('Unknown service: [{0}]'.format(service_name))
+
+            primary = next(i for i in service['deployments'] if i['status'] == 'PRIMARY')
+            if primary.get('rolloutState') == 'FAILED':
+                raise Exception('Deployment of service [{0}] failed: {1}'.format(
+                    service_name, primary.get('rolloutStateReason', '')))
+
+            stopped_tasks = [i for i in self.__get_tasks(cluster_name, service_name, desired_status='STOPPED')
+                             if is_failed_task(i, primary)]
+            if len(stopped_tasks) >= max_failed_tasks:
+                reasons = sorted(set(i.get('stoppedReason', 'unknown') for i in stopped_tasks))
+                raise Exception('Tasks of service [{0}] keep stopping: {1}'.format(service_name, '; '.join(reasons)))
+
+            required = math.ceil(primary['desiredCount'] * healthy_share)
+            healthy = self.__count_healthy_tasks(cluster_name, service, primary)
+            if healthy >= required:
+                return
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise Exception('Timeout waiting for service [{0}] to become healthy ({1}/{2} tasks healthy)'.format(
+                    service_name, healthy, required))
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 15)
+
+    def __count_healthy_tasks(self, cluster_name, service, deployment):
+        """
+        Count running tasks of a deployment, whose targets are healthy in all target groups of the service.
+        """
+        tasks = [i for i in self.__get_tasks(cluster_name, service['serviceName'], desired_status='RUNNING')
+                 if i['taskDefinitionArn'] == deployment['taskDefinition'] and i['lastStatus'] == 'RUNNING']
+
+        load_balancers = service.get('loadBalancers', [])
+        if not load_balancers:
+            return len([i for i in tasks if i.get('healthStatus') != 'UNHEALTHY'])
+
+        container_instance_arns = list(set(i['containerInstanceArn'] for i in tasks if 'containerInstanceArn' in i))
+        instance_ids = dict()
+        if container_instance_arns:
+            for container_instance in self.__ecs.describe_container_instances(
+                    cluster=cluster_name,
+                    containerInstances=container_instance_arns)['containerInstances']:
+                instance_ids[container_instance['containerInstanceArn']] = container_instance['ec2InstanceId']
+
+        target_states = dict()
+        for load_balancer in load_balancers:
+            for description in self.__elb.describe_target_health(
+                    TargetGroupArn=load_balancer['targetGroupArn'])['TargetHealthDescriptions']:
+                target = description['Target']
+                target_states[(load_balancer['targetGroupArn'], target['Id'], target.get('Port'))] = \
+                    description['TargetHealth']['State']
+
+        healthy = 0
+        for task in tasks:
+            targets = list()
+            for load_balancer in load_balancers:
+                for container in task.get('containers', []):
+                    if container['name'] != load_balancer['containerName']:
+                        continue
+                    for network_binding in container.get('networkBindings', []):
+                        if network_binding['containerPort'] == load_balancer['containerPort']:
+                            targets.append((load_balancer['targetGroupArn'],
+                                            instance_ids.get(task.get('containerInstanceArn')),
+                                            network_binding['hostPort']))
+                    for network_interface in container.get('networkInterfaces', []):
+                        targets.append((load_balancer['targetGroupArn'], network_interface['privateIpv4Address'],
+                                        load_balancer['containerPort']))
+            if targets and all(target_states.get(target) == 'healthy' for target in targets):
+                healthy += 1
+
+        return healthy
+
+    def __get_task_arns(self, cluster_name, service_name, desired_status):
+        """
+        Get ARNs of all tasks of a service with the given desired status.
+        """
+        task_arns = list()
+        paginator = self.__ecs.get_paginator('list_tasks')
+        for page in paginator.paginate(cluster=cluster_name, serviceName=service_name, desiredStatus=desired_status):
+            task_arns.extend(page['taskArns'])
+        return task_arns
+
+    def __get_tasks(self, cluster_name, service_name, desired_status):
+        """
+        Get descriptions of all tasks of a service with the given desired status.
+        """
+        task_arns = self.__get_task_arns(cluster_name, service_name, desired_status)
+
+        tasks = list()
+        for i in range(0, len(task_arns), 100):
+            tasks.extend(self.__ecs.describe_tasks(cluster=cluster_name, tasks=task_arns[i:i + 100])['tasks'])
+        return tasks
+
+    def __pin_images(self, container_definitions):
+        """
+        Replace tags of ECR images by their digests, so every task of the deployment runs the same image.
+        """
+        pinned = self.__image_resolver.resolve([i['image'] for i in container_definitions if 'image' in i])
+        return [dict(i, image=pinned[i['image']]) if 'image' in i else i for i in container_definitions]
+
+    def __pre_pull_images(self, cluster_name, images, timeout=PRE_PULL_TIMEOUT):
         """
-        Get description of a service in a cluster.
+        Pull images on all container instances of a cluster (with SSM Run Command) before the rollout, so the new
+        tasks start from cached images. The instances need the SSM agent, an instance role allowing SSM and the AWS
+        CLI (to log in to ECR). Instances that failed or did not finish are reported, but do not stop the deployment.
         """
-        services = self.__ecs.list_services(cluster=cluster_name)
-        if len(services['serviceArns']) > 0:
-            services_with_description = self.__ecs.describe_services(
+        instance_ids = self.__get_container_instance_ids(cluster_name)
+        if not instance_ids or not images:
+            return
+
+        commands = ['aws ecr get-login-password --region {0} | docker login --username AWS --password-stdin {1}'.format(
+            region, registry) for registry, region in get_ecr_registries(images)]
+        commands.extend('docker pull ' + image for image in images)
+
+        command_ids = list()
+        for i in range(0, len(instance_ids), 50):
+            command_ids.append(self.__ssm.send_command(
+                InstanceIds=instance_ids[i:i + 50],
+                DocumentName='AWS-RunShellScript',
+                Parameters={'commands': commands},
+                TimeoutSeconds=timeout,
+                Comment='cloudcrane pre-pull for cluster ' + cluster_name
+            )['Command']['CommandId'])
+
+        # Nothing is pulled in a dry run.
+        if self.__recorder is not None:
+            return
+
+        deadline = time.time() + timeout
+        pending = list(command_ids)
+        while pending and time.time() < deadline:
+            time.sleep(5)
+            for command_id in list(pending):
+                command = self.__ssm.list_commands(CommandId=command_id)['Commands'][0]
+                if command['Status'] not in PENDING_COMMAND_STATUSES:
+                    pending.remove(command_id)
+
+        if pending:
+            print('WARNING: Pre-pulling images did not finish within {0}s'.format(timeout))
+        # Error counts miss instances that timed out or were not reachable, only 'Success' means the images are there.
+        failed = list()
+        for command_id in command_ids:
+            for page in self.__ssm.get_paginator('list_command_invocations').paginate(CommandId=command_id):
+                failed.extend('{0} ({1})'.format(i['InstanceId'], i['Status']) for i in page['CommandInvocations']
+                              if i['Status'] != 'Success')
+        if failed:
+            print('WARNING: Pre-pulling images did not succeed on {0} container instances: {1}'.format(
+                len(failed), ', '.join(failed)))
+
+    def __get_container_instance_ids(self, cluster_name):
+        """
+        Get the EC2 instance IDs of the active container instances of a cluster.
+        """
+        container_instance_arns = list()
+        for page in self.__ecs.get_paginator('list_container_instances').paginate(cluster=cluster_name,
+                                                                                  status='ACTIVE'):
+            container_instance_arns.extend(page['containerInstanceArns'])
+
+        instance_ids = list()
+        for i in range(0, len(container_instance_arns), 100):
+            instance_ids.extend(instance['ec2InstanceId'] for instance in self.__ecs.describe_container_instances(
                 cluster=cluster_name,
-                services=services['serviceArns']
+                containerInstances=container_instance_arns[i:i + 100]
+            )['containerInstances'])
+        return instance_ids
+
+    def __configure_logging(self, cluster_name, service_name, region, parameters, container_definitions):
+        """
+        Send the output of all containers without a log configuration to CloudWatch Logs (awslogs driver), into
+        the log group of the cluster with the service name as stream prefix. The log group is created if needed.
+        """
+        if not any('logConfiguration' not in container for container in container_definitions):
+            return container_definitions
+
+        log_group_name = get_log_group_name(cluster_name)
+        try:
+            self.__logs.create_log_group(logGroupName=log_group_name)
+        except self.__logs.exceptions.ResourceAlreadyExistsException:
+            pass
+        # Applied on every deployment, so changing the retention also applies to existing log groups.
+        if 'logRetentionDays' in parameters:
+            self.__logs.put_retention_policy(
+                logGroupName=log_group_name,
+                retentionInDays=parameters['logRetentionDays']
             )
-            return next(i for i in services_with_description['services'] if i['serviceName'] == service_name)
-        else:
-            return None
+
+        log_configuration = {
+            'logDriver': 'awslogs',
+            'options': {
+                'awslogs-group': log_group_name,
+                'awslogs-region': region,
+                'awslogs-stream-prefix': service_name
+            }
+        }
+        return [container if 'logConfiguration' in container else dict(container, logConfiguration=log_configuration)
+                for container in container_definitions]
+
+    def __record_deployment(self, service):
+        """
+        Record task definition and desired count of a service as tags on the service, so it can be rolled back.
+        """
+        self.__ecs.tag_resource(
+            resourceArn=service['serviceArn'],
+            tags=[
+                {'key': PREVIOUS_TASK_DEFINITION_TAG, 'value': service['taskDefinition']},
+                {'key': PREVIOUS_DESIRED_COUNT_TAG, 'value': str(service['desiredCount'])}
+            ]
+        )
+
+    def __create_target_group(self, cluster_name, service_name, binding, shared_target_group):
+        """
+        Create the dedicated target group of a load balancer binding and route requests matching the conditions
+        of the binding to it on all listeners of the load balancer. Existing target groups and rules are reused,
+        settings of existing target groups are updated.
+        """
+        name = get_target_group_name(cluster_name, service_name, binding)
+        health_check = {TARGET_GROUP_SETTINGS[key]: value for key, value in binding['targetGroup'].items()
+                        if key in TARGET_GROUP_SETTINGS}
+
+        try:
+            target_group = self.__elb.create_target_group(
+                Name=name,
+                Protocol='HTTP',
+                Port=binding['containerPort'],
+                VpcId=shared_target_group['VpcId'],
+                TargetType=binding['targetType'],
+                Tags=[
+                    {'Key': 'cloudcrane:cluster', 'Value': cluster_name},
+                    {'Key': 'cloudcrane:service', 'Value': service_name}
+                ],
+                **health_check
+            )['TargetGroups'][0]
+            settings = {key: value for key, value in binding['targetGroup'].items() if key in TARGET_GROUP_ATTRIBUTES}
+        except self.__elb.exceptions.DuplicateTargetGroupNameException:
+            # Creating a target group is only idempotent for the same settings, e.g. not for a new health check path.
+            target_group = self.__elb.describe_target_groups(Names=[name])['TargetGroups'][0]
+            settings = binding['targetGroup']
+        if settings:
+            self.__configure_target_group(target_group['TargetGroupArn'], settings)
+
+        load_balancer_arn = shared_target_group['LoadBalancerArns'][0]
+        listeners = self.__elb.describe_listeners(LoadBalancerArn=load_balancer_arn)['Listeners']
+        for listener in listeners:
+            rules = self.__elb.describe_rules(ListenerArn=listener['ListenerArn'])['Rules']
+            if any(target_group['TargetGroupArn'] in get_forward_target_group_arns(rule) for rule in rules):
+                continue
+
+            priority = binding['priority']
+            if priority is None:
+                priority = max([int(rule['Priority']) for rule in rules if rule['Priority'] != 'default'] + [0]) + 1
+
+            for attempt in range(RULE_PRIORITY_ATTEMPTS):
+                try:
+                    self.__elb.create_rule(
+                        ListenerArn=listener['ListenerArn'],
+                        Conditions=binding['conditions'],
+                        Priority=priority,
+                        Actions=[{'Type': 'forward', 'TargetGroupArn': target_group['TargetGroupArn']}]
+                    )
+                    break
+                except self.__elb.exceptions.PriorityInUseException:
+                    # Another deployment took the free priority since the rules were read.
+                    if binding['priority'] is not None or attempt == RULE_PRIORITY_ATTEMPTS - 1:
+                        raise
+                    priority += 1
+
+        return dict(target_group, LoadBalancerArns=[load_balancer_arn])
+
+    def __delete_target_group(self, cluster_name, target_group_arn):
+        """
+        Delete a dedicated target group of a service including all listener rules forwarding only to it.
+        Shared target groups of the cluster are kept.
+        """
+        target_group = self.__elb.describe_target_groups(TargetGroupArns=[target_group_arn])['TargetGroups'][0]
+        if target_group['TargetGroupName'] in [cluster_name + '-' + scheme + '-tg' for scheme in SCHEMES]:
+            return
+
+        for rule in self.__get_forward_rules(target_group):
+            # Rules also forwarding to other target groups (e.g. while shifting traffic) route for other services.
+            if set(get_forward_target_group_arns(rule)) == {target_group_arn}:
+                self.__elb.delete_rule(RuleArn=rule['RuleArn'])
+
+        self.__elb.delete_target_group(TargetGroupArn=target_group_arn)
+
+    def __get_forward_rules(self, target_group):
+        """
+        Get all non-default listener rules forwarding to a target group.
+        """
+        rules = list()
+        for load_balancer_arn in target_group.get('LoadBalancerArns', []):
+            for listener in self.__elb.describe_listeners(LoadBalancerArn=load_balancer_arn)['Listeners']:
+                for rule in self.__elb.describe_rules(ListenerArn=listener['ListenerArn'])['Rules']:
+                    if not rule['IsDefault'] and target_group['TargetGroupArn'] in get_forward_target_group_arns(rule):
+                        rules.append(rule)
+        return rules
+
+    def __configure_target_group(self, target_group_arn, settings):
+        """
+        Apply health check settings and attributes (e.g. deregistration delay) of a service to a target group.
+        """
+        health_check = {TARGET_GROUP_SETTINGS[key]: value for key, value in settings.items()
+                        if key in TARGET_GROUP_SETTINGS}
+        if health_check:
+            self.__elb.modify_target_group(TargetGroupArn=target_group_arn, **health_check)
+
+        attributes = [{'Key': TARGET_GROUP_ATTRIBUTES[key], 'Value': str(value)} for key, value in settings.items()
+                      if key in TARGET_GROUP_ATTRIBUTES]
+        if attributes:
+            self.__elb.modify_target_group_attributes(TargetGroupArn=target_group_arn, Attributes=attributes)
+
+    def __register_auto_scaling(self, cluster_name, service_name, auto_scaling, target_group):
+        """
+        Register the service as scalable target of Application Auto Scaling with target tracking policies
+        on CPU, memory and ALB requests per target.
+        """
+        resource_id = 'service/' + cluster_name + '/' + service_name
+
+        self.__autoscaling.register_scalable_target(
+            ServiceNamespace='ecs',
+            ResourceId=resource_id,
+            ScalableDimension='ecs:service:DesiredCount',
+            MinCapacity=auto_scaling['minCount'],
+            MaxCapacity=auto_scaling['maxCount']
+        )
+
+        policies = list()
+        if 'cpuTarget' in auto_scaling:
+            policies.append(('cpu', auto_scaling['cpuTarget'], {
+                'PredefinedMetricType': 'ECSServiceAverageCPUUtilization'
+            }))
+        if 'memoryTarget' in auto_scaling:
+            policies.append(('memory', auto_scaling['memoryTarget'], {
+                'PredefinedMetricType': 'ECSServiceAverageMemoryUtilization'
+            }))
+        if 'requestsPerTarget' in auto_scaling:
+            if not target_group:
+                raise Exception('Scaling on requests per target requires a load balancer: [{0}]'.format(service_name))
+            policies.append(('requests', auto_scaling['requestsPerTarget'], {
+                'PredefinedMetricType': 'ALBRequestCountPerTarget',
+                'ResourceLabel': self.__get_resource_label(target_group)
+            }))
+
+        for suffix, target_value, metric in policies:
+            self.__autoscaling.put_scaling_policy(
+                PolicyName=service_name + '-' + suffix,
+                ServiceNamespace='ecs',
+                ResourceId=resource_id,
+                ScalableDimension='ecs:service:DesiredCount',
+                PolicyType='TargetTrackingScaling',
+                TargetTrackingScalingPolicyConfiguration={
+                    'TargetValue': float(target_value),
+                    'PredefinedMetricSpecification': metric,
+                    'ScaleInCooldown': auto_scaling.get('scaleInCooldown', 300),
+                    'ScaleOutCooldown': auto_scaling.get('scaleOutCooldown', 60)
+                }
+            )
+
+    def __deregister_auto_scaling(self, cluster_name, service_name):
+        """
+        Deregister the service from Application Auto Scaling (including its scaling policies), if registered.
+        """
+        resource_id = 'service/' + cluster_name + '/' + service_name
+
+        scalable_targets = self.__autoscaling.describe_scalable_targets(
+            ServiceNamespace='ecs',
+            ResourceIds=[resource_id],
+            ScalableDimension='ecs:service:DesiredCount'
+        )['ScalableTargets']
+
+        if scalable_targets:
+            self.__autoscaling.deregister_scalable_target(
+                ServiceNamespace='ecs',
+                ResourceId=resource_id,
+                ScalableDimension='ecs:service:DesiredCount'
+            )
+
+    @staticmethod
+    def __get_resource_label(target_group):
+        """
+        Get the resource label (app/<alb>/<id>/targetgroup/<tg>/<id>) of a target group for ALB request metrics.
+        """
+        load_balancer_arn = target_group['LoadBalancerArns'][0]
+        return load_balancer_arn.split(':loadbalancer/')[1] + '/' + target_group['TargetGroupArn'].split(':')[-1]
+
+    def __get_service_description(self, cluster_name, service_name):
+        """
+        Get description of an active service in a cluster, None if there is none (deleted services stay INACTIVE
+        for a while).
+        """
+        return next((i for i in self.__describe_services(cluster_name, [service_name])
+                     if i['serviceName'] == service_name and i['status'] == 'ACTIVE'), None)
+
+    def __describe_services(self, cluster_name, services):
+        """
+        Describe services (names or ARNs) of a cluster in batches of 10.
+        """
+        descriptions = list()
+        for i in range(0, len(services), 10):
+            descriptions.extend(self.__ecs.describe_services(
+                cluster=cluster_name,
+                services=services[i:i + 10]
+            )['services'])
+        return descriptions
 
     def __get_services_in_cluster(self, cluster_name):
         """
         Get services with description of a given cluster.
         """
-        services = self.__ecs.list_services(cluster=cluster_name)
-        if len(services['serviceArns']) > 0:
-            services_with_description = self.__ecs.describe_services(
-                cluster=cluster_name,
-                services=services['serviceArns']
-            )
-            return services_with_description['services']
+        service_arns = list()
+        for page in self.__ecs.get_paginator('list_services').paginate(cluster=cluster_name):
+            service_arns.extend(page['serviceArns'])
+        return self.__describe_services(cluster_name, service_arns)
+
+    @staticmethod
+    def __get_container_definitions(parameters):
+        """
+        Get container definitions of a service. Parameters contain either a list of container definitions
+        ('containerDefinitions') or a single one ('containerDefinition').
+        """
+        if 'containerDefinitions' in parameters:
+            container_definitions = list(parameters['containerDefinitions'])
         else:
-            return []
+            container_definitions = [parameters['containerDefinition']]
+
+        if not container_definitions:
+            raise Exception('No container definitions in parameters')
+
+        if get_network_mode(parameters) == 'awsvpc':
+            # Tasks get their own network interface, host ports are always the container ports.
+            container_definitions = [
+                dict(container, portMappings=[
+                    {key: value for key, value in port_mapping.items() if key != 'hostPort'}
+                    for port_mapping in container.get('portMappings', [])
+                ]) for container in container_definitions
+            ]
+        elif parameters.get('dynamicHostPorts'):
+            container_definitions = [
+                dict(container, portMappings=[
+                    dict(port_mapping, hostPort=0) for port_mapping in container.get('portMappings', [])
+                ]) for container in container_definitions
+            ]
+
+        return container_definitions
+
+    @staticmethod
+    def __get_load_balancer_bindings(parameters, container_definitions):
+        """
+        Get the load balancer bindings (scheme, container name and port) of a service. Parameters contain either
+        a list of bindings ('loadBalancers') or the scheme of a single load balancer ('loadBalancer'), which is bound
+        to the first port of the first container. Container name and port of a binding default to the first
+        container and its first port mapping respectively. Bindings with a path or host pattern get listener rule
+        conditions; the service then gets a dedicated target group instead of the shared one of the scheme.
+        Target group settings ('targetGroup') of a binding are merged on top of the service-wide ones and only
+        apply to dedicated target groups.
+        Tasks in awsvpc network mode are registered by IP address, so their bindings need a path or host pattern.
+        """
+        if 'loadBalancers' in parameters:
+            bindings = parameters['loadBalancers']
+        elif 'loadBalancer' in parameters:
+            bindings = [{'loadBalancer': parameters['loadBalancer']}]
+        else:
+            bindings = []
+
+        containers = {container['name']: container for container in container_definitions}
+        target_type = 'ip' if get_network_mode(parameters) == 'awsvpc' else 'instance'
+
+        result = list()
+        for binding in bindings:
+            container_name = binding.get('containerName', container_definitions[0]['name'])
+            if container_name not in containers:
+                raise Exception('Unknown container in load balancer binding: [{0}]'.format(container_name))
+
+            container_port = binding.get('containerPort')
+            if container_port is None:
+                container_port = containers[container_name]['portMappings'][0]['containerPort']
+
+            target_group = dict(parameters.get('targetGroup', {}))
+            target_group.update(binding.get('targetGroup', {}))
+            for key in target_group:
+                if key not in TARGET_GROUP_SETTINGS and key not in TARGET_GROUP_ATTRIBUTES:
+                    raise Exception('Unknown target group setting: [{0}]'.format(key))
+
+            conditions = list()
+            for key, field, config in [('path', 'path-pattern', 'PathPatternConfig'),
+                                       ('host', 'host-header', 'HostHeaderConfig')]:
+                values = binding.get(key)
+                if isinstance(values, str):
+                    values = [values]
+                if values:
+                    conditions.append({'Field': field, config: {'Values': values}})
+            if target_type == 'ip' and not conditions:
+                raise Exception('Load balancer bindings in awsvpc network mode require a path or host pattern')
+            # The shared target group of the scheme serves all services of the cluster without a pattern.
+            if target_group and not conditions:
+                raise Exception('Target group settings require a path or host pattern, the shared target group of '
+                                'load balancer [{0}] cannot be changed'.format(binding['loadBalancer']))
+
+            result.append({
+                'loadBalancer': binding['loadBalancer'],
+                'containerName': container_name,
+                'containerPort': container_port,
+                'targetGroup': target_group,
+                'conditions': conditions,
+                'priority': binding.get('priority'),
+                'targetType': target_type
+            })
+
+        return result
+
+    def __get_network_configuration(self, cluster_name, parameters, bindings):
+        """
+        Get the network configuration of a service in awsvpc network mode ('networkConfiguration' with 'subnets',
+        'securityGroups' and 'assignPublicIp'). Subnets default to those of the cluster, security groups to the ones
+        of the load balancer schemes of the service. Fargate tasks get a public IP address by default, as the
+        subnets of the cluster have no NAT gateway.
+        """
+        configuration = dict(parameters.get('networkConfiguration', {}))
+
+        if 'subnets' not in configuration or ('securityGroups' not in configuration and bindings):
+            stack = self.__cf.describe_stacks(StackName=cluster_name)['Stacks'][0]
+            outputs = {output['OutputKey']: output['OutputValue'] for output in stack.get('Outputs', [])}
+            configuration.setdefault('subnets', outputs['EcsSubnets'].split(','))
+            if bindings:
+                configuration.setdefault('securityGroups', sorted(set(
+                    outputs['Ecs' + SCHEME_PREFIXES[binding['loadBalancer']] + 'SecurityGroupId']
+                    for binding in bindings
+                )))
+
+        if is_fargate(parameters):
+            configuration.setdefault('assignPublicIp', 'ENABLED')
+
+        return {'awsvpcConfiguration': configuration}
+
+    @staticmethod
+    def __get_task_definition_options(parameters):
+        """
+        Get network mode, compatibilities and task-level cpu, memory and execution role of a task definition.
+        Fargate requires awsvpc network mode and task-level cpu and memory.
+        """
+        options = dict()
+
+        network_mode = get_network_mode(parameters)
+        if network_mode:
+            options['networkMode'] = network_mode
+        if is_fargate(parameters):
+            options['requiresCompatibilities'] = ['FARGATE']
+
+        for key in TASK_DEFINITION_PARAMETERS:
+            if key in parameters:
+                options[key] = str(parameters[key])
+
+        return options
+
+    @staticmethod
+    def __get_launch_options(parameters):
+        """
+        Get launch type ('launchType', EC2 or FARGATE, defaults to EC2) or capacity provider strategy
+        ('capacityProviderStrategy') of a service as arguments for create_service. Strategy items accept the ECS
+        notation as well as short strings '<capacity provider>:<weight>[:<base>]', e.g. 'FARGATE_SPOT:3'.
+        """
+        if 'capacityProviderStrategy' not in parameters:
+            return {'launchType': parameters.get('launchType', 'EC2')}
+
+        strategy = list()
+        for item in parameters['capacityProviderStrategy']:
+            if isinstance(item, str):
+                fields = item.split(':')
+                item = {'capacityProvider': fields[0], 'weight': int(fields[1]) if len(fields) > 1 else 1}
+                if len(fields) > 2:
+                    item['base'] = int(fields[2])
+            strategy.append(item)
+        return {'capacityProviderStrategy': strategy}
+
+    @staticmethod
+    def __get_update_options(launch_options):
+        """
+        Get the launch options that can be changed by update_service. The launch type of a service is fixed,
+        a changed capacity provider strategy requires a new deployment.
+        """
+        options = {key: value for key, value in launch_options.items() if key != 'launchType'}
+        if 'capacityProviderStrategy' in options:
+            options['forceNewDeployment'] = True
+        return options
+
+    @staticmethod
+    def __get_placement(parameters):
+        """
+        Get placement strategy and constraints of a service as arguments for create_service. Both accept the
+        ECS notation as well as short strings: 'binpack:memory', 'binpack:cpu', 'spread:availability-zone',
+        'spread:instance', 'random' for strategies and 'distinctInstance', 'memberOf:<expression>' for constraints.
+        """
+        placement = dict()
+
+        strategies = list()
+        for strategy in parameters.get('placementStrategy', []):
+            if isinstance(strategy, str):
+                strategy_type, _, field = strategy.partition(':')
+                strategy = {'type': strategy_type}
+                if field:
+                    strategy['field'] = PLACEMENT_FIELDS.get(field, field)
+            strategies.append(strategy)
+        if strategies:
+            placement['placementStrategy'] = strategies
+
+        constraints = list()
+        for constraint in parameters.get('placementConstraints', []):
+            if isinstance(constraint, str):
+                constraint_type, _, expression = constraint.partition(':')
+                constraint = {'type': constraint_type}
+                if expression:
+                    constraint['expression'] = expression
+            constraints.append(constraint)
+        if constraints:
+            placement['placementConstraints'] = constraints
+
+        return placement
+
+
+def get_target_group_name(cluster_name, service_name, binding):
+    """
+    Get the name of the dedicated target group of a load balancer binding. Target group names are limited to
+    32 characters, so the service name is shortened and suffixed with a hash of the binding.
+    """
+    binding_id = '/'.join([cluster_name, service_name, binding['loadBalancer'], binding['containerName'],
+                           str(binding['containerPort'])])
+    suffix = hashlib.sha1(binding_id.encode('utf-8')).hexdigest()[:8]
+    prefix = re.sub('[^a-zA-Z0-9-]', '-', service_name)[:23].strip('-')
+    return prefix + '-' + suffix
+
+
+def get_forward_target_group_arns(rule):
+    """
+    Get the ARNs of all target groups a listener rule forwards to.
+    """
+    arns = list()
+    for action in rule.get('Actions', []):
+        if action['Type'] != 'forward':
+            continue
+        if 'TargetGroupArn' in action:
+            arns.append(action['TargetGroupArn'])
+        for target_group in action.get('ForwardConfig', {}).get('TargetGroups', []):
+            arns.append(target_group['TargetGroupArn'])
+    return arns
+
+
+def get_network_mode(parameters):
+    """
+    Get the network mode of the tasks of a service ('networkMode'), which defaults to awsvpc on Fargate and to the
+    default of ECS (bridge) otherwise.
+    """
+    return parameters.get('networkMode', 'awsvpc' if is_fargate(parameters) else None)
+
+
+def is_fargate(parameters):
+    """
+    Check whether a service runs on Fargate, either by launch type or by a Fargate capacity provider.
+    """
+    if 'capacityProviderStrategy' in parameters:
+        return any((item if isinstance(item, str) else item['capacityProvider']).startswith('FARGATE')
+                   for item in parameters['capacityProviderStrategy'])
+    return parameters.get('launchType') == 'FARGATE'
+
+
+def get_parameters_hash(parameters):
+    """
+    Get the hash of the parameters of a service, which is recorded on the service by every deployment. The desired
+    count is left out, so changing only the desired count is a scaling operation instead of a new deployment.
+    """
+    content = json.dumps({key: value for key, value in parameters.items() if key != 'desiredCount'},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_desired_count(desired_count, count):
+    """
+    Get the new desired count of a service from its current one and an absolute ('5') or relative ('+2', '-1')
+    count. Relative counts do not go below 0.
+    """
+    if not re.match('^[+-]?[0-9]+$', str(count)):
+        raise Exception('Invalid count: [{0}]'.format(count))
+    if str(count)[0] in '+-':
+        return max(0, desired_count + int(count))
+    return int(count)
+
+
+def get_lock_name(cluster_name, service_name):
+    return 'service/' + cluster_name + '/' + service_name
+
+
+def get_log_group_name(cluster_name):
+    return '/cloudcrane/' + cluster_name
+
+
+def is_failed_task(task, deployment):
+    """
+    Whether a stopped task was started by a deployment and failed: it did not start, one of its containers exited
+    with a non-zero exit code or it failed container or load balancer health checks. Tasks stopped by scaling in
+    or by an earlier deployment of the same task definition are not failures.
+    """
+    if task['taskDefinitionArn'] != deployment['taskDefinition']:
+        return False
+    if task.get('startedBy') != deployment.get('id') and (
+            'createdAt' not in task or 'createdAt' not in deployment or task['createdAt'] < deployment['createdAt']):
+        return False
+
+    return (task.get('stopCode') == 'TaskFailedToStart'
+            or task.get('healthStatus') == 'UNHEALTHY'
+            or 'health check' in task.get('stoppedReason', '').lower()
+            or any(container.get('exitCode') not in (None, 0) for container in task.get('containers', [])))
+
+
+def get_stopped_task_message(task):
+    """
+    Get a one-line description of a stopped task with the reasons and exit codes of its containers.
+    """
+    message = '(task {0}) stopped: {1}'.format(task['taskArn'].split('/')[-1], task.get('stoppedReason', 'unknown'))
+    for container in task.get('containers', []):
+        details = [str(container[key]) for key in ['exitCode', 'reason'] if container.get(key) is not None]
+        if details:
+            message += ' [{0}: {1}]'.format(container['name'], ', '.join(details))
+    return message
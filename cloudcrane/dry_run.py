@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import clickclick.console
+import collections
+import datetime
+import threading
+
+from botocore.awsrequest import AWSResponse
+
+from cloudcrane.rate_limiter import get_rate_limiter
+
+STYLES = {
+    'write': {'fg': 'yellow', 'bold': True},
+    'read': {'fg': 'green'},
+    'yes': {'fg': 'red'},
+}
+
+TITLES = {}
+
+# Operations that only read state; all other operations are recorded instead of sent in a dry run.
+READ_OPERATION_PREFIXES = ('Describe', 'List', 'Get', 'Filter')
+
+# Depth up to which stub responses of recorded operations are filled in.
+MAX_STUB_DEPTH = 8
+
+
+class CallRecorder(object):
+    """
+    Collect the AWS API calls of a dry run: reads are sent, writes are only recorded and answered with a stub
+    response. Thread-safe.
+    """
+
+    __calls = None
+    __lock = None
+
+    def __init__(self):
+        self.__calls = list()
+        self.__lock = threading.Lock()
+
+    @property
+    def calls(self):
+        """
+        Recorded calls as (AWS service, operation, parameters, write) in call order.
+        """
+        with self.__lock:
+            return list(self.__calls)
+
+    def record(self, service_name, operation_name, params, write):
+        with self.__lock:
+            self.__calls.append((service_name, operation_name, params, write))
+
+    def estimate(self):
+        """
+        Estimate the duration of the recorded calls in seconds: the calls to an AWS service take at least as long as
+        its rate limit allows, calls to different services add up (commands call them one after another).
+        """
+        counts = collections.Counter(service_name for service_name, _, _, _ in self.calls)
+        services = dict()
+        for service_name, count in counts.items():
+            rate = get_rate_limiter(service_name).rate
+            services[service_name] = {
+                'calls': count,
+                'rate': rate,
+                'seconds': count / rate,
+                'throttled': count > max(1.0, rate)
+            }
+        return {
+            'services': services,
+            'seconds': sum(i['seconds'] for i in services.values())
+        }
+
+    def print_report(self):
+        """
+        Print the recorded writes (the plan), the number of calls per API and the estimated duration.
+        """
+        rows = [{'step': index + 1, 'api': service_name + '.' + operation_name, 'parameters': summarize(params)}
+                for index, (service_name, operation_name, params, _) in enumerate(
+                    i for i in self.calls if i[3])]
+        clickclick.console.print_table(['step', 'api', 'parameters'], rows, styles=STYLES, titles=TITLES)
+
+        counts = collections.Counter((service_name + '.' + operation_name, 'write' if write else 'read')
+                                     for service_name, operation_name, _, write in self.calls)
+        rows = [{'api': api, 'type': call_type, 'calls': count} for (api, call_type), count in sorted(counts.items())]
+        clickclick.console.print_table(['api', 'type', 'calls'], rows, styles=STYLES, titles=TITLES)
+
+        estimate = self.estimate()
+        rows = [{'service': service_name, 'calls': i['calls'], 'rate': i['rate'], 'seconds': round(i['seconds'], 1),
+                 'throttled': 'yes' if i['throttled'] else 'no'}
+                for service_name, i in sorted(estimate['services'].items())]
+        clickclick.console.print_table(['service', 'calls', 'rate', 'seconds', 'throttled'], rows, styles=STYLES,
+                                       titles=TITLES)
+        print('Estimated duration: {0}s'.format(round(estimate['seconds'], 1)))
+
+
+def record_calls(client, recorder):
+    """
+    Make a boto3 client record all its API calls with the recorder and only send reads. Returns the client.
+    """
+    service_name = client.meta.service_model.service_name
+
+    def remember_params(params, context, **kwargs):
+        context['cloudcrane_params'] = dict(params)
+
+    def record(model, context, **kwargs):
+        write = not model.name.startswith(READ_OPERATION_PREFIXES)
+        recorder.record(service_name, model.name, context.get('cloudcrane_params', {}), write)
+        if write:
+            return AWSResponse(None, 200, {}, None), get_stub_response(model.output_shape)
+        return None
+
+    client.meta.events.register('before-parameter-build', remember_params)
+    # Recorded writes return before the rate limiter and the lease check of the client.
+    client.meta.events.register_first('before-call', record)
+    return client
+
+
+def get_stub_response(shape, depth=0):
+    """
+    Get a response of the given botocore output shape with placeholder values, so code using the response of a
+    recorded call can go on.
+    """
+    if shape is None or depth > MAX_STUB_DEPTH:
+        return {} if depth == 0 else None
+    if shape.type_name == 'structure':
+        return {name: get_stub_response(member, depth + 1) for name, member in shape.members.items()}
+    if shape.type_name == 'list':
+        return [get_stub_response(shape.member, depth + 1)]
+    if shape.type_name == 'map':
+        return {}
+    if shape.type_name in ['integer', 'long', 'float', 'double']:
+        return 0
+    if shape.type_name == 'boolean':
+        return False
+    if shape.type_name == 'timestamp':
+        return datetime.datetime.now(datetime.timezone.utc)
+    if shape.type_name == 'blob':
+        return b''
+    return 'dry-run'
+
+
+def summarize(params, length=100):
+    """
+    Get a one-line summary of the parameters of a call.
+    """
+    text = ', '.join('{0}={1}'.format(key, value) for key, value in params.items())
+    return text if len(text) <= length else text[:length - 3] + '...'
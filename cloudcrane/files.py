@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import tempfile
+
+
+def get_user_directory(*names):
+    """
+    Get the directory of cloudcrane's files of the current user in the temp directory (or a sub-directory of it),
+    creating it if necessary. Only the user can access it, so other users can neither read nor replace the lock files,
+    journals and caches in it. Fails if another user created the directory first.
+    """
+    base = os.path.join(tempfile.gettempdir(), 'cloudcrane-{0}'.format(os.getuid()))
+    os.makedirs(base, mode=0o700, exist_ok=True)
+    status = os.lstat(base)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise Exception('Directory [{0}] must be owned by and only accessible to the current user'.format(base))
+
+    path = os.path.join(base, *names)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import boto3
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from cloudcrane.dry_run import record_calls
+from cloudcrane.files import get_user_directory
+from cloudcrane.rate_limiter import limit_rate
+
+ECR_IMAGE_PATTERN = re.compile(
+    r'^(?P<registry>(?P<account>\d{12})\.dkr\.ecr(-fips)?\.(?P<region>[a-z0-9-]+)\.amazonaws\.com(\.cn)?)/'
+    r'(?P<repository>[^:@]+)(:(?P<tag>[^@]+))?(@(?P<digest>sha256:[0-9a-f]{64}))?$'
+)
+
+
+class ImageResolver(object):
+    """
+    Resolve tags of ECR images to immutable digests ('<registry>/<repository>@sha256:...'), so all tasks of a
+    deployment run the same image. Other images are kept as they are. Lookups are cached in a file for 'cache_ttl'
+    seconds (tags move, a long TTL would pin outdated images); a TTL of 0 disables the cache. By default, the cache
+    file is kept in the private directory of the user (see get_user_directory), so no other user can pin images.
+    """
+
+    __cache_file = None
+    __cache_ttl = None
+    __recorder = None
+    __clients = None
+    __cache = None
+    __lock = None
+
+    def __init__(self, cache_file=None, cache_ttl=60, recorder=None):
+        self.__cache_file = cache_file
+        self.__cache_ttl = cache_ttl
+        self.__recorder = recorder
+        self.__clients = dict()
+        self.__lock = threading.Lock()
+
+    def resolve(self, images):
+        """
+        Get a dict of image to pinned image. ECR tags are looked up in one batch per repository.
+        """
+        with self.__lock:
+            cache = self.__load_cache()
+            now = time.time()
+
+            pinned = dict()
+            lookups = dict()
+            for image in images:
+                match = ECR_IMAGE_PATTERN.match(image)
+                if not match or match.group('digest'):
+                    pinned[image] = image
+                    continue
+                cached = cache.get(image)
+                if cached and now - cached['resolved'] < self.__cache_ttl:
+                    pinned[image] = get_pinned_image(match, cached['digest'])
+                    continue
+                key = (match.group('account'), match.group('region'), match.group('repository'))
+                lookups.setdefault(key, dict()).setdefault(match.group('tag') or 'latest', []).append((image, match))
+
+            for (account, region, repository), tags in lookups.items():
+                digests = self.__describe_digests(account, region, repository, sorted(tags))
+                for tag, matches in tags.items():
+                    for image, match in matches:
+                        if tag not in digests:
+                            raise Exception('Image not found in ECR: [{0}]'.format(image))
+                        pinned[image] = get_pinned_image(match, digests[tag])
+                        cache[image] = {'digest': digests[tag], 'resolved': now}
+
+            if lookups and self.__cache_ttl > 0 and self.__recorder is None:
+                self.__save_cache(cache)
+            return pinned
+
+    def __describe_digests(self, account, region, repository, tags):
+        ecr = self.__get_client(region)
+        digests = dict()
+        for i in range(0, len(tags), 100):
+            try:
+                image_details = ecr.describe_images(
+                    registryId=account,
+                    repositoryName=repository,
+                    imageIds=[{'imageTag': tag} for tag in tags[i:i + 100]]
+                )['imageDetails']
+            except ecr.exceptions.ImageNotFoundException as e:
+                raise Exception('Image not found in ECR repository [{0}]: {1}'.format(repository, e))
+            for image_detail in image_details:
+                for tag in image_detail.get('imageTags', []):
+                    digests[tag] = image_detail['imageDigest']
+        return digests
+
+    def __get_client(self, region):
+        if region not in self.__clients:
+            self.__clients[region] = limit_rate(boto3.client('ecr', region_name=region), 'ecr')
+            if self.__recorder is not None:
+                record_calls(self.__clients[region], self.__recorder)
+        return self.__clients[region]
+
+    def __get_cache_file(self):
+        if self.__cache_file is None:
+            self.__cache_file = os.path.join(get_user_directory('cache'), 'image-digests.json')
+        return self.__cache_file
+
+    def __load_cache(self):
+        if self.__cache is None:
+            self.__cache = dict()
+            if self.__cache_ttl > 0 and os.path.exists(self.__get_cache_file()):
+                try:
+                    with open(self.__get_cache_file()) as f:
+                        self.__cache = json.load(f)
+                except ValueError:
+                    pass
+        return self.__cache
+
+    def __save_cache(self, cache):
+        # Replace the file at once, concurrent deployments must not read a partly written cache. The temporary file
+        # gets a new, unpredictable name next to the cache.
+        cache_file = self.__get_cache_file()
+        descriptor, temp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file) or '.',
+                                                 prefix=os.path.basename(cache_file) + '.')
+        try:
+            with os.fdopen(descriptor, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temp_file, cache_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+
+
+def get_pinned_image(match, digest):
+    return '{0}/{1}@{2}'.format(match.group('registry'), match.group('repository'), digest)
+
+
+def get_ecr_registries(images):
+    """
+    Get the ECR registries of images as (registry, region) pairs.
+    """
+    registries = set()
+    for image in images:
+        match = ECR_IMAGE_PATTERN.match(image)
+        if match:
+            registries.add((match.group('registry'), match.group('region')))
+    return sorted(registries)
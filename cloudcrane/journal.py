@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+
+from datetime import datetime
+from datetime import timezone
+
+from cloudcrane.files import get_user_directory
+
+
+class Journal(object):
+    """
+    Step journals of multi-step operations (e.g. deleting a service), one append-only JSON lines file per
+    operation. An interrupted operation resumed with the same name skips the steps its journal records as completed.
+    A read-only journal (dry run) reads journals, but never writes them. By default, journals are kept in the
+    private directory of the user (see get_user_directory).
+    """
+
+    __directory = None
+    __read_only = None
+
+    def __init__(self, directory=None, read_only=False):
+        self.__directory = directory
+        self.__read_only = read_only
+
+    def operation(self, name, resume=False):
+        """
+        Start an operation. Without resume, the journal of an earlier, interrupted run of the operation is discarded.
+        """
+        directory = self.__directory or get_user_directory('journals')
+        path = os.path.join(directory, re.sub('[^a-zA-Z0-9_.-]', '_', name) + '.jsonl')
+        return JournalOperation(path, name, resume=resume, read_only=self.__read_only)
+
+
+class JournalOperation(object):
+
+    __path = None
+    __read_only = None
+    __steps = None
+
+    def __init__(self, path, name, resume=False, read_only=False):
+        self.__path = path
+        self.__read_only = read_only
+        self.__steps = dict()
+
+        if not os.path.exists(path):
+            return
+
+        if resume:
+            self.__steps = load_steps(path)
+            print('Resuming operation [{0}] after steps: {1}'.format(name, ', '.join(self.__steps) or 'none'))
+        elif not read_only:
+            print('Discarding journal of interrupted operation [{0}], use --resume to continue it'.format(name))
+            os.remove(path)
+
+    def done(self, step):
+        return step in self.__steps
+
+    def data(self, step):
+        """
+        Data recorded with a completed step (e.g. ARNs of resources to clean up later), None for other steps.
+        """
+        return self.__steps.get(step)
+
+    def complete(self, step, data=None):
+        """
+        Record a step as completed. The entry is written through to disk before the next step starts.
+        """
+        self.__steps[step] = data
+        if self.__read_only:
+            return
+
+        os.makedirs(os.path.dirname(self.__path), mode=0o700, exist_ok=True)
+        entry = {'step': step, 'data': data, 'time': datetime.now(timezone.utc).isoformat()}
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_NOFOLLOW
+        with os.fdopen(os.open(self.__path, flags, 0o600), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish(self):
+        """
+        Remove the journal of a completed operation.
+        """
+        if not self.__read_only and os.path.exists(self.__path):
+            os.remove(self.__path)
+
+
+def load_steps(path):
+    """
+    Load the completed steps of a journal file as a dict of step to data. A partly written last line (the process
+    was killed while writing it) is ignored.
+    """
+    steps = dict()
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            steps[entry['step']] = entry['data']
+    return steps
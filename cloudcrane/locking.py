@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import boto3
+import contextlib
+import fcntl
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+
+from cloudcrane.dry_run import READ_OPERATION_PREFIXES
+from cloudcrane.files import get_user_directory
+
+# Seconds between attempts to take a lock file held by another process.
+FILE_LOCK_POLL_INTERVAL = 0.2
+
+
+class MemoryLeaseStore(object):
+    """
+    Lease store in memory, for a single process and for tests. See DynamoDbLeaseStore.
+    """
+
+    __leases = None
+    __lock = None
+
+    def __init__(self):
+        self.__leases = dict()
+        self.__lock = threading.Lock()
+
+    def acquire(self, name, owner, ttl):
+        with self.__lock:
+            lease = self.__leases.get(name, {'owner': None, 'token': 0, 'expires': 0})
+            if lease['owner'] is not None and lease['expires'] >= time.time():
+                return None
+            self.__leases[name] = {'owner': owner, 'token': lease['token'] + 1, 'expires': time.time() + ttl}
+            return self.__leases[name]['token']
+
+    def renew(self, name, owner, token, ttl):
+        with self.__lock:
+            lease = self.__leases.get(name)
+            if not lease or lease['owner'] != owner or lease['token'] != token:
+                return False
+            lease['expires'] = time.time() + ttl
+            return True
+
+    def release(self, name, owner, token):
+        with self.__lock:
+            lease = self.__leases.get(name)
+            if lease and lease['owner'] == owner and lease['token'] == token:
+                lease['owner'] = None
+                lease['expires'] = 0
+
+
+class DynamoDbLeaseStore(object):
+    """
+    Lease store in a DynamoDB table with the partition key 'name' (string). Every lease gets a fencing token, which
+    increases with every acquisition; renewing and releasing a lease only succeeds with the current token.
+    """
+
+    __dynamodb = None
+    __table_name = None
+
+    def __init__(self, table_name):
+        self.__dynamodb = boto3.client('dynamodb')
+        self.__table_name = table_name
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        try:
+            response = self.__dynamodb.update_item(
+                TableName=self.__table_name,
+                Key={'name': {'S': name}},
+                UpdateExpression='SET #owner = :owner, expires = :expires ADD #token :one',
+                ConditionExpression='attribute_not_exists(#owner) OR expires < :now',
+                ExpressionAttributeNames={'#owner': 'owner', '#token': 'token'},
+                ExpressionAttributeValues={
+                    ':owner': {'S': owner},
+                    ':expires': {'N': str(now + ttl)},
+                    ':now': {'N': str(now)},
+                    ':one': {'N': '1'}
+                },
+                ReturnValues='UPDATED_NEW'
+            )
+        except self.__dynamodb.exceptions.ConditionalCheckFailedException:
+            return None
+        return int(response['Attributes']['token']['N'])
+
+    def renew(self, name, owner, token, ttl):
+        try:
+            self.__dynamodb.update_item(
+                TableName=self.__table_name,
+                Key={'name': {'S': name}},
+                UpdateExpression='SET expires = :expires',
+                ConditionExpression='#owner = :owner AND #token = :token',
+                ExpressionAttributeNames={'#owner': 'owner', '#token': 'token'},
+                ExpressionAttributeValues={
+                    ':owner': {'S': owner},
+                    ':token': {'N': str(token)},
+                    ':expires': {'N': str(time.time() + ttl)}
+                }
+            )
+        except self.__dynamodb.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def release(self, name, owner, token):
+        try:
+            self.__dynamodb.update_item(
+                TableName=self.__table_name,
+                Key={'name': {'S': name}},
+                UpdateExpression='REMOVE #owner SET expires = :zero',
+                ConditionExpression='#owner = :owner AND #token = :token',
+                ExpressionAttributeNames={'#owner': 'owner', '#token': 'token'},
+                ExpressionAttributeValues={
+                    ':owner': {'S': owner},
+                    ':token': {'N': str(token)},
+                    ':zero': {'N': '0'}
+                }
+            )
+        except self.__dynamodb.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+class LeaseLock(object):
+    """
+    Lock shared between hosts through a lease store. The lease expires after 'ttl' seconds unless it is renewed,
+    which a background thread does every third of the TTL. If renewing fails, another owner took over the expired
+    lease (it got a higher fencing token) and the lock is lost.
+    """
+
+    __store = None
+    __name = None
+    __owner = None
+    __ttl = None
+    __token = None
+    __lost = None
+    __renewed = None
+    __stopped = None
+    __heartbeat = None
+
+    def __init__(self, store, name, ttl=60):
+        self.__store = store
+        self.__name = name
+        self.__owner = '{0}/{1}/{2}'.format(socket.gethostname(), os.getpid(), uuid.uuid4())
+        self.__ttl = ttl
+
+    @property
+    def token(self):
+        """
+        Fencing token of the lease, while the lock is held.
+        """
+        return self.__token
+
+    @property
+    def lost(self):
+        return self.__lost
+
+    def acquire(self, timeout=None, poll_interval=1):
+        """
+        Wait until the lease is acquired. Returns False on timeout (seconds).
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            requested = time.monotonic()
+            token = self.__store.acquire(self.__name, self.__owner, self.__ttl)
+            if token is not None:
+                break
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+        self.__token = token
+        self.__lost = False
+        self.__renewed = requested
+        self.__stopped = threading.Event()
+        self.__heartbeat = threading.Thread(target=self.__renew, daemon=True)
+        self.__heartbeat.start()
+        return True
+
+    def check(self):
+        """
+        Raise an exception unless the lease is still held: it was not taken over and has not expired since it was
+        last renewed (e.g. while the heartbeat stalled), so no other owner can have taken it over.
+        """
+        if self.__lost or time.monotonic() - self.__renewed >= self.__ttl:
+            raise Exception('Lock on [{0}] was lost'.format(self.__name))
+
+    def release(self):
+        self.__stopped.set()
+        self.__heartbeat.join()
+        if not self.__lost:
+            self.__store.release(self.__name, self.__owner, self.__token)
+        self.__token = None
+
+    def __renew(self):
+        while not self.__stopped.wait(self.__ttl / 3.0):
+            requested = time.monotonic()
+            if not self.__store.renew(self.__name, self.__owner, self.__token, self.__ttl):
+                self.__lost = True
+                return
+            self.__renewed = requested
+
+
+class NullLocker(object):
+    """
+    Locker taking no locks, for dry runs: they change nothing, so they neither wait for other operations nor make
+    them wait. See Locker.
+    """
+
+    @contextlib.contextmanager
+    def lock(self, *resources):
+        yield
+
+    def check(self):
+        pass
+
+    def fence(self, client):
+        return client
+
+
+class Locker(object):
+    """
+    Serialize operations on the same resource (e.g. a service): a file lock queues operations of all processes on
+    this host, a lease lock (with a lease store) those of all hosts. Locks are re-entrant within a thread. Clients
+    fenced by the locker check the leases held by the calling thread before every write.
+    """
+
+    __directory = None
+    __store = None
+    __ttl = None
+    __timeout = None
+    __held = None
+
+    def __init__(self, directory=None, store=None, ttl=60, timeout=None):
+        self.__directory = directory
+        self.__store = store
+        self.__ttl = ttl
+        self.__timeout = timeout
+        self.__held = threading.local()
+
+    @contextlib.contextmanager
+    def lock(self, *resources):
+        """
+        Hold the locks of the given resources while the block runs. Locks are taken in order of their names, so
+        operations locking the same resources cannot deadlock.
+        """
+        with contextlib.ExitStack() as stack:
+            for resource in sorted(set(resources)):
+                stack.enter_context(self.__lock(resource))
+            yield
+
+    def check(self):
+        """
+        Raise an exception if a lease held by the calling thread was lost.
+        """
+        for lease in self.__held.__dict__.get('leases', {}).values():
+            lease.check()
+
+    def fence(self, client):
+        """
+        Make a boto3 client check the leases held by the calling thread before every write, so an operation whose
+        lease was taken over stops before overwriting the changes of the new owner. Returns the client.
+        """
+        def check(model, **kwargs):
+            if not model.name.startswith(READ_OPERATION_PREFIXES):
+                self.check()
+
+        client.meta.events.register('before-call', check)
+        return client
+
+    @contextlib.contextmanager
+    def __lock(self, resource):
+        held = self.__held.__dict__.setdefault('resources', set())
+        leases = self.__held.__dict__.setdefault('leases', dict())
+        if resource in held:
+            yield
+            return
+
+        deadline = None if self.__timeout is None else time.time() + self.__timeout
+        if self.__directory:
+            os.makedirs(self.__directory, mode=0o700, exist_ok=True)
+        path = os.path.join(self.__directory or get_user_directory('locks'),
+                            re.sub('[^a-zA-Z0-9_.-]', '_', resource) + '.lock')
+        # Never follow a symlink planted in place of the lock file.
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW, 0o600), 'w') as lock_file:
+            waiting = False
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if deadline is not None and time.time() >= deadline:
+                        raise Exception('Timeout waiting for lock on [{0}]'.format(resource))
+                    if not waiting:
+                        print('Waiting for lock on [{0}]'.format(resource))
+                        waiting = True
+                    time.sleep(FILE_LOCK_POLL_INTERVAL)
+
+            lease = None
+            try:
+                if self.__store is not None:
+                    lease = LeaseLock(self.__store, resource, ttl=self.__ttl)
+                    if not lease.acquire(timeout=0):
+                        if not waiting:
+                            print('Waiting for lock on [{0}]'.format(resource))
+                        remaining = None if deadline is None else max(0, deadline - time.time())
+                        if not lease.acquire(timeout=remaining):
+                            lease = None
+                            raise Exception('Timeout waiting for lock on [{0}]'.format(resource))
+                    leases[resource] = lease
+
+                held.add(resource)
+                try:
+                    yield
+                finally:
+                    held.discard(resource)
+                    leases.pop(resource, None)
+            finally:
+                if lease is not None:
+                    lease.release()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            if lease is not None and lease.lost:
+                raise Exception('Lock on [{0}] was lost during the operation'.format(resource))
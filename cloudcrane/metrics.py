@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import collections
+import http.server
+import threading
+import time
+
+# Error codes of throttled AWS API calls (as retried by botocore). Not 'LimitExceededException', which ECS,
+# Application Auto Scaling and CloudWatch Logs use for exceeded quotas.
+THROTTLING_ERROR_CODES = [
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'RequestThrottled',
+    'SlowDown',
+]
+
+# Upper bounds in seconds of the buckets of the API call latency histogram.
+LATENCY_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# A metric family: name, type (gauge, counter, histogram), help text and samples (name suffix, labels, value).
+Metric = collections.namedtuple('Metric', ['name', 'type', 'help', 'samples'])
+
+
+class ApiMetrics(object):
+    """
+    Counters of the AWS API calls of a process by AWS service and operation: calls, errors, throttled attempts
+    (including retried ones) and a latency histogram. Thread-safe.
+    """
+
+    __calls = None
+    __lock = None
+
+    def __init__(self):
+        self.__calls = dict()
+        self.__lock = threading.Lock()
+
+    def record_call(self, service_name, operation_name, seconds, error):
+        with self.__lock:
+            calls = self.__get_calls(service_name, operation_name)
+            calls['count'] += 1
+            calls['errors'] += 1 if error else 0
+            calls['seconds'] += seconds
+            calls['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_throttle(self, service_name, operation_name):
+        with self.__lock:
+            self.__get_calls(service_name, operation_name)['throttles'] += 1
+
+    def __get_calls(self, service_name, operation_name):
+        return self.__calls.setdefault((service_name, operation_name), {
+            'count': 0, 'errors': 0, 'throttles': 0, 'seconds': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)
+        })
+
+    def metrics(self):
+        """
+        Get the counters as metric families.
+        """
+        with self.__lock:
+            calls = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in self.__calls.items())
+
+        latency_samples = list()
+        for (service_name, operation_name), i in calls:
+            labels = {'service': service_name, 'operation': operation_name}
+            count = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ['+Inf'], i['buckets']):
+                count += bucket_count
+                latency_samples.append(('_bucket', dict(labels, le=str(bound)), count))
+            latency_samples.append(('_sum', labels, i['seconds']))
+            latency_samples.append(('_count', labels, i['count']))
+
+        return [
+            Metric('cloudcrane_aws_api_calls_total', 'counter', 'AWS API calls of cloudcrane.',
+                   [('', {'service': s, 'operation': o}, i['count']) for (s, o), i in calls]),
+            Metric('cloudcrane_aws_api_errors_total', 'counter', 'AWS API calls of cloudcrane that failed.',
+                   [('', {'service': s, 'operation': o}, i['errors']) for (s, o), i in calls]),
+            Metric('cloudcrane_aws_api_throttles_total', 'counter', 'Throttled attempts of AWS API calls.',
+                   [('', {'service': s, 'operation': o}, i['throttles']) for (s, o), i in calls]),
+            Metric('cloudcrane_aws_api_call_duration_seconds', 'histogram',
+                   'Duration of AWS API calls of cloudcrane including retries and rate limiting.', latency_samples)
+        ]
+
+
+__api_metrics = ApiMetrics()
+
+
+def get_api_metrics():
+    """
+    Get the process-wide AWS API call counters.
+    """
+    return __api_metrics
+
+
+def record_api_metrics(client, api_metrics=None):
+    """
+    Count the API calls of a boto3 client in the API metrics (by default the process-wide ones). Returns the client.
+    """
+    api_metrics = api_metrics or get_api_metrics()
+    service_name = client.meta.service_model.service_name
+
+    def start(model, context, **kwargs):
+        context['cloudcrane_call'] = (model.name, time.monotonic())
+
+    def finish(context, http_response=None, **kwargs):
+        # Calls failing without a response (e.g. connection errors) only emit 'after-call-error'.
+        if 'cloudcrane_call' not in context:
+            return
+        operation_name, started = context['cloudcrane_call']
+        error = http_response is None or http_response.status_code >= 300
+        api_metrics.record_call(service_name, operation_name, time.monotonic() - started, error)
+
+    def count_throttle(response, operation, **kwargs):
+        if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            api_metrics.record_throttle(service_name, operation.name)
+
+    # First of all 'before-call' handlers, which may answer the call themselves (e.g. in a dry run).
+    client.meta.events.register_first('before-call.*.*', start)
+    client.meta.events.register('after-call', finish)
+    client.meta.events.register('after-call-error', finish)
+    client.meta.events.register('needs-retry', count_throttle)
+    return client
+
+
+def format_metrics(metrics):
+    """
+    Format metric families in the Prometheus text exposition format.
+    """
+    lines = list()
+    for metric in metrics:
+        lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+        for suffix, labels, value in metric.samples:
+            lines.append('{0}{1}{2} {3}'.format(metric.name, suffix, format_labels(labels), format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')) for key, value in labels.items()) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve the metrics of the server's 'render' function on GET /metrics.
+    """
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        content = self.server.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def create_metrics_server(render, host='0.0.0.0', port=9102):
+    """
+    Create an HTTP server for Prometheus to scrape the metrics returned by render.
+    """
+    http_server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    http_server.render = render
+    return http_server
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+import hashlib
+import os
+import yaml
+
+EXTENDS_KEY = 'extends'
+ENVIRONMENTS_KEY = 'environments'
+
+
+class ParameterLoader(object):
+    """
+    Load cloudcrane parameter files with support for inheritance and overlays.
+
+    A parameter file may name one or more base files with the 'extends' key (paths are relative to the
+    extending file). Bases are merged first, the extending file on top. Sections under the 'environments'
+    key are applied on top of the merged result for the selected environment, followed by explicit
+    overlay files.
+
+    Parsed files are cached by the hash of their content and merged results by the hash of all their inputs,
+    so shared bases are only parsed and merged once per loader.
+    """
+
+    __documents = None
+    __merged = None
+
+    def __init__(self):
+        self.__documents = dict()
+        self.__merged = dict()
+
+    def load(self, path, environment=None, overlays=()):
+        """
+        Load and merge a parameter file. Returns a copy that can be modified freely by the caller.
+        """
+        inputs = self.__resolve(path, chain=())
+        for overlay in overlays:
+            inputs.extend(self.__resolve(overlay, chain=()))
+
+        key = hashlib.sha256()
+        for _, digest in inputs:
+            key.update(digest.encode('utf-8'))
+        key.update(str(environment).encode('utf-8'))
+        key.update(str(len(overlays)).encode('utf-8'))
+        key = key.hexdigest()
+
+        if key not in self.__merged:
+            self.__merged[key] = self.__merge_inputs(path, environment, overlays)
+
+        return copy.deepcopy(self.__merged[key])
+
+    def __merge_inputs(self, path, environment, overlays):
+        """
+        Merge a parameter file, its selected environment section and all overlays.
+        """
+        parameters = self.__merge_file(path, chain=())
+        environments = parameters.pop(ENVIRONMENTS_KEY, None) or {}
+
+        if environment is not None:
+            if environment not in environments:
+                raise Exception('Unknown environment [{0}] in parameter file [{1}]'.format(environment, path))
+            parameters = merge(parameters, environments[environment])
+
+        for overlay in overlays:
+            overlay_parameters = self.__merge_file(overlay, chain=())
+            overlay_parameters.pop(ENVIRONMENTS_KEY, None)
+            parameters = merge(parameters, overlay_parameters)
+
+        return parameters
+
+    def __merge_file(self, path, chain):
+        """
+        Merge a parameter file on top of all files it extends.
+        """
+        path = os.path.abspath(path)
+        document = self.__read(path)[0]
+
+        parameters = dict()
+        for base in self.__bases(path, document):
+            parameters = merge(parameters, self.__merge_file(base, chain + (path,)))
+
+        own = dict(document)
+        own.pop(EXTENDS_KEY, None)
+        return merge(parameters, own)
+
+    def __resolve(self, path, chain):
+        """
+        Get (path, content hash) of a parameter file and all files it extends.
+        """
+        path = os.path.abspath(path)
+        if path in chain:
+            raise Exception('Circular extends in parameter file [{0}]'.format(path))
+
+        document, digest = self.__read(path)
+
+        inputs = list()
+        for base in self.__bases(path, document):
+            inputs.extend(self.__resolve(base, chain + (path,)))
+        inputs.append((path, digest))
+        return inputs
+
+    def __read(self, path):
+        """
+        Read and parse a parameter file. Parsed documents are cached by content hash.
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        digest = hashlib.sha256(content).hexdigest()
+        if digest not in self.__documents:
+            document = yaml.safe_load(content) or {}
+            if not isinstance(document, dict):
+                raise Exception('Parameter file [{0}] must contain a mapping'.format(path))
+            self.__documents[digest] = document
+
+        return self.__documents[digest], digest
+
+    @staticmethod
+    def __bases(path, document):
+        """
+        Get absolute paths of the files a parameter file extends.
+        """
+        bases = document.get(EXTENDS_KEY) or []
+        if isinstance(bases, str):
+            bases = [bases]
+        directory = os.path.dirname(path)
+        return [os.path.join(directory, base) for base in bases]
+
+
+def merge(base, overlay):
+    """
+    Deep-merge two parameter mappings. Mappings are merged recursively, all other values (including lists)
+    of the overlay replace those of the base. An empty overlay (None, e.g. an empty environment section) changes
+    nothing.
+    """
+    result = dict(base)
+    for key, value in (overlay or {}).items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
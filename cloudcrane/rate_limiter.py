@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+# Conservative sustained request rates (requests per second) per AWS service, shared by all clients of a process.
+DEFAULT_RATE_LIMITS = {
+    'application-autoscaling': 10.0,
+    'cloudformation': 5.0,
+    'cloudwatch': 20.0,
+    'ecr': 20.0,
+    'ecs': 20.0,
+    'elbv2': 10.0,
+    'logs': 5.0,
+    'ssm': 10.0,
+}
+
+__rate_limiters = dict()
+__rate_limiters_lock = threading.Lock()
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket: allows bursts of up to 'burst' calls and 'rate' calls per second on average.
+    """
+
+    __rate = None
+    __burst = None
+    __tokens = None
+    __updated = None
+    __waited = None
+    __lock = None
+
+    def __init__(self, rate, burst=None):
+        self.__rate = float(rate)
+        self.__burst = float(burst if burst is not None else max(1.0, rate))
+        self.__tokens = self.__burst
+        self.__updated = time.monotonic()
+        self.__waited = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.__rate
+
+    @property
+    def waited(self):
+        """
+        Total time in seconds callers waited for tokens.
+        """
+        return self.__waited
+
+    def acquire(self):
+        """
+        Take one token, waiting until one is available.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+                self.__waited += wait
+            time.sleep(wait)
+
+
+def get_rate_limiter(service_name):
+    """
+    Get the process-wide rate limiter of an AWS service.
+    """
+    with __rate_limiters_lock:
+        if service_name not in __rate_limiters:
+            __rate_limiters[service_name] = RateLimiter(DEFAULT_RATE_LIMITS.get(service_name, 10.0))
+        return __rate_limiters[service_name]
+
+
+def get_rate_limiters():
+    """
+    Get the process-wide rate limiters created so far, by AWS service.
+    """
+    with __rate_limiters_lock:
+        return dict(__rate_limiters)
+
+
+def limit_rate(client, service_name):
+    """
+    Make all API calls of a boto3 client wait for the rate limiter of its AWS service. Returns the client.
+    """
+    rate_limiter = get_rate_limiter(service_name)
+    client.meta.events.register('before-call', lambda **kwargs: rate_limiter.acquire())
+    return client
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import contextlib
+import hmac
+import http.server
+import inspect
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Controller methods callable through the API, by resource.
+OPERATIONS = {
+    'cluster': ['create', 'delete', 'list', 'usage'],
+    'service': ['deploy', 'blue_green_deploy', 'rollback', 'scale', 'scale_services', 'delete', 'list', 'wait_healthy'],
+}
+
+# Operations taking service parameters, which may also be given as a parameter file to load.
+PARAMETERS_OPERATIONS = [('service', 'deploy'), ('service', 'blue_green_deploy')]
+
+
+class Server(object):
+    """
+    Run controller operations for API requests with warm controllers: AWS clients, locks and the parameter cache
+    are created once and shared by all requests. Requests are queued and run by a fixed number of workers;
+    when the queue is full, requests are rejected.
+    """
+
+    __operations = None
+    __parameter_loader = None
+    __executor = None
+    __max_queue = None
+    __pending = None
+    __lock = None
+    __output = None
+
+    def __init__(self, cluster_controller, service_controller, parameter_loader, max_workers=4, max_queue=100):
+        controllers = {'cluster': cluster_controller, 'service': service_controller}
+        self.__operations = {(resource, operation): getattr(controllers[resource], operation)
+                             for resource, operations in OPERATIONS.items() for operation in operations}
+        self.__parameter_loader = parameter_loader
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__max_queue = max_queue
+        self.__pending = 0
+        self.__lock = threading.Lock()
+        self.__output = get_output_router()
+
+    @property
+    def pending(self):
+        """
+        Number of requests queued or running.
+        """
+        return self.__pending
+
+    def handle(self, resource, operation, arguments):
+        """
+        Run an operation with the given keyword arguments. Returns the HTTP status and the response body: the result
+        of the operation and its console output, or the error.
+        """
+        method = self.__operations.get((resource, operation))
+        if method is None:
+            return 404, {'error': 'Unknown operation: [{0}/{1}]'.format(resource, operation)}
+        if not isinstance(arguments, dict):
+            return 400, {'error': 'Arguments must be a JSON object'}
+
+        try:
+            if (resource, operation) in PARAMETERS_OPERATIONS and 'parameters_file' in arguments:
+                arguments = dict(arguments)
+                arguments['parameters'] = self.__parameter_loader.load(
+                    arguments.pop('parameters_file'),
+                    environment=arguments.pop('environment', None),
+                    overlays=arguments.pop('overlays', ())
+                )
+            inspect.signature(method).bind(**arguments)
+        except Exception as e:
+            return 400, {'error': str(e)}
+
+        with self.__lock:
+            if self.__pending >= self.__max_queue:
+                return 503, {'error': 'Too many queued requests'}
+            self.__pending += 1
+
+        try:
+            return self.__executor.submit(self.__run, method, arguments).result()
+        finally:
+            with self.__lock:
+                self.__pending -= 1
+
+    def __run(self, method, arguments):
+        with self.__output.capture() as output:
+            try:
+                result = method(**arguments)
+            except Exception as e:
+                return 500, {'error': str(e), 'output': output.getvalue()}
+        return 200, {'result': result, 'output': output.getvalue()}
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
+
+
+class OutputRouter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout: output of threads capturing it goes to their buffer, all other output to the original
+    stream. Controllers print tables, the server returns them in the response of the request that printed them.
+    """
+
+    __stream = None
+    __local = None
+
+    def __init__(self, stream):
+        self.__stream = stream
+        self.__local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self):
+        self.__local.buffer = io.StringIO()
+        try:
+            yield self.__local.buffer
+        finally:
+            self.__local.buffer = None
+
+    @property
+    def encoding(self):
+        return getattr(self.__stream, 'encoding', None) or 'utf-8'
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return getattr(self.__local, 'buffer', None) is None and self.__stream.isatty()
+
+    def write(self, text):
+        buffer = getattr(self.__local, 'buffer', None)
+        return (self.__stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.__stream.flush()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    JSON API: POST /<resource>/<operation> with the keyword arguments of the operation as JSON object, e.g.
+    POST /service/scale {"cluster_name": "prod", "service_name": "app", "desired_count": 3}. GET /health.
+
+    Browsers must not be able to call the API for a website the user visits: POST requests need the JSON content
+    type (a preflight for cross-origin requests, which the API never answers) and, on a TCP port, the API token as
+    bearer token. The Host header must name the server, against DNS rebinding.
+    """
+
+    def do_GET(self):
+        if not self.__is_allowed_host():
+            self.__respond(403, {'error': 'Host not allowed: [{0}]'.format(self.headers.get('Host'))})
+            return
+        if self.path != '/health':
+            self.__respond(404, {'error': 'Unknown path: [{0}]'.format(self.path)})
+            return
+        self.__respond(200, {'status': 'ok', 'pending': self.server.cloudcrane.pending})
+
+    def do_POST(self):
+        if not self.__is_allowed_host():
+            self.__respond(403, {'error': 'Host not allowed: [{0}]'.format(self.headers.get('Host'))})
+            return
+        if not self.__is_authorized():
+            self.__respond(401, {'error': 'Missing or invalid API token'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.__respond(415, {'error': 'Content-Type must be application/json'})
+            return
+
+        path = self.path.strip('/').split('/')
+        if len(path) != 2:
+            self.__respond(404, {'error': 'Unknown path: [{0}]'.format(self.path)})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            arguments = json.loads(self.rfile.read(length) or '{}')
+        except ValueError as e:
+            self.__respond(400, {'error': 'Invalid JSON: {0}'.format(e)})
+            return
+
+        self.__respond(*self.server.cloudcrane.handle(path[0], path[1], arguments))
+
+    def address_string(self):
+        # Clients of a Unix socket have no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def __is_allowed_host(self):
+        allowed_hosts = self.server.allowed_hosts
+        if allowed_hosts is None:
+            return True
+        host = self.headers.get('Host', '')
+        # Strip the port, but not the colons of an IPv6 address in brackets.
+        if host.rpartition(':')[2].isdigit() and not host.endswith(']'):
+            host = host.rpartition(':')[0]
+        return host.lower() in allowed_hosts
+
+    def __is_authorized(self):
+        token = self.server.token
+        if token is None:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'),
+                                   'Bearer {0}'.format(token).encode('utf-8'))
+
+    def __respond(self, status, body):
+        content = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+def create_http_server(server, host='127.0.0.1', port=8080, socket_path=None, token=None):
+    """
+    Create an HTTP server for the API on a TCP port or, with socket_path, on a Unix socket only the current user can
+    connect to. On a TCP port, any local user and process can connect: requests must carry the token and name the
+    host (or localhost) in the Host header.
+    """
+    if not socket_path and not token:
+        raise Exception('An API token is required to serve on a TCP port')
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # The socket is created by bind with the permissions of the umask, it must never be reachable by others.
+        umask = os.umask(0o077)
+        try:
+            http_server = UnixHTTPServer(socket_path, RequestHandler)
+        finally:
+            os.umask(umask)
+    else:
+        http_server = http.server.ThreadingHTTPServer((host, port), RequestHandler)
+    http_server.cloudcrane = server
+    http_server.token = token
+    http_server.allowed_hosts = None if socket_path else {host.lower(), 'localhost', '127.0.0.1', '[::1]'}
+    return http_server
+
+
+__output_router = None
+__output_router_lock = threading.Lock()
+
+
+def get_output_router():
+    """
+    Get the process-wide output router, installing it as sys.stdout unless it is already.
+    """
+    global __output_router
+    with __output_router_lock:
+        if __output_router is None or sys.stdout is not __output_router:
+            __output_router = OutputRouter(sys.stdout)
+            sys.stdout = __output_router
+        return __output_router
@@ -0,0 +1,145 @@
+import os
+import tempfile
+
+from unittest.mock import call
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.controllers.apply_controller import ApplyController
+from cloudcrane.controllers.apply_controller import get_dependency_order
+from cloudcrane.controllers.apply_controller import get_plan
+from cloudcrane.controllers.service_controller import get_parameters_hash
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
+
+
+def describe(service_name, parameters, desired_count=None):
+    return {
+        'serviceName': service_name,
+        'status': 'ACTIVE',
+        'desiredCount': parameters['desiredCount'] if desired_count is None else desired_count,
+        'tags': [{'key': 'cloudcrane:parameters', 'value': get_parameters_hash(parameters)}]
+    }
+
+
+class TestApplyController(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_directory = tempfile.TemporaryDirectory()
+        self.locker = Locker(directory=self.state_directory.name)
+        self.journal = Journal(directory=self.state_directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        self.state_directory.cleanup()
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory.name, name), 'w') as f:
+            f.write(content)
+
+    def test_should_plan_minimal_changes(self):
+        unchanged = {'containerDefinition': {'name': 'a'}, 'desiredCount': 1}
+        scaled = {'containerDefinition': {'name': 'b'}, 'desiredCount': 3}
+        auto_scaled = {'containerDefinition': {'name': 'c'}, 'desiredCount': 1, 'autoScaling': {'maxCount': 5}}
+        changed = {'containerDefinition': {'name': 'd', 'image': 'd:2'}, 'desiredCount': 1}
+        desired = {
+            'unchanged': unchanged,
+            'scaled': scaled,
+            'auto-scaled': auto_scaled,
+            'changed': changed,
+            'new': {'containerDefinition': {'name': 'e'}, 'desiredCount': 1}
+        }
+        actual = {
+            'unchanged': describe('unchanged', unchanged),
+            'scaled': describe('scaled', scaled, desired_count=1),
+            'auto-scaled': describe('auto-scaled', auto_scaled, desired_count=4),
+            'changed': describe('changed', dict(changed, containerDefinition={'name': 'd', 'image': 'd:1'})),
+            'orphan': describe('orphan', unchanged)
+        }
+
+        self.assertEqual(get_plan(desired, actual), [
+            ('update', 'changed', 'parameters changed'),
+            ('create', 'new', 'new service'),
+            ('scale', 'scaled', 'desired count 1 -> 3')
+        ])
+        self.assertEqual(get_plan(desired, actual, prune=True)[-1], ('delete', 'orphan', 'no parameter file'))
+
+    def test_should_order_services_by_dependencies(self):
+        services = {'web': {'dependsOn': ['api']}, 'api': {'dependsOn': ['db']}, 'db': {}, 'admin': {}}
+
+        self.assertEqual(get_dependency_order(services), ['admin', 'db', 'api', 'web'])
+
+    def test_should_raise_exception_for_circular_dependencies(self):
+        with self.assertRaisesRegex(Exception, r'Circular dependency of services: \[a -> b -> a\]'):
+            get_dependency_order({'a': {'dependsOn': ['b']}, 'b': {'dependsOn': ['a']}})
+
+    @patch('cloudcrane.controllers.apply_controller.ServiceController')
+    @patch('cloudcrane.controllers.apply_controller.boto3')
+    def test_should_load_services_from_directory(self, boto3, service_controller):
+        self.write('_base.yaml', 'desiredCount: 1\n')
+        self.write('api.yaml', 'extends: _base.yaml\ncontainerDefinition:\n  name: api\n')
+        self.write('web.yml', 'extends: _base.yaml\nserviceName: frontend\ndependsOn: [api]\n')
+
+        services = ApplyController(locker=self.locker, journal=self.journal).load(self.directory.name)
+
+        self.assertEqual(services, {
+            'api': {'containerDefinition': {'name': 'api'}, 'desiredCount': 1},
+            'frontend': {'serviceName': 'frontend', 'dependsOn': ['api'], 'desiredCount': 1}
+        })
+
+    @patch('cloudcrane.controllers.apply_controller.ServiceController')
+    @patch('cloudcrane.controllers.apply_controller.boto3')
+    def test_should_raise_exception_for_unknown_dependency(self, boto3, service_controller):
+        self.write('web.yaml', 'desiredCount: 1\ndependsOn: [api]\n')
+
+        with self.assertRaisesRegex(Exception, r'Unknown dependency of service \[web\]: \[api\]'):
+            ApplyController(locker=self.locker, journal=self.journal).load(self.directory.name)
+
+    @patch('cloudcrane.controllers.apply_controller.ServiceController')
+    @patch('cloudcrane.controllers.apply_controller.boto3')
+    def test_should_apply_plan_in_dependency_order(self, boto3, service_controller):
+        self.write('api.yaml', 'desiredCount: 2\n')
+        self.write('web.yaml', 'desiredCount: 1\ndependsOn: [api]\n')
+        self.write('same.yaml', 'desiredCount: 1\n')
+
+        boto3.client().get_paginator().paginate.return_value = [{'serviceArns': ['same-ARN', 'api-ARN', 'old-ARN']}]
+        boto3.client().describe_services.return_value = {'services': [
+            describe('same', {'desiredCount': 1}),
+            describe('api', {'desiredCount': 2}, desired_count=1),
+            describe('old', {'desiredCount': 1})
+        ]}
+
+        controller = ApplyController(max_workers=1, locker=self.locker, journal=self.journal)
+        plan = controller.apply(cluster_name='test', directory=self.directory.name, region='eu-central-1', prune=True,
+                                wait_healthy=True)
+
+        self.assertEqual([action for action, _, _ in plan], ['scale', 'create', 'delete'])
+        boto3.client().describe_services.assert_called_with(
+            cluster='test',
+            services=['same-ARN', 'api-ARN', 'old-ARN'],
+            include=['TAGS']
+        )
+        controller = service_controller()
+        self.assertEqual(controller.method_calls, [
+            call.scale(cluster_name='test', service_name='api', desired_count=2),
+            call.wait_healthy(cluster_name='test', service_name='api', timeout=600),
+            call.deploy(cluster_name='test', service_name='web', region='eu-central-1',
+                        parameters={'desiredCount': 1}),
+            call.wait_healthy(cluster_name='test', service_name='web', timeout=600),
+            call.delete(cluster_name='test', service_name='old')
+        ])
+
+    @patch('cloudcrane.controllers.apply_controller.ServiceController')
+    @patch('cloudcrane.controllers.apply_controller.boto3')
+    def test_should_skip_dependents_of_failed_services(self, boto3, service_controller):
+        self.write('api.yaml', 'desiredCount: 1\n')
+        self.write('web.yaml', 'desiredCount: 1\ndependsOn: [api]\n')
+
+        boto3.client().get_paginator().paginate.return_value = [{'serviceArns': []}]
+        service_controller().deploy.side_effect = Exception('boom')
+
+        with self.assertRaisesRegex(Exception, r'Applying services failed: \[api, web\]'):
+            controller = ApplyController(locker=self.locker, journal=self.journal)
+            controller.apply(cluster_name='test', directory=self.directory.name, region='eu-central-1')
+
+        service_controller().deploy.assert_called_once()
@@ -0,0 +1,111 @@
+import json
+import yaml
+
+from unittest import TestCase
+from cloudcrane.controllers.cf_template_generator import CfTemplateLoader
+from cloudcrane.controllers.cf_template_generator import render_cf_template
+
+
+class TestCfTemplateGenerator(TestCase):
+
+    def test_should_load_short_form_intrinsic_functions(self):
+        template = yaml.load(
+            'A: !Ref B\nC: !GetAtt D.Arn\nE: !Join\n  - ""\n  - - !Ref F\n    - x\nG: !Base64\n  "Fn::Join": []\n',
+            Loader=CfTemplateLoader
+        )
+
+        self.assertEqual(template, {
+            'A': {'Ref': 'B'},
+            'C': {'Fn::GetAtt': ['D', 'Arn']},
+            'E': {'Fn::Join': ['', [{'Ref': 'F'}, 'x']]},
+            'G': {'Fn::Base64': {'Fn::Join': []}}
+        })
+
+    def test_should_render_both_schemes_with_http_listeners_by_default(self):
+        template = json.loads(render_cf_template())
+
+        self.assertEqual(template['AWSTemplateFormatVersion'], '2010-09-09')
+        for prefix in ['Internal', 'InternetFacing']:
+            self.assertIn('Ecs' + prefix + 'ElasticLoadBalancer', template['Resources'])
+            self.assertIn(prefix + 'TargetGroup', template['Resources'])
+            self.assertIn(prefix + 'LoadBalancerListener', template['Resources'])
+            self.assertIn('Ecs' + prefix + 'ElbName', template['Outputs'])
+        self.assertEqual(
+            template['Resources']['EcsInstanceLt']['Properties']['LaunchTemplateData']['NetworkInterfaces'][0][
+                'Groups'],
+            [{'Ref': 'EcsInternalSecurityGroup'}, {'Ref': 'EcsInternetFacingSecurityGroup'}]
+        )
+        self.assertNotIn('CertificateArn', template['Parameters'])
+        mixed_instances_policy = template['Resources']['EcsInstanceAsg']['Properties']['MixedInstancesPolicy']
+        self.assertNotIn('Overrides', mixed_instances_policy['LaunchTemplate'])
+
+    def test_should_render_only_requested_scheme_and_listeners(self):
+        template = json.loads(render_cf_template(schemes=['internet-facing'], listeners=['http', 'https']))
+
+        resources = template['Resources']
+        self.assertNotIn('EcsInternalElasticLoadBalancer', resources)
+        self.assertNotIn('EcsInternalSecurityGroup', resources)
+        self.assertNotIn('EcsInternalElbName', template['Outputs'])
+        self.assertEqual(resources['InternetFacingHttpsLoadBalancerListener']['Properties']['Certificates'],
+                         [{'CertificateArn': {'Ref': 'CertificateArn'}}])
+        self.assertEqual(len(resources['AlbInternetFacingSecurityGroup']['Properties']['SecurityGroupIngress']), 2)
+        self.assertIn('CertificateArn', template['Parameters'])
+        self.assertEqual(resources['InternetFacingHttpsLoadBalancerListener']['Properties']['SslPolicy'],
+                         {'Ref': 'SslPolicy'})
+
+    def test_should_configure_draining_and_health_checks_from_parameters(self):
+        template = json.loads(render_cf_template(schemes=['internal']))
+
+        target_group = template['Resources']['InternalTargetGroup']['Properties']
+        self.assertEqual(target_group['HealthCheckPath'], {'Ref': 'HealthCheckPath'})
+        self.assertEqual(target_group['TargetGroupAttributes'], [
+            {'Key': 'deregistration_delay.timeout_seconds', 'Value': {'Ref': 'DeregistrationDelay'}}
+        ])
+        self.assertIn(
+            {'Key': 'routing.http2.enabled', 'Value': {'Ref': 'ElbHttp2Enabled'}},
+            template['Resources']['EcsInternalElasticLoadBalancer']['Properties']['LoadBalancerAttributes']
+        )
+
+    def test_should_render_instance_type_overrides_and_capacity_providers(self):
+        template = json.loads(render_cf_template(schemes=['internal'], instance_types=['m5.large', 'c5.large']))
+
+        resources = template['Resources']
+        self.assertEqual(
+            resources['EcsInstanceAsg']['Properties']['MixedInstancesPolicy']['LaunchTemplate']['Overrides'],
+            [{'InstanceType': 'm5.large'}, {'InstanceType': 'c5.large'}]
+        )
+        self.assertEqual(resources['EcsClusterCapacityProviders']['Properties']['CapacityProviders'],
+                         ['FARGATE', 'FARGATE_SPOT', {'Ref': 'EcsCapacityProvider'}])
+        self.assertEqual(template['Outputs']['EcsInternalSecurityGroupId']['Value'],
+                         {'Ref': 'EcsInternalSecurityGroup'})
+        self.assertIn('EcsSubnets', template['Outputs'])
+
+    def test_should_render_warm_pool_without_mixed_instances_policy(self):
+        template = json.loads(render_cf_template(schemes=['internal'], warm_pool=True))
+
+        asg = template['Resources']['EcsInstanceAsg']['Properties']
+        self.assertIn('EcsInstanceWarmPool', template['Resources'])
+        self.assertNotIn('MixedInstancesPolicy', asg)
+        self.assertEqual(asg['LaunchTemplate']['LaunchTemplateId'], {'Ref': 'EcsInstanceLt'})
+        self.assertNotIn('OnDemandPercentageAboveBaseCapacity', template['Parameters'])
+
+        template = json.loads(render_cf_template(schemes=['internal']))
+
+        self.assertNotIn('EcsInstanceWarmPool', template['Resources'])
+        self.assertIn('MixedInstancesPolicy', template['Resources']['EcsInstanceAsg']['Properties'])
+
+    def test_should_raise_exception_for_warm_pool_with_instance_types(self):
+        with self.assertRaisesRegex(Exception, 'Warm pools cannot be combined with multiple instance types'):
+            render_cf_template(instance_types=['m5.large'], warm_pool=True)
+
+    def test_should_cache_rendered_templates_by_options(self):
+        self.assertIs(render_cf_template(schemes=['internal', 'internal']), render_cf_template(schemes=['internal']))
+        self.assertNotEqual(render_cf_template(schemes=['internal']), render_cf_template())
+
+    def test_should_raise_exception_for_unknown_scheme(self):
+        with self.assertRaisesRegex(Exception, r'Unknown load balancer scheme: \[external\]'):
+            render_cf_template(schemes=['external'])
+
+    def test_should_raise_exception_for_unknown_listener(self):
+        with self.assertRaisesRegex(Exception, r'Unknown listener: \[tcp\]'):
+            render_cf_template(listeners=['tcp'])
@@ -1,13 +1,25 @@
 import io
+import tempfile
 
 from unittest.mock import patch
 from unittest import TestCase
 
 from cloudcrane.cli import cli
+from cloudcrane.locking import NullLocker
 
 
 class TestCLI(TestCase):
 
+    def setUp(self):
+        # lock files and journals of the commands go to the private directory of the user, here a temporary one
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch('cloudcrane.files.tempfile.gettempdir', return_value=self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
     @patch('sys.stdout', new_callable=io.StringIO)
     def test_should_return_help_page(self, out):
         with self.assertRaises(SystemExit) as ex:
@@ -48,6 +60,16 @@ class TestCLI(TestCase):
         self.assertEqual(ex.exception.code, 0)
         boto3.client().delete_cluster.assert_called()
 
+    @patch('cloudcrane.cli.DynamoDbLeaseStore')
+    @patch('cloudcrane.cli.ClusterController')
+    def test_should_not_take_locks_in_dry_run(self, cluster_controller, lease_store):
+        with self.assertRaises(SystemExit) as ex:
+            cli(['cluster', '--dry-run', '--lock-table=cloudcrane-locks', 'delete'])
+
+        self.assertEqual(ex.exception.code, 0)
+        self.assertIsInstance(cluster_controller.call_args[1]['locker'], NullLocker)
+        lease_store.assert_not_called()
+
     @patch('cloudcrane.controllers.cluster_controller.boto3')
     def test_should_execute_cluster_list(self, boto3):
         with self.assertRaises(SystemExit) as ex:
@@ -78,8 +100,9 @@ class TestCLI(TestCase):
 
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_execute_service_deletion(self, boto3):
-        boto3.client().list_services.return_value = {'serviceArns': ['test-1-ARN']}
-        boto3.client().describe_services.return_value = {'services': [{'serviceName': 'test-1', 'runningCount': 0}]}
+        boto3.client().describe_services.return_value = {'services': [{
+            'serviceName': 'test-1', 'status': 'ACTIVE', 'runningCount': 0
+        }]}
 
         with self.assertRaises(SystemExit) as ex:
             cli(['service', '--application=test', '--version=1', 'delete'])
@@ -87,11 +110,64 @@ class TestCLI(TestCase):
         self.assertEqual(ex.exception.code, 0)
         boto3.client().delete_service.assert_called()
 
+    @patch('cloudcrane.cli.ServiceController')
+    def test_should_execute_service_scaling(self, service_controller):
+        with self.assertRaises(SystemExit) as ex:
+            cli(['service', '--services=api-*,web', '--count=-1', '--wait', 'scale'])
+
+        self.assertEqual(ex.exception.code, 0)
+        service_controller().scale_services.assert_called_with(cluster_name='default', patterns=['api-*', 'web'],
+                                                               count='-1', max_workers=10, wait=True, timeout=600)
+
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_execute_service_list(self, boto3):
         with self.assertRaises(SystemExit) as ex:
             cli(['service', 'list'])
 
         self.assertEqual(ex.exception.code, 0)
-        boto3.client().list_services.assert_called()
+        boto3.client().get_paginator.assert_called_with('list_services')
+
+    @patch('cloudcrane.cli.ServiceController')
+    def test_should_roll_back_service_when_deployment_does_not_become_healthy(self, service_controller):
+        service_controller().wait_healthy.side_effect = Exception('Timeout')
+
+        with self.assertRaises(SystemExit) as ex:
+            cli(['service', '--application=test', '--version=1', '--parameters=example.yaml', '--wait-healthy',
+                 'deploy'])
+
+        self.assertEqual(ex.exception.code, 1)
+        service_controller().rollback.assert_called_with(cluster_name='default', service_name='test-1')
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_execute_service_rollback(self, boto3):
+        boto3.client().describe_services.return_value = {
+            'services': [
+                {
+                    'serviceName': 'test', 'status': 'ACTIVE',
+                    'serviceArn': 'test-ARN', 'taskDefinition': 'test:2', 'desiredCount': 1
+                }
+            ]
+        }
+        boto3.client().list_tags_for_resource.return_value = {
+            'tags': [
+                {'key': 'cloudcrane:previous-task-definition', 'value': 'test:1'},
+                {'key': 'cloudcrane:previous-desired-count', 'value': '1'}
+            ]
+        }
+
+        with self.assertRaises(SystemExit) as ex:
+            cli(['service', '--application=test', 'rollback'])
+
+        self.assertEqual(ex.exception.code, 0)
+        boto3.client().update_service.assert_called_with(
+            cluster='default', service='test', taskDefinition='test:1', desiredCount=1
+        )
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.inventory_controller.boto3')
+    def test_should_require_snapshots_for_inventory_diff(self, boto3, out):
+        with self.assertRaises(SystemExit) as ex:
+            cli(['inventory', '--old=old.jsonl', 'diff'])
 
+        self.assertEqual(ex.exception.code, 1)
+        self.assertIn('Possible commands: snapshot, diff', out.getvalue())
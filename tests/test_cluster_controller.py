@@ -1,28 +1,46 @@
+import json
 import random
 import string
+import tempfile
 
 from datetime import datetime
 from unittest.mock import ANY
 from unittest.mock import patch
 from unittest import TestCase
 from cloudcrane.controllers.cluster_controller import ClusterController
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
 
 
 class TestClusterController(TestCase):
 
     def setUp(self):
-        pass
+        self.directory = tempfile.TemporaryDirectory()
+        self.locker = Locker(directory=self.directory.name)
+        self.journal = Journal(directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch('cloudcrane.controllers.cluster_controller.limit_rate')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_rate_limit_all_clients(self, boto3, limit_rate):
+        ClusterController(locker=self.locker, journal=self.journal)
+
+        self.assertEqual(sorted(i[0][1] for i in limit_rate.call_args_list), ['cloudformation', 'cloudwatch', 'ecs'])
 
     @patch('cloudcrane.controllers.cluster_controller.boto3')
     def test_should_create_ecs_cluster(self, boto3):
-        controller = ClusterController()
+        controller = ClusterController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
         ami = ''.join(random.choices(string.ascii_letters, k=10))
         instance_type = ''.join(random.choices(string.ascii_letters, k=10))
         instances = random.randint(1, 100)
+        min_instances = random.randint(1, 100)
+        target_utilization = random.randint(1, 100)
 
-        controller.create(cluster_name, ami, instance_type, instances)
+        controller.create(cluster_name, ami, instance_type, instances, min_instances, target_utilization)
 
         boto3.client().create_cluster.assert_called_with(clusterName=cluster_name)
         boto3.client().create_stack.assert_called_with(
@@ -32,7 +50,10 @@ class TestClusterController(TestCase):
                 {'ParameterKey': 'EcsClusterName', 'ParameterValue': cluster_name},
                 {'ParameterKey': 'EcsAmiId', 'ParameterValue': ami},
                 {'ParameterKey': 'EcsInstanceType', 'ParameterValue': instance_type},
-                {'ParameterKey': 'AsgMaxSize', 'ParameterValue': instances}
+                {'ParameterKey': 'AsgMaxSize', 'ParameterValue': instances},
+                {'ParameterKey': 'AsgMinSize', 'ParameterValue': min_instances},
+                {'ParameterKey': 'CpuReservationTarget', 'ParameterValue': target_utilization},
+                {'ParameterKey': 'MemoryReservationTarget', 'ParameterValue': target_utilization}
             ],
             DisableRollback=False,
             NotificationARNs=[],
@@ -47,9 +68,136 @@ class TestClusterController(TestCase):
             ]
         )
 
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_scale_cluster_on_reservation(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        controller.create('test', 'ami', 't2.micro', '5')
+
+        resources = json.loads(boto3.client().create_stack.call_args[1]['TemplateBody'])['Resources']
+        self.assertEqual(resources['EcsInstanceAsg']['Properties']['MinSize'], {'Ref': 'AsgMinSize'})
+        self.assertNotIn('DesiredCapacity', resources['EcsInstanceAsg']['Properties'])
+        self.assertEqual(
+            resources['EcsCpuReservationScalingPolicy']['Properties']['TargetTrackingConfiguration']
+            ['CustomizedMetricSpecification']['MetricName'],
+            'CPUReservation'
+        )
+        self.assertEqual(
+            resources['EcsMemoryReservationScalingPolicy']['Properties']['TargetTrackingConfiguration']
+            ['CustomizedMetricSpecification']['MetricName'],
+            'MemoryReservation'
+        )
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_create_cluster_with_single_scheme_and_https_listener(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        controller.create('test', 'ami', 't2.micro', '1', schemes=['internal'], listeners=['https'],
+                          certificate_arn='arn:aws:acm:eu-central-1:1:certificate/1')
+
+        kwargs = boto3.client().create_stack.call_args[1]
+        self.assertIn(
+            {'ParameterKey': 'CertificateArn', 'ParameterValue': 'arn:aws:acm:eu-central-1:1:certificate/1'},
+            kwargs['Parameters']
+        )
+        resources = json.loads(kwargs['TemplateBody'])['Resources']
+        self.assertIn('InternalHttpsLoadBalancerListener', resources)
+        self.assertNotIn('EcsInternetFacingElasticLoadBalancer', resources)
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_pass_load_balancer_settings_as_stack_parameters(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        controller.create('test', 'ami', 't2.micro', '1', http2=False, idle_timeout=120, deregistration_delay=15,
+                          health_check_path='/health', ssl_policy='ELBSecurityPolicy-2016-08')
+
+        parameters = boto3.client().create_stack.call_args[1]['Parameters']
+        self.assertIn({'ParameterKey': 'ElbHttp2Enabled', 'ParameterValue': 'false'}, parameters)
+        self.assertIn({'ParameterKey': 'ElbIdleTimeout', 'ParameterValue': '120'}, parameters)
+        self.assertIn({'ParameterKey': 'DeregistrationDelay', 'ParameterValue': '15'}, parameters)
+        self.assertIn({'ParameterKey': 'HealthCheckPath', 'ParameterValue': '/health'}, parameters)
+        self.assertNotIn('SslPolicy', [parameter['ParameterKey'] for parameter in parameters])
+        self.assertNotIn('HealthyThresholdCount', [parameter['ParameterKey'] for parameter in parameters])
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_create_cluster_with_mixed_on_demand_and_spot_instances(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        controller.create('test', 'ami', 'm5.large', '4', instance_types=['m5.large', 'm5a.large'], on_demand_base=1,
+                          on_demand_percentage=25, spot_allocation_strategy='capacity-optimized')
+
+        kwargs = boto3.client().create_stack.call_args[1]
+        self.assertIn({'ParameterKey': 'OnDemandBaseCapacity', 'ParameterValue': '1'}, kwargs['Parameters'])
+        self.assertIn({'ParameterKey': 'OnDemandPercentageAboveBaseCapacity', 'ParameterValue': '25'},
+                      kwargs['Parameters'])
+        self.assertIn({'ParameterKey': 'SpotAllocationStrategy', 'ParameterValue': 'capacity-optimized'},
+                      kwargs['Parameters'])
+        asg = json.loads(kwargs['TemplateBody'])['Resources']['EcsInstanceAsg']['Properties']
+        self.assertEqual(asg['MixedInstancesPolicy']['LaunchTemplate']['Overrides'],
+                         [{'InstanceType': 'm5.large'}, {'InstanceType': 'm5a.large'}])
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_create_cluster_with_warm_pool_and_agent_settings(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        controller.create('test', 'ami', 't3.medium', '4', warm_pool_size=2, warm_pool_state='Hibernated',
+                          image_pull_behavior='prefer-cached', agent_settings=['ECS_IMAGE_MINIMUM_CLEANUP_AGE=24h'])
+
+        kwargs = boto3.client().create_stack.call_args[1]
+        self.assertIn({'ParameterKey': 'WarmPoolMinSize', 'ParameterValue': '2'}, kwargs['Parameters'])
+        self.assertIn({'ParameterKey': 'WarmPoolState', 'ParameterValue': 'Hibernated'}, kwargs['Parameters'])
+        self.assertIn({'ParameterKey': 'EcsImagePullBehavior', 'ParameterValue': 'prefer-cached'},
+                      kwargs['Parameters'])
+        self.assertIn({'ParameterKey': 'EcsAgentSettings', 'ParameterValue': 'ECS_IMAGE_MINIMUM_CLEANUP_AGE=24h'},
+                      kwargs['Parameters'])
+        resources = json.loads(kwargs['TemplateBody'])['Resources']
+        self.assertEqual(resources['EcsInstanceWarmPool']['Condition'], 'UseWarmPool')
+        self.assertNotIn('MixedInstancesPolicy', resources['EcsInstanceAsg']['Properties'])
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_raise_exception_for_warm_pool_with_spot_instances(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        with self.assertRaisesRegex(Exception, 'Warm pools cannot be combined with instance types or Spot instances'):
+            controller.create('test', 'ami', 't3.medium', '4', warm_pool_size=2, on_demand_percentage=50)
+        with self.assertRaisesRegex(Exception, 'Warm pools cannot be combined with instance types or Spot instances'):
+            controller.create('test', 'ami', 't3.medium', '4', warm_pool_size=2, instance_types=['m5.large'])
+
+        boto3.client().create_cluster.assert_not_called()
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_raise_exception_for_invalid_agent_setting(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        with self.assertRaisesRegex(Exception, r'Invalid ECS agent setting: \[ECS_A=1,ECS_B=2\]'):
+            controller.create('test', 'ami', 't2.micro', '1', agent_settings=['ECS_A=1,ECS_B=2'])
+
+        boto3.client().create_cluster.assert_not_called()
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_raise_exception_for_https_listener_without_certificate(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        with self.assertRaisesRegex(Exception, 'HTTPS listeners require a certificate ARN'):
+            controller.create('test', 'ami', 't2.micro', '1', listeners=['http', 'https'])
+
+        boto3.client().create_cluster.assert_not_called()
+        boto3.client().create_stack.assert_not_called()
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_resume_interrupted_cluster_creation(self, boto3):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory=directory)
+            journal.operation('cluster-create/test').complete('create-cluster')
+
+            ClusterController(locker=self.locker, journal=journal).create('test', 'ami', 't2.micro', '1', resume=True)
+
+            boto3.client().create_cluster.assert_not_called()
+            boto3.client().create_stack.assert_called_once()
+
     @patch('cloudcrane.controllers.cluster_controller.boto3')
     def test_should_delete_ecs_cluster(self, boto3):
-        controller = ClusterController()
+        controller = ClusterController(locker=self.locker, journal=self.journal)
 
         controller.delete('test')
 
@@ -59,7 +207,7 @@ class TestClusterController(TestCase):
     @patch('cloudcrane.controllers.cluster_controller.clickclick.console')
     @patch('cloudcrane.controllers.cluster_controller.boto3')
     def test_should_list_all_ecs_clusters_sorted_by_name(self, boto3, console):
-        controller = ClusterController()
+        controller = ClusterController(locker=self.locker, journal=self.journal)
 
         boto3.client().list_stacks.return_value = {
             'StackSummaries': [
@@ -103,7 +251,7 @@ class TestClusterController(TestCase):
 
     @patch('cloudcrane.controllers.cluster_controller.boto3')
     def test_should_filter_deleted_ecs_clusters(self, boto3):
-        controller = ClusterController()
+        controller = ClusterController(locker=self.locker, journal=self.journal)
 
         stack_status_filter = [
             'CREATE_IN_PROGRESS',
@@ -128,3 +276,60 @@ class TestClusterController(TestCase):
         controller.list(all=False)
 
         boto3.client().list_stacks.assert_called_with(StackStatusFilter=stack_status_filter)
+
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_report_cluster_usage(self, boto3):
+        controller = ClusterController(locker=self.locker, journal=self.journal)
+
+        cluster_name = ''.join(random.choice(string.ascii_lowercase) for _ in range(10))
+
+        boto3.client().get_paginator().paginate.side_effect = [
+            [{'containerInstanceArns': ['instance-1']}],
+            [{'serviceArns': ['service-1']}],
+            [{'MetricDataResults': [
+                {'Id': 'm0', 'Values': [10.0, 30.0]},
+                {'Id': 'm1', 'Values': []}
+            ]}]
+        ]
+        boto3.client().describe_container_instances.return_value = {
+            'containerInstances': [{
+                'ec2InstanceId': 'i-1',
+                'attributes': [{'name': 'ecs.instance-type', 'value': 't3.medium'}],
+                'runningTasksCount': 2,
+                'registeredResources': [
+                    {'name': 'CPU', 'integerValue': 2048},
+                    {'name': 'MEMORY', 'integerValue': 3700},
+                    {'name': 'PORTS', 'stringSetValue': ['22']}
+                ],
+                'remainingResources': [
+                    {'name': 'CPU', 'integerValue': 1536},
+                    {'name': 'MEMORY', 'integerValue': 1850}
+                ]
+            }]
+        }
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'my-app', 'runningCount': 2, 'desiredCount': 2}]
+        }
+
+        usage = controller.usage(cluster_name=cluster_name, target_utilization='75')
+
+        boto3.client().describe_container_instances.assert_called_with(
+            cluster=cluster_name,
+            containerInstances=['instance-1']
+        )
+        self.assertEqual(usage['instances'], [{
+            'instance': 'i-1',
+            'instance_type': 't3.medium',
+            'tasks': 2,
+            'cpu': 25.0,
+            'memory': 50.0
+        }])
+        self.assertEqual(usage['services'], [{
+            'service_name': 'my-app',
+            'tasks': '2/2',
+            'cpu_utilization': '20.0%',
+            'memory_utilization': ''
+        }])
+        self.assertEqual(usage['cpu_reservation'], 25.0)
+        self.assertEqual(usage['memory_reservation'], 50.0)
+        self.assertEqual(usage['suggestion'], ('c5.large', 1))
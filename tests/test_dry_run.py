@@ -0,0 +1,80 @@
+import boto3
+import io
+import os
+
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.controllers.cluster_controller import ClusterController
+from cloudcrane.dry_run import CallRecorder
+from cloudcrane.dry_run import record_calls
+from cloudcrane.rate_limiter import limit_rate
+
+AWS_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'eu-central-1',
+    'AWS_ACCESS_KEY_ID': 'dry-run',
+    'AWS_SECRET_ACCESS_KEY': 'dry-run'
+}
+
+
+class TestDryRun(TestCase):
+
+    @patch.dict(os.environ, AWS_ENVIRONMENT)
+    def test_should_record_writes_and_return_stub_response(self):
+        recorder = CallRecorder()
+        client = record_calls(boto3.client('ecs'), recorder)
+
+        response = client.register_task_definition(family='app', containerDefinitions=[{'name': 'app'}])
+
+        self.assertEqual(response['taskDefinition']['taskDefinitionArn'], 'dry-run')
+        self.assertEqual(recorder.calls, [
+            ('ecs', 'RegisterTaskDefinition', {'family': 'app', 'containerDefinitions': [{'name': 'app'}]}, True)
+        ])
+
+    @patch.dict(os.environ, AWS_ENVIRONMENT)
+    @patch('cloudcrane.rate_limiter.RateLimiter.acquire')
+    def test_should_not_rate_limit_recorded_writes(self, acquire):
+        client = record_calls(limit_rate(boto3.client('cloudformation'), 'cloudformation'), CallRecorder())
+
+        for _ in range(20):
+            client.delete_stack(StackName='test')
+
+        acquire.assert_not_called()
+
+    @patch.dict(os.environ, AWS_ENVIRONMENT)
+    def test_should_record_cluster_creation_without_sending_it(self):
+        recorder = CallRecorder()
+
+        ClusterController(recorder=recorder).create('test', 'ami', 't2.micro', '1')
+
+        self.assertEqual([(service_name, operation_name) for service_name, operation_name, _, _ in recorder.calls], [
+            ('ecs', 'CreateCluster'),
+            ('cloudformation', 'CreateStack')
+        ])
+
+    def test_should_estimate_duration_from_rate_limits(self):
+        recorder = CallRecorder()
+        for _ in range(10):
+            recorder.record('cloudformation', 'CreateStack', {}, True)
+        recorder.record('ecs', 'ListServices', {}, False)
+
+        estimate = recorder.estimate()
+
+        self.assertEqual(estimate['services']['cloudformation'], {
+            'calls': 10, 'rate': 5.0, 'seconds': 2.0, 'throttled': True
+        })
+        self.assertFalse(estimate['services']['ecs']['throttled'])
+        self.assertEqual(estimate['seconds'], 2.05)
+
+    def test_should_print_plan_and_estimate(self):
+        recorder = CallRecorder()
+        recorder.record('ecs', 'DescribeServices', {'cluster': 'test'}, False)
+        recorder.record('ecs', 'UpdateService', {'cluster': 'test', 'service': 'app'}, True)
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            recorder.print_report()
+
+        self.assertIn('ecs.UpdateService', output.getvalue())
+        self.assertIn('cluster=test, service=app', output.getvalue())
+        self.assertIn('Estimated duration: 0.1s', output.getvalue())
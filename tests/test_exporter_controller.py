@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.controllers.exporter_controller import ExporterController
+
+
+class TestExporterController(TestCase):
+
+    def mock_account(self, boto3):
+        pages = {
+            'list_stacks': [{'StackSummaries': [
+                {'StackName': 'prod', 'StackStatus': 'UPDATE_IN_PROGRESS'},
+                {'StackName': 'other-stack', 'StackStatus': 'CREATE_COMPLETE'}
+            ]}],
+            'list_clusters': [{'clusterArns': ['arn:aws:ecs:eu-central-1:1:cluster/prod',
+                                               'arn:aws:ecs:eu-central-1:1:cluster/manual']}],
+            'list_services': [{'serviceArns': ['app-ARN', 'old-ARN']}]
+        }
+        boto3.client().get_paginator.side_effect = lambda name: type('Paginator', (), {
+            'paginate': lambda self, **kwargs: pages[name]
+        })()
+        boto3.client().describe_services.return_value = {'services': [{
+            'clusterArn': 'arn:aws:ecs:eu-central-1:1:cluster/prod',
+            'serviceName': 'app',
+            'status': 'ACTIVE',
+            'desiredCount': 3,
+            'runningCount': 2,
+            'pendingCount': 1,
+            'deployments': [{'status': 'PRIMARY'}, {'status': 'ACTIVE'}]
+        }, {
+            'clusterArn': 'arn:aws:ecs:eu-central-1:1:cluster/prod',
+            'serviceName': 'old',
+            'status': 'DRAINING',
+            'desiredCount': 0,
+            'runningCount': 0,
+            'pendingCount': 0
+        }]}
+
+    @patch('cloudcrane.controllers.exporter_controller.boto3')
+    def test_should_export_state_of_cloudcrane_clusters(self, boto3):
+        self.mock_account(boto3)
+        controller = ExporterController()
+
+        controller.refresh()
+        text = controller.render()
+
+        self.assertIn('cloudcrane_cluster_stack_status{cluster="prod",status="UPDATE_IN_PROGRESS"} 1', text)
+        self.assertNotIn('cluster="manual"', text)
+        self.assertIn('cloudcrane_service_desired_tasks{cluster="prod",service="app"} 3', text)
+        self.assertIn('cloudcrane_service_running_tasks{cluster="prod",service="app"} 2', text)
+        self.assertIn('cloudcrane_service_pending_tasks{cluster="prod",service="app"} 1', text)
+        self.assertIn('cloudcrane_service_deployments{cluster="prod",service="app"} 2', text)
+        self.assertNotIn('service="old"', text)
+        self.assertIn('cloudcrane_refresh_errors_total 0', text)
+        boto3.client().describe_services.assert_called_once_with(cluster='prod', services=['app-ARN', 'old-ARN'])
+
+    @patch('cloudcrane.controllers.exporter_controller.boto3')
+    def test_should_keep_last_state_when_refresh_fails(self, boto3):
+        self.mock_account(boto3)
+        controller = ExporterController()
+        controller.refresh()
+
+        boto3.client().describe_services.side_effect = Exception('Rate exceeded')
+        controller.refresh()
+        text = controller.render()
+
+        self.assertIn('cloudcrane_service_running_tasks{cluster="prod",service="app"} 2', text)
+        self.assertIn('cloudcrane_refresh_errors_total 1', text)
@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.files import get_user_directory
+
+
+class TestFiles(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch('cloudcrane.files.tempfile')
+    def test_should_create_user_directory_only_the_user_can_access(self, tempfile):
+        tempfile.gettempdir.return_value = self.directory.name
+
+        path = get_user_directory('locks')
+
+        self.assertEqual(path, os.path.join(self.directory.name, 'cloudcrane-{0}'.format(os.getuid()), 'locks'))
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+
+    @patch('cloudcrane.files.tempfile')
+    def test_should_reject_user_directory_accessible_to_others(self, tempfile):
+        tempfile.gettempdir.return_value = self.directory.name
+        # e.g. created by another user before the first run
+        os.mkdir(os.path.join(self.directory.name, 'cloudcrane-{0}'.format(os.getuid())), mode=0o777)
+        os.chmod(os.path.join(self.directory.name, 'cloudcrane-{0}'.format(os.getuid())), 0o777)
+
+        with self.assertRaisesRegex(Exception, 'must be owned by and only accessible to the current user'):
+            get_user_directory('locks')
@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.images import ImageResolver
+from cloudcrane.images import get_ecr_registries
+
+REGISTRY = '123456789012.dkr.ecr.eu-central-1.amazonaws.com'
+DIGEST = 'sha256:' + 'a' * 64
+
+
+class TestImages(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.directory.name, 'digests.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch('cloudcrane.images.boto3')
+    def test_should_pin_ecr_images_to_digests(self, boto3):
+        boto3.client().describe_images.return_value = {'imageDetails': [
+            {'imageDigest': DIGEST, 'imageTags': ['1.0', 'latest']}
+        ]}
+
+        pinned = ImageResolver(cache_file=self.cache_file).resolve([
+            REGISTRY + '/my-app:latest',
+            REGISTRY + '/my-app',
+            REGISTRY + '/my-app@' + DIGEST,
+            'repository/my-app:latest'
+        ])
+
+        self.assertEqual(pinned, {
+            REGISTRY + '/my-app:latest': REGISTRY + '/my-app@' + DIGEST,
+            REGISTRY + '/my-app': REGISTRY + '/my-app@' + DIGEST,
+            REGISTRY + '/my-app@' + DIGEST: REGISTRY + '/my-app@' + DIGEST,
+            'repository/my-app:latest': 'repository/my-app:latest'
+        })
+        boto3.client().describe_images.assert_called_once_with(
+            registryId='123456789012',
+            repositoryName='my-app',
+            imageIds=[{'imageTag': 'latest'}]
+        )
+
+    @patch('cloudcrane.images.boto3')
+    def test_should_cache_digests_in_file(self, boto3):
+        boto3.client().describe_images.return_value = {'imageDetails': [
+            {'imageDigest': DIGEST, 'imageTags': ['1.0']}
+        ]}
+        ImageResolver(cache_file=self.cache_file).resolve([REGISTRY + '/my-app:1.0'])
+
+        pinned = ImageResolver(cache_file=self.cache_file).resolve([REGISTRY + '/my-app:1.0'])
+        ImageResolver(cache_file=self.cache_file, cache_ttl=0).resolve([REGISTRY + '/my-app:1.0'])
+
+        self.assertEqual(pinned, {REGISTRY + '/my-app:1.0': REGISTRY + '/my-app@' + DIGEST})
+        self.assertEqual(boto3.client().describe_images.call_count, 2)
+
+    @patch('cloudcrane.files.tempfile.gettempdir')
+    @patch('cloudcrane.images.boto3')
+    def test_should_cache_digests_in_private_directory_of_user(self, boto3, gettempdir):
+        gettempdir.return_value = self.directory.name
+        boto3.client().describe_images.return_value = {'imageDetails': [
+            {'imageDigest': DIGEST, 'imageTags': ['1.0']}
+        ]}
+
+        ImageResolver().resolve([REGISTRY + '/my-app:1.0'])
+
+        directory = os.path.join(self.directory.name, 'cloudcrane-{0}'.format(os.getuid()), 'cache')
+        self.assertEqual(os.listdir(directory), ['image-digests.json'])
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+    @patch('cloudcrane.images.boto3')
+    def test_should_raise_exception_for_unknown_tag(self, boto3):
+        boto3.client().describe_images.return_value = {'imageDetails': []}
+
+        with self.assertRaisesRegex(Exception, r'Image not found in ECR: \[.*/my-app:2.0\]'):
+            ImageResolver(cache_file=self.cache_file).resolve([REGISTRY + '/my-app:2.0'])
+
+    def test_should_get_ecr_registries_of_images(self):
+        self.assertEqual(get_ecr_registries([REGISTRY + '/a:1', REGISTRY + '/b@' + DIGEST, 'nginx:latest']), [
+            (REGISTRY, 'eu-central-1')
+        ])
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+
+from unittest.mock import ANY
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.controllers.inventory_controller import InventoryController
+
+
+class TestInventoryController(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def mock_account(self, boto3):
+        pages = {
+            'list_stacks': [{'StackSummaries': [
+                {'StackName': 'prod', 'StackStatus': 'CREATE_COMPLETE'},
+                {'StackName': 'other-stack', 'StackStatus': 'CREATE_COMPLETE'}
+            ]}],
+            'list_clusters': [{'clusterArns': ['arn:aws:ecs:eu-central-1:1:cluster/prod']},
+                              {'clusterArns': ['arn:aws:ecs:eu-central-1:1:cluster/manual']}],
+            'list_services': [{'serviceArns': ['app-ARN']}]
+        }
+        boto3.client().get_paginator.side_effect = lambda name: type('Paginator', (), {
+            'paginate': lambda self, **kwargs: pages[name]
+        })()
+        boto3.client().describe_services.return_value = {'services': [{
+            'clusterArn': 'arn:aws:ecs:eu-central-1:1:cluster/prod',
+            'serviceName': 'app',
+            'status': 'ACTIVE',
+            'taskDefinition': 'app:1',
+            'desiredCount': 2,
+            'runningCount': 2,
+            'launchType': 'EC2',
+            'loadBalancers': [{'targetGroupArn': 'tg-ARN'}]
+        }]}
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {
+            'taskDefinitionArn': 'app:1',
+            'containerDefinitions': [{'name': 'app', 'image': 'app:latest', 'cpu': 128, 'memory': 256}]
+        }}
+        boto3.client().describe_target_groups.return_value = {'TargetGroups': [{
+            'TargetGroupArn': 'tg-ARN',
+            'TargetGroupName': 'prod-internal-tg',
+            'Port': 80,
+            'HealthCheckPath': '/',
+            'LoadBalancerArns': ['alb-ARN']
+        }]}
+
+    @patch('cloudcrane.controllers.inventory_controller.boto3')
+    def test_should_crawl_cloudcrane_clusters_only(self, boto3):
+        self.mock_account(boto3)
+        controller = InventoryController()
+
+        records = controller.crawl()
+
+        self.assertEqual([(record['kind'], record['id']) for record in records], [
+            ('cluster', 'prod'),
+            ('service', 'prod/app'),
+            ('target-group', 'tg-ARN'),
+            ('task-definition', 'app:1')
+        ])
+        boto3.client().describe_services.assert_called_once_with(cluster='prod', services=['app-ARN'])
+        boto3.client().describe_target_groups.assert_called_once_with(TargetGroupArns=['tg-ARN'])
+
+    @patch('cloudcrane.controllers.inventory_controller.boto3')
+    def test_should_write_snapshot_as_json_lines(self, boto3):
+        self.mock_account(boto3)
+        controller = InventoryController()
+        output = os.path.join(self.directory.name, 'inventory.jsonl')
+
+        controller.snapshot(output=output)
+
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0]), {'kind': 'cluster', 'id': 'prod', 'stackStatus': 'CREATE_COMPLETE'})
+
+    @patch('cloudcrane.controllers.inventory_controller.clickclick.console')
+    @patch('cloudcrane.controllers.inventory_controller.boto3')
+    def test_should_show_differences_between_snapshots(self, boto3, console):
+        controller = InventoryController()
+        old = os.path.join(self.directory.name, 'old.jsonl')
+        new = os.path.join(self.directory.name, 'new.jsonl')
+        with open(old, 'w') as f:
+            f.write('{"kind":"cluster","id":"prod","stackStatus":"CREATE_COMPLETE"}\n')
+            f.write('{"kind":"service","id":"prod/app","desiredCount":2,"taskDefinition":"app:1"}\n')
+            f.write('{"kind":"service","id":"prod/old","desiredCount":1}\n')
+        with open(new, 'w') as f:
+            f.write('{"kind":"cluster","id":"prod","stackStatus":"CREATE_COMPLETE"}\n')
+            f.write('{"kind":"service","id":"prod/app","desiredCount":3,"taskDefinition":"app:2"}\n')
+            f.write('{"kind":"service","id":"prod/new","desiredCount":1}\n')
+
+        controller.diff(old=old, new=new)
+
+        console.print_table.assert_called_with(
+            ['change', 'kind', 'id', 'fields'],
+            [
+                {'change': 'CHANGED', 'kind': 'service', 'id': 'prod/app', 'fields': 'desiredCount, taskDefinition'},
+                {'change': 'ADDED', 'kind': 'service', 'id': 'prod/new', 'fields': ''},
+                {'change': 'REMOVED', 'kind': 'service', 'id': 'prod/old', 'fields': ''}
+            ],
+            styles=ANY,
+            titles={}
+        )
@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+from unittest import TestCase
+from cloudcrane.journal import Journal
+
+
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_resume_after_completed_steps(self):
+        journal = Journal(directory=self.directory.name)
+        operation = journal.operation('service-delete/test/app')
+        operation.complete('describe', {'targetGroupArns': ['tg-ARN']})
+        operation.complete('scale-down')
+
+        resumed = journal.operation('service-delete/test/app', resume=True)
+
+        self.assertTrue(resumed.done('scale-down'))
+        self.assertFalse(resumed.done('drain'))
+        self.assertEqual(resumed.data('describe'), {'targetGroupArns': ['tg-ARN']})
+
+    def test_should_discard_journal_without_resume(self):
+        journal = Journal(directory=self.directory.name)
+        journal.operation('cluster-create/test').complete('create-cluster')
+
+        self.assertFalse(journal.operation('cluster-create/test').done('create-cluster'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_should_ignore_partly_written_entry(self):
+        journal = Journal(directory=self.directory.name)
+        journal.operation('cluster-create/test').complete('create-cluster')
+        with open(os.path.join(self.directory.name, 'cluster-create_test.jsonl'), 'a') as f:
+            f.write('{"step": "create-st')
+
+        operation = journal.operation('cluster-create/test', resume=True)
+
+        self.assertTrue(operation.done('create-cluster'))
+        self.assertFalse(operation.done('create-stack'))
+
+    def test_should_not_write_read_only_journal(self):
+        journal = Journal(directory=self.directory.name)
+        journal.operation('cluster-create/test').complete('create-cluster')
+
+        operation = Journal(directory=self.directory.name, read_only=True).operation('cluster-create/test', resume=True)
+        operation.complete('create-stack')
+        operation.finish()
+
+        self.assertFalse(journal.operation('cluster-create/test', resume=True).done('create-stack'))
+
+    def test_should_not_follow_symlink_in_place_of_journal(self):
+        target = os.path.join(self.directory.name, 'target')
+        os.symlink(target, os.path.join(self.directory.name, 'cluster-create_test.jsonl'))
+        operation = Journal(directory=self.directory.name).operation('cluster-create/test', resume=True)
+
+        with self.assertRaises(OSError):
+            operation.complete('create-cluster')
+        self.assertFalse(os.path.exists(target))
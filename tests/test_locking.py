@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import time
+
+from unittest.mock import MagicMock
+from unittest import TestCase
+from cloudcrane.locking import LeaseLock
+from cloudcrane.locking import Locker
+from cloudcrane.locking import MemoryLeaseStore
+
+
+class TestLocking(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_increase_fencing_token_with_every_acquisition(self):
+        store = MemoryLeaseStore()
+
+        self.assertEqual(store.acquire('service/test/app', 'a', 60), 1)
+        self.assertIsNone(store.acquire('service/test/app', 'b', 60))
+        store.release('service/test/app', 'a', 1)
+        self.assertEqual(store.acquire('service/test/app', 'b', 60), 2)
+        self.assertFalse(store.renew('service/test/app', 'a', 1, 60))
+
+    def test_should_take_over_expired_lease(self):
+        store = MemoryLeaseStore()
+        store.acquire('service/test/app', 'a', -1)
+
+        self.assertEqual(store.acquire('service/test/app', 'b', 60), 2)
+
+    def test_should_detect_lost_lease(self):
+        store = MemoryLeaseStore()
+        lock = LeaseLock(store, 'service/test/app', ttl=0.3)
+        self.assertTrue(lock.acquire())
+
+        # the lease expired (e.g. the heartbeat stalled) and another host took it over
+        store.renew = lambda name, owner, token, ttl: False
+        time.sleep(0.3)
+        lock.release()
+
+        self.assertTrue(lock.lost)
+
+    def test_should_be_reentrant_within_a_thread(self):
+        locker = Locker(directory=self.directory.name, store=MemoryLeaseStore())
+
+        with locker.lock('service/test/app', 'service/test/web'):
+            with locker.lock('service/test/app'):
+                pass
+
+    def test_should_raise_exception_on_timeout(self):
+        store = MemoryLeaseStore()
+        store.acquire('service/test/app', 'other host', 60)
+        locker = Locker(directory=self.directory.name, store=store, timeout=0)
+
+        with self.assertRaisesRegex(Exception, r'Timeout waiting for lock on \[service/test/app\]'):
+            with locker.lock('service/test/app'):
+                pass
+
+    def test_should_raise_exception_on_timeout_waiting_for_lock_file(self):
+        locker = Locker(directory=self.directory.name, timeout=0.3)
+        acquired = threading.Event()
+        released = threading.Event()
+
+        def operation():
+            with Locker(directory=self.directory.name).lock('service/test/app'):
+                acquired.set()
+                released.wait()
+
+        thread = threading.Thread(target=operation)
+        thread.start()
+        acquired.wait()
+        try:
+            with self.assertRaisesRegex(Exception, r'Timeout waiting for lock on \[service/test/app\]'):
+                with locker.lock('service/test/app'):
+                    pass
+        finally:
+            released.set()
+            thread.join()
+
+    def test_should_not_follow_symlink_in_place_of_lock_file(self):
+        target = os.path.join(self.directory.name, 'target')
+        os.symlink(target, os.path.join(self.directory.name, 'service_test_app.lock'))
+
+        with self.assertRaises(OSError):
+            with Locker(directory=self.directory.name).lock('service/test/app'):
+                pass
+        self.assertFalse(os.path.exists(target))
+
+    def test_should_fail_writes_once_lease_was_lost(self):
+        store = MemoryLeaseStore()
+        locker = Locker(directory=self.directory.name, store=store, ttl=0.3)
+        client = locker.fence(MagicMock())
+        check = client.meta.events.register.call_args[0][1]
+        read, write = MagicMock(), MagicMock()
+        read.name, write.name = 'DescribeServices', 'UpdateService'
+
+        with self.assertRaisesRegex(Exception, r'Lock on \[service/test/app\] was lost during the operation'):
+            with locker.lock('service/test/app'):
+                check(model=write)
+
+                # the heartbeat stalled, the lease may have been taken over by now
+                store.renew = lambda name, owner, token, ttl: False
+                time.sleep(0.3)
+                check(model=read)
+                with self.assertRaisesRegex(Exception, r'Lock on \[service/test/app\] was lost$'):
+                    check(model=write)
+
+    def test_should_serialize_operations_on_the_same_resource(self):
+        locker = Locker(directory=self.directory.name)
+        events = list()
+
+        def operation(name):
+            with Locker(directory=self.directory.name).lock('service/test/app'):
+                events.append(name + ' start')
+                time.sleep(0.1)
+                events.append(name + ' end')
+
+        with locker.lock('service/test/app'):
+            thread = threading.Thread(target=operation, args=('second',))
+            thread.start()
+            time.sleep(0.1)
+            events.append('first end')
+        thread.join()
+
+        self.assertEqual(events, ['first end', 'second start', 'second end'])
@@ -0,0 +1,74 @@
+import boto3
+import os
+
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.metrics import ApiMetrics
+from cloudcrane.metrics import Metric
+from cloudcrane.metrics import format_metrics
+from cloudcrane.metrics import record_api_metrics
+
+AWS_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'eu-central-1',
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test'
+}
+
+
+class TestMetrics(TestCase):
+
+    def test_should_format_metrics_in_text_format(self):
+        metrics = [Metric('cloudcrane_service_running_tasks', 'gauge', 'Running tasks of the service.', [
+            ('', {'cluster': 'prod', 'service': 'app "1"'}, 2),
+            ('', {'cluster': 'prod', 'service': 'app\\2'}, 0.5)
+        ])]
+
+        self.assertEqual(format_metrics(metrics), '\n'.join([
+            '# HELP cloudcrane_service_running_tasks Running tasks of the service.',
+            '# TYPE cloudcrane_service_running_tasks gauge',
+            'cloudcrane_service_running_tasks{cluster="prod",service="app \\"1\\""} 2',
+            'cloudcrane_service_running_tasks{cluster="prod",service="app\\\\2"} 0.5',
+            ''
+        ]))
+
+    def test_should_count_latency_in_cumulative_buckets(self):
+        api_metrics = ApiMetrics()
+        api_metrics.record_call('ecs', 'ListServices', 0.07, False)
+        api_metrics.record_call('ecs', 'ListServices', 3.0, True)
+
+        text = format_metrics(api_metrics.metrics())
+
+        self.assertIn('cloudcrane_aws_api_calls_total{service="ecs",operation="ListServices"} 2', text)
+        self.assertIn('cloudcrane_aws_api_errors_total{service="ecs",operation="ListServices"} 1', text)
+        self.assertIn('cloudcrane_aws_api_call_duration_seconds_bucket{service="ecs",operation="ListServices",'
+                      'le="0.05"} 0', text)
+        self.assertIn('cloudcrane_aws_api_call_duration_seconds_bucket{service="ecs",operation="ListServices",'
+                      'le="0.1"} 1', text)
+        self.assertIn('cloudcrane_aws_api_call_duration_seconds_bucket{service="ecs",operation="ListServices",'
+                      'le="+Inf"} 2', text)
+        self.assertIn('cloudcrane_aws_api_call_duration_seconds_count{service="ecs",operation="ListServices"} 2', text)
+
+    @patch.dict(os.environ, AWS_ENVIRONMENT)
+    def test_should_record_calls_and_throttles_of_client(self):
+        api_metrics = ApiMetrics()
+        client = record_api_metrics(boto3.client('ecs'), api_metrics)
+        model = client.meta.service_model.operation_model('ListClusters')
+
+        with Stubber(client) as stubber:
+            stubber.add_response('list_clusters', {'clusterArns': []})
+            stubber.add_client_error('list_clusters', service_error_code='ThrottlingException', http_status_code=400)
+            client.list_clusters()
+            with self.assertRaises(Exception):
+                client.list_clusters()
+        for code in ['ThrottlingException', 'LimitExceededException']:
+            client.meta.events.emit('needs-retry.ecs.ListClusters', response=(AWSResponse(None, 400, {}, None), {
+                'Error': {'Code': code}
+            }), endpoint=None, operation=model, attempts=1, caught_exception=None, request_dict={'context': {}})
+
+        text = format_metrics(api_metrics.metrics())
+
+        self.assertIn('cloudcrane_aws_api_calls_total{service="ecs",operation="ListClusters"} 2', text)
+        self.assertIn('cloudcrane_aws_api_errors_total{service="ecs",operation="ListClusters"} 1', text)
+        self.assertIn('cloudcrane_aws_api_throttles_total{service="ecs",operation="ListClusters"} 1', text)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import yaml
+
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.parameters import ParameterLoader
+from cloudcrane.parameters import merge
+
+
+class TestParameterLoader(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_should_merge_nested_mappings_and_replace_lists(self):
+        base = {'containerDefinition': {'cpu': 1, 'memory': 2, 'portMappings': [{'containerPort': 1}]}}
+        overlay = {'containerDefinition': {'memory': 3, 'portMappings': [{'containerPort': 2}]}}
+
+        self.assertEqual(
+            merge(base, overlay),
+            {'containerDefinition': {'cpu': 1, 'memory': 3, 'portMappings': [{'containerPort': 2}]}}
+        )
+        self.assertEqual(base['containerDefinition']['memory'], 2)
+
+    def test_should_merge_extended_base_file(self):
+        self.write('base.yaml', 'containerDefinition:\n  cpu: 128\n  memory: 256\ndesiredCount: 1\n')
+        path = self.write('app.yaml', 'extends: base.yaml\ncontainerDefinition:\n  name: app\ndesiredCount: 3\n')
+
+        parameters = ParameterLoader().load(path)
+
+        self.assertEqual(parameters, {
+            'containerDefinition': {'name': 'app', 'cpu': 128, 'memory': 256},
+            'desiredCount': 3
+        })
+
+    def test_should_apply_environment_section_and_overlays(self):
+        self.write('base.yaml', 'desiredCount: 1\nenvironments:\n  prod:\n    desiredCount: 5\n')
+        path = self.write('app.yaml', 'extends: [base.yaml]\nloadBalancer: internal\n')
+        overlay = self.write('overlay.yaml', 'loadBalancer: internet-facing\n')
+
+        parameters = ParameterLoader().load(path, environment='prod', overlays=[overlay])
+
+        self.assertEqual(parameters, {'desiredCount': 5, 'loadBalancer': 'internet-facing'})
+
+    def test_should_ignore_empty_environment_section(self):
+        path = self.write('app.yaml', 'desiredCount: 1\nenvironments:\n  staging:\n  prod:\n    desiredCount: 5\n')
+
+        parameters = ParameterLoader().load(path, environment='staging')
+
+        self.assertEqual(parameters, {'desiredCount': 1})
+
+    def test_should_raise_exception_for_unknown_environment(self):
+        path = self.write('app.yaml', 'desiredCount: 1\n')
+
+        with self.assertRaisesRegex(Exception, r'Unknown environment \[prod\]'):
+            ParameterLoader().load(path, environment='prod')
+
+    def test_should_raise_exception_for_circular_extends(self):
+        self.write('a.yaml', 'extends: b.yaml\n')
+        path = self.write('b.yaml', 'extends: a.yaml\n')
+
+        with self.assertRaisesRegex(Exception, 'Circular extends'):
+            ParameterLoader().load(path)
+
+    @patch('cloudcrane.parameters.yaml.safe_load', wraps=yaml.safe_load)
+    def test_should_parse_shared_base_only_once(self, safe_load):
+        loader = ParameterLoader()
+        self.write('base.yaml', 'desiredCount: 1\n')
+        first = self.write('first.yaml', 'extends: base.yaml\n')
+        second = self.write('second.yaml', 'extends: base.yaml\n# second\n')
+
+        loader.load(first)
+        loader.load(second)
+        loader.load(first)
+
+        self.assertEqual(safe_load.call_count, 3)
+
+    def test_should_return_independent_copies_from_cache(self):
+        loader = ParameterLoader()
+        path = self.write('app.yaml', 'containerDefinition:\n  cpu: 1\n')
+
+        loader.load(path)['containerDefinition']['cpu'] = 2
+
+        self.assertEqual(loader.load(path)['containerDefinition']['cpu'], 1)
+
+    def test_should_reload_changed_files(self):
+        loader = ParameterLoader()
+        path = self.write('app.yaml', 'desiredCount: 1\n')
+        loader.load(path)
+
+        self.write('app.yaml', 'desiredCount: 2\n')
+
+        self.assertEqual(loader.load(path)['desiredCount'], 2)
@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.rate_limiter import RateLimiter
+from cloudcrane.rate_limiter import get_rate_limiter
+from cloudcrane.rate_limiter import limit_rate
+
+
+class TestRateLimiter(TestCase):
+
+    @patch('cloudcrane.rate_limiter.time')
+    def test_should_allow_burst_without_waiting(self, time):
+        time.monotonic.return_value = 0
+        rate_limiter = RateLimiter(rate=2, burst=3)
+
+        for _ in range(3):
+            rate_limiter.acquire()
+
+        time.sleep.assert_not_called()
+
+    @patch('cloudcrane.rate_limiter.time')
+    def test_should_wait_for_tokens_when_burst_is_used_up(self, time):
+        time.monotonic.side_effect = [0, 0, 0, 0.5]
+        rate_limiter = RateLimiter(rate=2, burst=1)
+
+        rate_limiter.acquire()
+        rate_limiter.acquire()
+
+        time.sleep.assert_called_once_with(0.5)
+        self.assertEqual(rate_limiter.waited, 0.5)
+
+    def test_should_share_rate_limiter_per_service(self):
+        self.assertIs(get_rate_limiter('ecs'), get_rate_limiter('ecs'))
+        self.assertIsNot(get_rate_limiter('ecs'), get_rate_limiter('elbv2'))
+        self.assertEqual(get_rate_limiter('ecs').rate, 20.0)
+
+    def test_should_register_rate_limiter_on_client_calls(self):
+        client = MagicMock()
+
+        self.assertIs(limit_rate(client, 'ecs'), client)
+        client.meta.events.register.assert_called_once()
+        self.assertEqual(client.meta.events.register.call_args[0][0], 'before-call')
@@ -0,0 +1,150 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+
+from unittest.mock import patch
+from unittest import TestCase
+from cloudcrane.controllers.cluster_controller import ClusterController
+from cloudcrane.controllers.service_controller import ServiceController
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
+from cloudcrane.parameters import ParameterLoader
+from cloudcrane.server import Server
+from cloudcrane.server import create_http_server
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_server(self, **kwargs):
+        locker = Locker(directory=self.directory.name)
+        journal = Journal(directory=self.directory.name)
+        return Server(ClusterController(locker=locker, journal=journal),
+                      ServiceController(locker=locker, journal=journal), ParameterLoader(), **kwargs)
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_run_operation(self, cluster_boto3, service_boto3):
+        server = self.create_server()
+        service_boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'desiredCount': 1}]
+        }
+        service_boto3.client().describe_scalable_targets.return_value = {'ScalableTargets': []}
+
+        status, body = server.handle('service', 'scale', {'cluster_name': 'test', 'service_name': 'app',
+                                                          'desired_count': 3})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'result': 3, 'output': ''})
+        service_boto3.client().update_service.assert_called_once_with(cluster='test', service='app', desiredCount=3)
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_reject_unknown_operations_and_arguments(self, cluster_boto3, service_boto3):
+        server = self.create_server()
+
+        self.assertEqual(server.handle('service', 'events', {})[0], 404)
+        self.assertEqual(server.handle('service', 'scale', {'cluster_name': 'test'})[0], 400)
+        self.assertEqual(server.handle('service', 'scale', ['test'])[0], 400)
+        service_boto3.client().update_service.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_return_error_and_output_of_failed_operation(self, cluster_boto3, service_boto3):
+        server = self.create_server()
+        service_boto3.client().list_services.return_value = {'serviceArns': []}
+
+        status, body = server.handle('service', 'delete', {'cluster_name': 'test', 'service_name': 'app'})
+
+        self.assertEqual(status, 500)
+        self.assertEqual(body['error'], 'Unknown service: [app]')
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_load_parameter_file_of_deployment(self, cluster_boto3, service_boto3):
+        path = os.path.join(self.directory.name, 'app.yaml')
+        with open(path, 'w') as f:
+            f.write('desiredCount: 1\nenvironments:\n  prod:\n    desiredCount: 3\n')
+
+        with patch.object(ServiceController, 'deploy') as deploy:
+            server = self.create_server()
+            status, _ = server.handle('service', 'deploy', {'cluster_name': 'test', 'service_name': 'app',
+                                                            'region': 'eu-central-1', 'parameters_file': path,
+                                                            'environment': 'prod'})
+
+        self.assertEqual(status, 200)
+        deploy.assert_called_once_with(cluster_name='test', service_name='app', region='eu-central-1',
+                                       parameters={'desiredCount': 3})
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_serve_json_api_on_unix_socket(self, cluster_boto3, service_boto3):
+        service_boto3.client().list_services.return_value = {'serviceArns': []}
+        socket_path = os.path.join(self.directory.name, 'cloudcrane.sock')
+        http_server = create_http_server(self.create_server(), socket_path=socket_path)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        self.assertEqual(os.stat(socket_path).st_mode & 0o077, 0)
+
+        try:
+            connection = UnixHTTPConnection(socket_path)
+            connection.request('POST', '/service/list', body=json.dumps({'cluster_name': 'test'}),
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+
+            self.assertEqual(response.status, 200)
+            self.assertEqual(json.loads(response.read())['result'], None)
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    @patch('cloudcrane.controllers.cluster_controller.boto3')
+    def test_should_only_accept_json_requests_with_token_for_local_host_on_tcp_port(self, cluster_boto3,
+                                                                                    service_boto3):
+        with self.assertRaisesRegex(Exception, 'An API token is required'):
+            create_http_server(self.create_server(), port=0)
+
+        http_server = create_http_server(self.create_server(), port=0, token='secret')
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+        def post(**headers):
+            connection = http.client.HTTPConnection('127.0.0.1', http_server.server_address[1])
+            connection.request('POST', '/service/list', body=json.dumps({'cluster_name': 'test'}),
+                               headers=dict({'Content-Type': 'application/json', 'Authorization': 'Bearer secret',
+                                             'Host': 'localhost:{0}'.format(http_server.server_address[1])},
+                                            **headers))
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            return response.status
+
+        try:
+            # a cross-origin form or fetch without preflight can only send text/plain
+            self.assertEqual(post(**{'Content-Type': 'text/plain'}), 415)
+            self.assertEqual(post(Authorization='Bearer guess'), 401)
+            # DNS rebinding: the browser sends the host name of the attacking site
+            self.assertEqual(post(Host='evil.example.com:8080'), 403)
+            self.assertEqual(post(), 200)
+            self.assertEqual(post(Host='127.0.0.1'), 200)
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
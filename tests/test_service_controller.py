@@ -1,20 +1,57 @@
+import io
 import random
 import string
+import tempfile
 
+from datetime import datetime
+from datetime import timezone
 from unittest.mock import ANY
+from unittest.mock import call
 from unittest.mock import patch
 from unittest import TestCase
 from cloudcrane.controllers.service_controller import ServiceController
+from cloudcrane.controllers.service_controller import get_desired_count
+from cloudcrane.controllers.service_controller import get_parameters_hash
+from cloudcrane.controllers.service_controller import get_target_group_name
+from cloudcrane.images import ImageResolver
+from cloudcrane.journal import Journal
+from cloudcrane.locking import Locker
+
+
+class DuplicateTargetGroupNameException(Exception):
+    pass
+
+
+class PriorityInUseException(Exception):
+    pass
+
+
+class ResourceAlreadyExistsException(Exception):
+    pass
 
 
 class TestServiceController(TestCase):
 
     def setUp(self):
-        pass
+        self.directory = tempfile.TemporaryDirectory()
+        self.locker = Locker(directory=self.directory.name)
+        self.journal = Journal(directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch('cloudcrane.controllers.service_controller.limit_rate')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_rate_limit_all_clients(self, boto3, limit_rate):
+        ServiceController(locker=self.locker, journal=self.journal, image_resolver=ImageResolver(cache_ttl=0))
+
+        self.assertEqual(sorted(i[0][1] for i in limit_rate.call_args_list), [
+            'application-autoscaling', 'cloudformation', 'ecs', 'elbv2', 'logs', 'ssm'
+        ])
 
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_deploy_ecs_service(self, boto3):
-        controller = ServiceController()
+        controller = ServiceController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
         service_name = ''.join(random.choices(string.ascii_letters, k=10))
@@ -70,20 +107,633 @@ class TestServiceController(TestCase):
                 }
             ],
             desiredCount=desired_count,
+            tags=[{'key': 'cloudcrane:parameters', 'value': ANY}],
             launchType='EC2'
         )
 
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_deploy_multiple_containers_with_multiple_load_balancer_bindings(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
+        service_name = ''.join(random.choices(string.ascii_letters, k=10))
+
+        parameters = {
+            'containerDefinitions': [
+                {'name': 'app', 'portMappings': [{'containerPort': 8080}, {'containerPort': 7979}]},
+                {'name': 'envoy', 'portMappings': [{'containerPort': 9000}]},
+                {'name': 'log-shipper'}
+            ],
+            'loadBalancers': [
+                {'loadBalancer': 'internet-facing', 'containerName': 'envoy'},
+                {'loadBalancer': 'internal', 'containerPort': 7979}
+            ],
+            'desiredCount': 2
+        }
+
+        boto3.client().describe_target_groups.side_effect = lambda Names: {
+            'TargetGroups': [{'TargetGroupArn': Names[0] + '-ARN'}]
+        }
+
+        controller.deploy(cluster_name=cluster_name, service_name=service_name, region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_called_with(
+            family=service_name,
+            taskRoleArn='',
+            volumes=[],
+            containerDefinitions=parameters['containerDefinitions']
+        )
+
+        boto3.client().create_service.assert_called_with(
+            cluster=cluster_name,
+            serviceName=service_name,
+            taskDefinition=service_name,
+            loadBalancers=[
+                {
+                    'targetGroupArn': cluster_name + '-internet-facing-tg-ARN',
+                    'containerName': 'envoy',
+                    'containerPort': 9000
+                },
+                {
+                    'targetGroupArn': cluster_name + '-internal-tg-ARN',
+                    'containerName': 'app',
+                    'containerPort': 7979
+                }
+            ],
+            desiredCount=2,
+            tags=[{'key': 'cloudcrane:parameters', 'value': ANY}],
+            launchType='EC2'
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_when_load_balancer_binding_refers_to_unknown_container(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinitions': [{'name': 'app', 'portMappings': [{'containerPort': 8080}]}],
+            'loadBalancers': [{'loadBalancer': 'internal', 'containerName': 'envoy'}],
+            'desiredCount': 1
+        }
+
+        with self.assertRaisesRegex(Exception, r'Unknown container in load balancer binding: \[envoy\]'):
+            controller.deploy(cluster_name='test', service_name='test', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_not_called()
+        boto3.client().create_service.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_deploy_with_dynamic_host_ports_and_placement(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {
+                'name': 'app',
+                'portMappings': [{'containerPort': 8080, 'hostPort': 80}, {'containerPort': 7979}]
+            },
+            'dynamicHostPorts': True,
+            'placementStrategy': [
+                'spread:availability-zone',
+                'binpack:memory',
+                {'type': 'spread', 'field': 'instanceId'}
+            ],
+            'placementConstraints': ['distinctInstance', 'memberOf:attribute:ecs.instance-type =~ t3.*'],
+            'desiredCount': 3,
+            'loadBalancer': 'internal'
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_called_with(
+            family='app',
+            taskRoleArn='',
+            volumes=[],
+            containerDefinitions=[{
+                'name': 'app',
+                'portMappings': [{'containerPort': 8080, 'hostPort': 0}, {'containerPort': 7979, 'hostPort': 0}]
+            }]
+        )
+
+        boto3.client().create_service.assert_called_with(
+            cluster='test',
+            serviceName='app',
+            taskDefinition='app',
+            loadBalancers=ANY,
+            desiredCount=3,
+            tags=[{'key': 'cloudcrane:parameters', 'value': ANY}],
+            launchType='EC2',
+            placementStrategy=[
+                {'type': 'spread', 'field': 'attribute:ecs.availability-zone'},
+                {'type': 'binpack', 'field': 'memory'},
+                {'type': 'spread', 'field': 'instanceId'}
+            ],
+            placementConstraints=[
+                {'type': 'distinctInstance'},
+                {'type': 'memberOf', 'expression': 'attribute:ecs.instance-type =~ t3.*'}
+            ]
+        )
+        self.assertEqual(parameters['containerDefinition']['portMappings'][0]['hostPort'], 80)
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.images.boto3')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_pin_image_digest_and_pre_pull_image(self, boto3, images_boto3, time):
+        image = '123456789012.dkr.ecr.eu-central-1.amazonaws.com/my-app'
+        digest = 'sha256:' + 'b' * 64
+        images_boto3.client().describe_images.return_value = {'imageDetails': [
+            {'imageDigest': digest, 'imageTags': ['latest']}
+        ]}
+        time.time.return_value = 0
+        with tempfile.TemporaryDirectory() as directory:
+            controller = ServiceController(locker=self.locker,
+                                           image_resolver=ImageResolver(cache_file=directory + '/digests.json'))
+
+            boto3.client().describe_services.return_value = {'services': []}
+            boto3.client().get_paginator().paginate.side_effect = lambda **kwargs: [
+                {'CommandInvocations': [{'InstanceId': 'i-1', 'Status': 'Success'}]} if 'CommandId' in kwargs else
+                {'containerInstanceArns': ['ci-ARN']}
+            ]
+            boto3.client().describe_container_instances.return_value = {'containerInstances': [
+                {'ec2InstanceId': 'i-1'}
+            ]}
+            boto3.client().send_command.return_value = {'Command': {'CommandId': 'command-1'}}
+            boto3.client().list_commands.return_value = {'Commands': [{'Status': 'Success', 'ErrorCount': 0}]}
+
+            controller.deploy(cluster_name='test', service_name='app', region=None, parameters={
+                'containerDefinition': {'name': 'app', 'image': image + ':latest'},
+                'desiredCount': 1,
+                'prePullImages': True
+            })
+
+        boto3.client().send_command.assert_called_once_with(
+            InstanceIds=['i-1'],
+            DocumentName='AWS-RunShellScript',
+            Parameters={'commands': [
+                'aws ecr get-login-password --region eu-central-1 | docker login --username AWS --password-stdin '
+                '123456789012.dkr.ecr.eu-central-1.amazonaws.com',
+                'docker pull ' + image + '@' + digest
+            ]},
+            TimeoutSeconds=300,
+            Comment='cloudcrane pre-pull for cluster test'
+        )
+        self.assertEqual(boto3.client().register_task_definition.call_args[1]['containerDefinitions'], [
+            {'name': 'app', 'image': image + '@' + digest}
+        ])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_report_instances_that_did_not_pre_pull_images(self, boto3, time, out):
+        time.time.side_effect = [0, 0, 400]
+        controller = ServiceController(locker=self.locker, journal=self.journal,
+                                       image_resolver=ImageResolver(cache_ttl=0))
+
+        boto3.client().describe_services.return_value = {'services': []}
+        boto3.client().get_paginator().paginate.side_effect = lambda **kwargs: [
+            {'CommandInvocations': [
+                {'InstanceId': 'i-1', 'Status': 'Success'},
+                {'InstanceId': 'i-2', 'Status': 'InProgress'},
+                {'InstanceId': 'i-3', 'Status': 'Undeliverable'}
+            ]} if 'CommandId' in kwargs else {'containerInstanceArns': ['ci-1-ARN', 'ci-2-ARN', 'ci-3-ARN']}
+        ]
+        boto3.client().describe_container_instances.return_value = {'containerInstances': [
+            {'ec2InstanceId': 'i-1'}, {'ec2InstanceId': 'i-2'}, {'ec2InstanceId': 'i-3'}
+        ]}
+        boto3.client().send_command.return_value = {'Command': {'CommandId': 'command-1'}}
+        # the command timed out without errors on the instance still pulling
+        boto3.client().list_commands.return_value = {'Commands': [{'Status': 'InProgress', 'ErrorCount': 0}]}
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters={
+            'containerDefinition': {'name': 'app', 'image': 'nginx:1.25'},
+            'desiredCount': 1,
+            'prePullImages': True
+        })
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            'WARNING: Pre-pulling images did not finish within 300s',
+            'WARNING: Pre-pulling images did not succeed on 2 container instances: i-2 (InProgress), '
+            'i-3 (Undeliverable)'
+        ])
+        boto3.client().create_service.assert_called_once()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_deploy_fargate_service_in_awsvpc_network_mode(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080, 'hostPort': 0}]},
+            'launchType': 'FARGATE',
+            'cpu': 256,
+            'memory': 512,
+            'executionRoleArn': 'role-ARN',
+            'desiredCount': 2,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*'}]
+        }
+
+        boto3.client().describe_services.return_value = {'services': []}
+        boto3.client().describe_stacks.return_value = {'Stacks': [{'Outputs': [
+            {'OutputKey': 'EcsSubnets', 'OutputValue': 'subnet-1,subnet-2'},
+            {'OutputKey': 'EcsInternalSecurityGroupId', 'OutputValue': 'sg-internal'}
+        ]}]}
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'tg-ARN', 'VpcId': 'vpc', 'LoadBalancerArns': ['lb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-tg-ARN'}]}
+        boto3.client().describe_listeners.return_value = {'Listeners': []}
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_called_with(
+            family='app',
+            taskRoleArn='',
+            volumes=[],
+            containerDefinitions=[{'name': 'app', 'portMappings': [{'containerPort': 8080}]}],
+            networkMode='awsvpc',
+            requiresCompatibilities=['FARGATE'],
+            cpu='256',
+            memory='512',
+            executionRoleArn='role-ARN'
+        )
+        self.assertEqual(boto3.client().create_target_group.call_args[1]['TargetType'], 'ip')
+        boto3.client().create_service.assert_called_with(
+            cluster='test',
+            serviceName='app',
+            taskDefinition='app',
+            loadBalancers=[{'targetGroupArn': 'app-tg-ARN', 'containerName': 'app', 'containerPort': 8080}],
+            desiredCount=2,
+            tags=[{'key': 'cloudcrane:parameters', 'value': ANY}],
+            launchType='FARGATE',
+            networkConfiguration={'awsvpcConfiguration': {
+                'subnets': ['subnet-1', 'subnet-2'],
+                'securityGroups': ['sg-internal'],
+                'assignPublicIp': 'ENABLED'
+            }}
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_update_capacity_provider_strategy_of_existing_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app'},
+            'capacityProviderStrategy': ['FARGATE:1:2', 'FARGATE_SPOT:3'],
+            'networkConfiguration': {'subnets': ['subnet-1'], 'securityGroups': ['sg-1']},
+            'desiredCount': 4
+        }
+
+        boto3.client().register_task_definition.return_value = {'taskDefinition': {'taskDefinitionArn': 'app:2'}}
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'serviceArn': 'app-ARN', 'taskDefinition': 'app:1', 'desiredCount': 3
+            }]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().describe_stacks.assert_not_called()
+        boto3.client().update_service.assert_called_with(
+            cluster='test',
+            service='app',
+            taskDefinition='app:2',
+            loadBalancers=[],
+            desiredCount=4,
+            capacityProviderStrategy=[
+                {'capacityProvider': 'FARGATE', 'weight': 1, 'base': 2},
+                {'capacityProvider': 'FARGATE_SPOT', 'weight': 3}
+            ],
+            networkConfiguration={'awsvpcConfiguration': {
+                'subnets': ['subnet-1'],
+                'securityGroups': ['sg-1'],
+                'assignPublicIp': 'ENABLED'
+            }},
+            forceNewDeployment=True
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_for_awsvpc_binding_without_routing_rule(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'launchType': 'FARGATE',
+            'desiredCount': 1,
+            'loadBalancer': 'internal'
+        }
+
+        with self.assertRaisesRegex(Exception, 'awsvpc network mode require a path or host pattern'):
+            controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_update_existing_service_and_record_previous_deployment(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 4,
+            'loadBalancer': 'internal'
+        }
+
+        boto3.client().register_task_definition.return_value = {'taskDefinition': {'taskDefinitionArn': 'app:2'}}
+        boto3.client().describe_target_groups.return_value = {'TargetGroups': [{'TargetGroupArn': 'tg-ARN'}]}
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'serviceArn': 'app-ARN', 'taskDefinition': 'app:1', 'desiredCount': 3
+            }]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        self.assertEqual(boto3.client().tag_resource.call_args_list, [
+            call(resourceArn='app-ARN', tags=[
+                {'key': 'cloudcrane:previous-task-definition', 'value': 'app:1'},
+                {'key': 'cloudcrane:previous-desired-count', 'value': '3'}
+            ]),
+            call(resourceArn='app-ARN', tags=[
+                {'key': 'cloudcrane:parameters', 'value': get_parameters_hash(dict(parameters, desiredCount=1))}
+            ])
+        ])
+        boto3.client().update_service.assert_called_with(
+            cluster='test',
+            service='app',
+            taskDefinition='app:2',
+            loadBalancers=[{'targetGroupArn': 'tg-ARN', 'containerName': 'app', 'containerPort': 8080}],
+            desiredCount=4
+        )
+        boto3.client().create_service.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_look_up_service_by_name_and_recreate_inactive_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().register_task_definition.return_value = {'taskDefinition': {'taskDefinitionArn': 'app:2'}}
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'INACTIVE', 'serviceArn': 'app-ARN'}]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters={
+            'containerDefinition': {'name': 'app'},
+            'desiredCount': 1
+        })
+
+        # services beyond the first page of list_services are found as well
+        boto3.client().describe_services.assert_called_with(cluster='test', services=['app'])
+        boto3.client().list_services.assert_not_called()
+        boto3.client().update_service.assert_not_called()
+        boto3.client().create_service.assert_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_roll_back_to_previous_deployment(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'serviceArn': 'app-ARN', 'taskDefinition': 'app:2', 'desiredCount': 4
+            }]
+        }
+        boto3.client().list_tags_for_resource.return_value = {
+            'tags': [
+                {'key': 'cloudcrane:previous-task-definition', 'value': 'app:1'},
+                {'key': 'cloudcrane:previous-desired-count', 'value': '3'}
+            ]
+        }
+
+        controller.rollback(cluster_name='test', service_name='app')
+
+        boto3.client().update_service.assert_called_once_with(
+            cluster='test',
+            service='app',
+            taskDefinition='app:1',
+            desiredCount=3
+        )
+        boto3.client().tag_resource.assert_called_with(
+            resourceArn='app-ARN',
+            tags=[
+                {'key': 'cloudcrane:previous-task-definition', 'value': 'app:2'},
+                {'key': 'cloudcrane:previous-desired-count', 'value': '4'}
+            ]
+        )
+        boto3.client().untag_resource.assert_called_with(resourceArn='app-ARN', tagKeys=['cloudcrane:parameters'])
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_when_no_previous_deployment_is_recorded(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'serviceArn': 'app-ARN', 'taskDefinition': 'app:1', 'desiredCount': 1
+            }]
+        }
+        boto3.client().list_tags_for_resource.return_value = {'tags': []}
+
+        with self.assertRaisesRegex(Exception, r'No previous deployment recorded for service: \[app\]'):
+            controller.rollback(cluster_name='test', service_name='app')
+
+        boto3.client().update_service.assert_not_called()
+
+    def mock_blue_green_services(self, boto3):
+        boto3.client().describe_services.return_value = {
+            'services': [
+                {'serviceName': 'app-1', 'status': 'ACTIVE', 'loadBalancers': [{'targetGroupArn': 'tg-1-ARN'}]},
+                {'serviceName': 'app-2', 'status': 'ACTIVE', 'loadBalancers': [{'targetGroupArn': 'tg-2-ARN'}]}
+            ]
+        }
+        boto3.client().describe_target_groups.side_effect = lambda TargetGroupArns: {
+            'TargetGroups': [{'TargetGroupArn': TargetGroupArns[0], 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().describe_listeners.return_value = {'Listeners': [{'ListenerArn': 'listener-ARN'}]}
+        boto3.client().describe_rules.return_value = {
+            'Rules': [
+                {'RuleArn': 'rule-1-ARN', 'IsDefault': False,
+                 'Actions': [{'Type': 'forward', 'TargetGroupArn': 'tg-1-ARN'}]},
+                {'RuleArn': 'rule-2-ARN', 'IsDefault': False,
+                 'Actions': [{'Type': 'forward', 'TargetGroupArn': 'tg-2-ARN'}]}
+            ]
+        }
+
+    @staticmethod
+    def mock_clock(time):
+        clock = [0]
+        time.time.side_effect = lambda: clock[0]
+        time.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+
+    @staticmethod
+    def weighted_forward(weight):
+        return [{
+            'Type': 'forward',
+            'ForwardConfig': {
+                'TargetGroups': [
+                    {'TargetGroupArn': 'tg-1-ARN', 'Weight': 100 - weight},
+                    {'TargetGroupArn': 'tg-2-ARN', 'Weight': weight}
+                ]
+            }
+        }]
+
+    @patch.object(ServiceController, 'delete')
+    @patch.object(ServiceController, 'wait_healthy')
+    @patch.object(ServiceController, 'deploy')
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_shift_traffic_in_steps_and_retire_previous_version(self, boto3, time, deploy, wait_healthy,
+                                                                       delete):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        self.mock_blue_green_services(boto3)
+        self.mock_clock(time)
+
+        parameters = {'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*', 'priority': 7}]}
+
+        controller.blue_green_deploy(cluster_name='test', service_name='app-2', previous_service_name='app-1',
+                                     region=None, parameters=parameters, traffic_steps=[10, 100], bake_time=12)
+
+        deploy.assert_called_with(cluster_name='test', service_name='app-2', region=None, parameters={
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*'}]
+        })
+        self.assertEqual(boto3.client().modify_rule.call_args_list, [
+            call(RuleArn='rule-1-ARN', Actions=self.weighted_forward(10)),
+            call(RuleArn='rule-1-ARN', Actions=self.weighted_forward(100))
+        ])
+        # health is checked throughout the bake time of each step
+        self.assertEqual([i[1]['timeout'] for i in wait_healthy.call_args_list], [600, 0, 0, 0, 0, 0, 0])
+        self.assertEqual([i[0][0] for i in time.sleep.call_args_list], [5, 5, 2, 5, 5, 2])
+        boto3.client().delete_rule.assert_called_once_with(RuleArn='rule-1-ARN')
+        boto3.client().set_rule_priorities.assert_called_with(
+            RulePriorities=[{'RuleArn': 'rule-2-ARN', 'Priority': 7}]
+        )
+        delete.assert_called_once_with(cluster_name='test', service_name='app-1')
+
+    @patch.object(ServiceController, 'delete')
+    @patch.object(ServiceController, 'wait_healthy')
+    @patch.object(ServiceController, 'deploy')
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_shift_traffic_back_when_new_version_becomes_unhealthy(self, boto3, time, deploy, wait_healthy,
+                                                                          delete):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        self.mock_blue_green_services(boto3)
+        self.mock_clock(time)
+        wait_healthy.side_effect = [None, None, Exception('Tasks keep stopping')]
+
+        with self.assertRaisesRegex(Exception, 'Tasks keep stopping'):
+            controller.blue_green_deploy(cluster_name='test', service_name='app-2', previous_service_name='app-1',
+                                         region=None, parameters={}, traffic_steps=[10, 50, 100], bake_time=5)
+
+        self.assertEqual(boto3.client().modify_rule.call_args_list, [
+            call(RuleArn='rule-1-ARN', Actions=self.weighted_forward(10)),
+            call(RuleArn='rule-1-ARN', Actions=self.weighted_forward(50)),
+            call(RuleArn='rule-1-ARN', Actions=[{'Type': 'forward', 'TargetGroupArn': 'tg-1-ARN'}])
+        ])
+        boto3.client().delete_rule.assert_not_called()
+        delete.assert_called_once_with(cluster_name='test', service_name='app-2')
+
+    @patch.object(ServiceController, 'deploy')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_require_routing_rules_for_blue_green_deployment(self, boto3, deploy):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        self.mock_blue_green_services(boto3)
+        boto3.client().describe_rules.return_value = {'Rules': []}
+
+        with self.assertRaisesRegex(Exception, r'requires path or host routing rules for service: \[app-1\]'):
+            controller.blue_green_deploy(cluster_name='test', service_name='app-2', previous_service_name='app-1',
+                                         region=None, parameters={})
+
+        deploy.assert_not_called()
+
+    def test_should_get_absolute_and_relative_desired_counts(self):
+        self.assertEqual(get_desired_count(3, '5'), 5)
+        self.assertEqual(get_desired_count(3, '+2'), 5)
+        self.assertEqual(get_desired_count(3, '-5'), 0)
+        with self.assertRaisesRegex(Exception, r'Invalid count: \[x2\]'):
+            get_desired_count(3, 'x2')
+
+    def mock_services_to_scale(self, boto3, services, scalable_targets=()):
+        boto3.client().get_paginator().paginate.return_value = [
+            {'serviceArns': [name + '-ARN' for name in services]}
+        ]
+        boto3.client().describe_services.side_effect = lambda cluster, services: {'services': [
+            dict(state[i.replace('-ARN', '')]) for i in services
+        ]}
+        boto3.client().update_service.side_effect = lambda cluster, service, desiredCount: \
+            state[service].update(desiredCount=desiredCount)
+        boto3.client().describe_scalable_targets.side_effect = lambda ResourceIds, **kwargs: {'ScalableTargets': [
+            i for i in scalable_targets if i['ResourceId'] in ResourceIds
+        ]}
+        state = {name: {'serviceName': name, 'status': 'ACTIVE', 'desiredCount': count, 'runningCount': count,
+                        'pendingCount': 0} for name, count in services.items()}
+        return state
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_scale_services_matching_patterns_and_wait_for_counts(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.return_value = 0
+
+        state = self.mock_services_to_scale(boto3, {'api-1': 2, 'api-2': 1, 'web': 3})
+
+        def next_poll(interval):
+            for service in state.values():
+                service['runningCount'] = service['desiredCount']
+
+        time.sleep.side_effect = next_poll
+
+        desired_counts = controller.scale_services(cluster_name='test', patterns=['api-*'], count='+2', wait=True)
+
+        self.assertEqual(desired_counts, {'api-1': 4, 'api-2': 3})
+        boto3.client().update_service.assert_has_calls([
+            call(cluster='test', service='api-1', desiredCount=4),
+            call(cluster='test', service='api-2', desiredCount=3)
+        ], any_order=True)
+        self.assertEqual(boto3.client().update_service.call_count, 2)
+        self.assertEqual(time.sleep.call_count, 1)
+        boto3.client().describe_services.assert_called_with(cluster='test', services=['api-1', 'api-2'])
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_scale_relative_to_current_count_within_auto_scaling_capacity(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        state = self.mock_services_to_scale(boto3, {'api': 2, 'web': 3}, scalable_targets=[
+            {'ResourceId': 'service/test/api', 'MinCapacity': 2, 'MaxCapacity': 4}
+        ])
+        listed = boto3.client().describe_services.side_effect
+
+        def describe_services(cluster, services):
+            response = listed(cluster, services)
+            # another operation scaled web after the services were listed, before its lock was taken
+            state['web']['desiredCount'] = 5
+            return response
+
+        boto3.client().describe_services.side_effect = describe_services
+
+        desired_counts = controller.scale_services(cluster_name='test', patterns=['*'], count='+3')
+
+        self.assertEqual(desired_counts, {'api': 4, 'web': 8})
+        boto3.client().update_service.assert_has_calls([
+            call(cluster='test', service='api', desiredCount=4),
+            call(cluster='test', service='web', desiredCount=8)
+        ], any_order=True)
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_if_no_service_matches(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        boto3.client().get_paginator().paginate.return_value = [{'serviceArns': []}]
+
+        with self.assertRaisesRegex(Exception, r'No service matches \[api\]'):
+            controller.scale_services(cluster_name='test', patterns=['api'], count='5')
+
+        boto3.client().update_service.assert_not_called()
+
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_delete_ecs_service(self, boto3):
-        controller = ServiceController()
+        controller = ServiceController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
         service_name = ''.join(random.choices(string.ascii_letters, k=10))
-        service_arn = ''.join(random.choices(string.ascii_letters, k=10))
 
-        boto3.client().list_services.return_value = {'serviceArns': [service_arn]}
         boto3.client().describe_services.return_value = {
-            'services': [{'serviceName': service_name, 'runningCount': 0}]
+            'services': [{'serviceName': service_name, 'status': 'ACTIVE', 'runningCount': 0}]
         }
 
         controller.delete(cluster_name=cluster_name, service_name=service_name)
@@ -99,22 +749,939 @@ class TestServiceController(TestCase):
             service=service_name
         )
 
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_resume_interrupted_delete_of_ecs_service(self, boto3):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory=directory)
+            operation = journal.operation('service-delete/test/app')
+            operation.complete('describe', {'targetGroupArns': ['tg-ARN']})
+            operation.complete('deregister-auto-scaling')
+            operation.complete('scale-down')
+            operation.complete('drain')
+            boto3.client().describe_target_groups.return_value = {
+                'TargetGroups': [{'TargetGroupName': 'test-app-tg', 'TargetGroupArn': 'tg-ARN', 'LoadBalancerArns': []}]
+            }
+
+            controller = ServiceController(locker=self.locker, journal=journal)
+            controller.delete(cluster_name='test', service_name='app', resume=True)
+
+            boto3.client().describe_services.assert_not_called()
+            boto3.client().update_service.assert_not_called()
+            boto3.client().delete_service.assert_called_once_with(cluster='test', service='app')
+            boto3.client().delete_target_group.assert_called_once_with(TargetGroupArn='tg-ARN')
+            self.assertFalse(journal.operation('service-delete/test/app', resume=True).done('drain'))
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_apply_target_group_settings_of_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'targetGroup': {'healthCheckPath': '/health', 'deregistrationDelay': 60},
+            'loadBalancers': [{
+                'loadBalancer': 'internal',
+                'path': '/app/*',
+                'targetGroup': {'deregistrationDelay': 10, 'healthyThresholdCount': 2}
+            }]
+        }
+
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}
+        boto3.client().describe_listeners.return_value = {'Listeners': []}
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().create_target_group.assert_called_with(
+            Name=ANY,
+            Protocol='HTTP',
+            Port=8080,
+            VpcId='vpc-1',
+            TargetType='instance',
+            Tags=ANY,
+            HealthCheckPath='/health',
+            HealthyThresholdCount=2
+        )
+        boto3.client().modify_target_group_attributes.assert_called_with(
+            TargetGroupArn='app-ARN',
+            Attributes=[{'Key': 'deregistration_delay.timeout_seconds', 'Value': '10'}]
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_for_target_group_settings_of_shared_target_group(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancer': 'internal',
+            'targetGroup': {'deregistrationDelay': 10}
+        }
+
+        with self.assertRaisesRegex(Exception, r'shared target group of load balancer \[internal\] cannot be changed'):
+            controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_not_called()
+        boto3.client().modify_target_group.assert_not_called()
+        boto3.client().modify_target_group_attributes.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_for_unknown_target_group_setting(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancer': 'internal',
+            'targetGroup': {'drainTime': 10}
+        }
+
+        with self.assertRaisesRegex(Exception, r'Unknown target group setting: \[drainTime\]'):
+            controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_task_definition.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_deploy_service_with_dedicated_target_group_and_listener_rule(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*', 'host': ['app.example.org']}],
+            'targetGroup': {'healthCheckPath': '/health'}
+        }
+        binding = {'loadBalancer': 'internal', 'containerName': 'app', 'containerPort': 8080}
+        conditions = [
+            {'Field': 'path-pattern', 'PathPatternConfig': {'Values': ['/app/*']}},
+            {'Field': 'host-header', 'HostHeaderConfig': {'Values': ['app.example.org']}}
+        ]
+
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}
+        boto3.client().describe_listeners.return_value = {'Listeners': [{'ListenerArn': 'listener-ARN'}]}
+        boto3.client().describe_rules.return_value = {
+            'Rules': [
+                {'Priority': 'default', 'Actions': [{'Type': 'forward', 'TargetGroupArn': 'shared-ARN'}]},
+                {'Priority': '4', 'Actions': [{'Type': 'forward', 'TargetGroupArn': 'other-ARN'}]}
+            ]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().create_target_group.assert_called_with(
+            Name=get_target_group_name('test', 'app', binding),
+            Protocol='HTTP',
+            Port=8080,
+            VpcId='vpc-1',
+            TargetType='instance',
+            Tags=[{'Key': 'cloudcrane:cluster', 'Value': 'test'}, {'Key': 'cloudcrane:service', 'Value': 'app'}],
+            HealthCheckPath='/health'
+        )
+        boto3.client().describe_listeners.assert_called_with(LoadBalancerArn='alb-ARN')
+        boto3.client().create_rule.assert_called_with(
+            ListenerArn='listener-ARN',
+            Conditions=conditions,
+            Priority=5,
+            Actions=[{'Type': 'forward', 'TargetGroupArn': 'app-ARN'}]
+        )
+        boto3.client().create_service.assert_called_with(
+            cluster='test',
+            serviceName='app',
+            taskDefinition='app',
+            loadBalancers=[{'targetGroupArn': 'app-ARN', 'containerName': 'app', 'containerPort': 8080}],
+            desiredCount=1,
+            tags=[{'key': 'cloudcrane:parameters', 'value': ANY}],
+            launchType='EC2'
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_not_create_listener_rule_twice(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*', 'priority': 10}]
+        }
+
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}
+        boto3.client().describe_listeners.return_value = {
+            'Listeners': [{'ListenerArn': 'http-ARN'}, {'ListenerArn': 'https-ARN'}]
+        }
+        boto3.client().describe_rules.side_effect = lambda ListenerArn: {
+            'Rules': [{
+                'Priority': '10',
+                'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}}]
+            }] if ListenerArn == 'http-ARN' else []
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().create_rule.assert_called_once_with(
+            ListenerArn='https-ARN',
+            Conditions=[{'Field': 'path-pattern', 'PathPatternConfig': {'Values': ['/app/*']}}],
+            Priority=10,
+            Actions=[{'Type': 'forward', 'TargetGroupArn': 'app-ARN'}]
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_update_existing_target_group_on_redeploy(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*'}],
+            'targetGroup': {'healthCheckPath': '/ready', 'deregistrationDelay': 10}
+        }
+        name = get_target_group_name('test', 'app', {
+            'loadBalancer': 'internal', 'containerName': 'app', 'containerPort': 8080
+        })
+
+        boto3.client().exceptions.DuplicateTargetGroupNameException = DuplicateTargetGroupNameException
+        boto3.client().describe_target_groups.side_effect = lambda Names: {'TargetGroups': [
+            {'TargetGroupArn': 'app-ARN'} if Names == [name] else
+            {'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}
+        ]}
+        boto3.client().create_target_group.side_effect = DuplicateTargetGroupNameException()
+        boto3.client().describe_listeners.return_value = {'Listeners': []}
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().modify_target_group.assert_called_once_with(TargetGroupArn='app-ARN', HealthCheckPath='/ready')
+        boto3.client().modify_target_group_attributes.assert_called_once_with(
+            TargetGroupArn='app-ARN',
+            Attributes=[{'Key': 'deregistration_delay.timeout_seconds', 'Value': '10'}]
+        )
+        boto3.client().create_service.assert_called_with(
+            cluster='test',
+            serviceName='app',
+            taskDefinition='app',
+            loadBalancers=[{'targetGroupArn': 'app-ARN', 'containerName': 'app', 'containerPort': 8080}],
+            desiredCount=1,
+            tags=ANY,
+            launchType='EC2'
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_retry_listener_rule_with_next_priority_when_taken(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*'}]
+        }
+
+        boto3.client().exceptions.PriorityInUseException = PriorityInUseException
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}
+        boto3.client().describe_listeners.return_value = {'Listeners': [{'ListenerArn': 'listener-ARN'}]}
+        boto3.client().describe_rules.return_value = {
+            'Rules': [{'Priority': '4', 'Actions': [{'Type': 'forward', 'TargetGroupArn': 'other-ARN'}]}]
+        }
+        # another service took priority 5 after the rules were read
+        boto3.client().create_rule.side_effect = [PriorityInUseException(), {}]
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        self.assertEqual([i[1]['Priority'] for i in boto3.client().create_rule.call_args_list], [5, 6])
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_not_change_configured_priority_when_taken(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'loadBalancers': [{'loadBalancer': 'internal', 'path': '/app/*', 'priority': 10}]
+        }
+
+        boto3.client().exceptions.PriorityInUseException = PriorityInUseException
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{'TargetGroupArn': 'shared-ARN', 'VpcId': 'vpc-1', 'LoadBalancerArns': ['alb-ARN']}]
+        }
+        boto3.client().create_target_group.return_value = {'TargetGroups': [{'TargetGroupArn': 'app-ARN'}]}
+        boto3.client().describe_listeners.return_value = {'Listeners': [{'ListenerArn': 'listener-ARN'}]}
+        boto3.client().describe_rules.return_value = {'Rules': []}
+        boto3.client().create_rule.side_effect = PriorityInUseException()
+
+        with self.assertRaises(PriorityInUseException):
+            controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().create_rule.assert_called_once()
+
+    def test_should_limit_target_group_names_to_32_characters(self):
+        binding = {'loadBalancer': 'internet-facing', 'containerName': 'app', 'containerPort': 8080}
+
+        name = get_target_group_name('test', 'my.very-long-application-name-1', binding)
+
+        self.assertLessEqual(len(name), 32)
+        self.assertRegex(name, '^my-very-long-applicatio-[0-9a-f]{8}$')
+        self.assertNotEqual(name, get_target_group_name('test', 'my.very-long-application-name-2', binding))
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_configure_cloudwatch_logs_for_containers_without_log_configuration(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        custom_log_configuration = {'logDriver': 'syslog'}
+        parameters = {
+            'containerDefinitions': [
+                {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+                {'name': 'envoy', 'logConfiguration': custom_log_configuration}
+            ],
+            'desiredCount': 1,
+            'logRetentionDays': 14
+        }
+
+        controller.deploy(cluster_name='test', service_name='app-1', region='eu-central-1', parameters=parameters)
+
+        boto3.client().create_log_group.assert_called_with(logGroupName='/cloudcrane/test')
+        boto3.client().put_retention_policy.assert_called_with(logGroupName='/cloudcrane/test', retentionInDays=14)
+        boto3.client().register_task_definition.assert_called_with(
+            family='app-1',
+            taskRoleArn='',
+            volumes=[],
+            containerDefinitions=[
+                {
+                    'name': 'app',
+                    'portMappings': [{'containerPort': 8080}],
+                    'logConfiguration': {
+                        'logDriver': 'awslogs',
+                        'options': {
+                            'awslogs-group': '/cloudcrane/test',
+                            'awslogs-region': 'eu-central-1',
+                            'awslogs-stream-prefix': 'app-1'
+                        }
+                    }
+                },
+                {'name': 'envoy', 'logConfiguration': custom_log_configuration}
+            ]
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_apply_log_retention_to_existing_log_group(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 1,
+            'logRetentionDays': 30
+        }
+
+        boto3.client().exceptions.ResourceAlreadyExistsException = ResourceAlreadyExistsException
+        boto3.client().create_log_group.side_effect = ResourceAlreadyExistsException()
+
+        controller.deploy(cluster_name='test', service_name='app', region='eu-central-1', parameters=parameters)
+
+        boto3.client().put_retention_policy.assert_called_once_with(logGroupName='/cloudcrane/test',
+                                                                    retentionInDays=30)
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_register_auto_scaling_policies_on_deploy(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        parameters = {
+            'containerDefinition': {'name': 'app', 'portMappings': [{'containerPort': 8080}]},
+            'desiredCount': 2,
+            'loadBalancer': 'internal',
+            'autoScaling': {
+                'minCount': 2,
+                'maxCount': 10,
+                'cpuTarget': 60,
+                'requestsPerTarget': 1000
+            }
+        }
+
+        boto3.client().describe_target_groups.return_value = {
+            'TargetGroups': [{
+                'TargetGroupArn': 'arn:aws:elasticloadbalancing:eu-central-1:1:targetgroup/test-internal-tg/73e2d6bc',
+                'LoadBalancerArns': [
+                    'arn:aws:elasticloadbalancing:eu-central-1:1:loadbalancer/app/test-internal-alb/50dc6c49'
+                ]
+            }]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters=parameters)
+
+        boto3.client().register_scalable_target.assert_called_with(
+            ServiceNamespace='ecs',
+            ResourceId='service/test/app',
+            ScalableDimension='ecs:service:DesiredCount',
+            MinCapacity=2,
+            MaxCapacity=10
+        )
+
+        self.assertEqual(boto3.client().put_scaling_policy.call_count, 2)
+        boto3.client().put_scaling_policy.assert_called_with(
+            PolicyName='app-requests',
+            ServiceNamespace='ecs',
+            ResourceId='service/test/app',
+            ScalableDimension='ecs:service:DesiredCount',
+            PolicyType='TargetTrackingScaling',
+            TargetTrackingScalingPolicyConfiguration={
+                'TargetValue': 1000.0,
+                'PredefinedMetricSpecification': {
+                    'PredefinedMetricType': 'ALBRequestCountPerTarget',
+                    'ResourceLabel': 'app/test-internal-alb/50dc6c49/targetgroup/test-internal-tg/73e2d6bc'
+                },
+                'ScaleInCooldown': 300,
+                'ScaleOutCooldown': 60
+            }
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_keep_desired_count_of_auto_scaled_service_on_redeploy(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().register_task_definition.return_value = {'taskDefinition': {'taskDefinitionArn': 'app:2'}}
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'serviceArn': 'app-ARN', 'taskDefinition': 'app:1', 'desiredCount': 7
+            }]
+        }
+
+        controller.deploy(cluster_name='test', service_name='app', region=None, parameters={
+            'containerDefinition': {'name': 'app'},
+            'desiredCount': 2,
+            'autoScaling': {'minCount': 2, 'maxCount': 10, 'cpuTarget': 60}
+        })
+
+        boto3.client().update_service.assert_called_with(
+            cluster='test',
+            service='app',
+            taskDefinition='app:2',
+            loadBalancers=[]
+        )
+        boto3.client().register_scalable_target.assert_called_with(
+            ServiceNamespace='ecs',
+            ResourceId='service/test/app',
+            ScalableDimension='ecs:service:DesiredCount',
+            MinCapacity=2,
+            MaxCapacity=10
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_deregister_auto_scaling_before_deleting_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {'services': [{
+            'serviceName': 'app', 'status': 'ACTIVE', 'runningCount': 0
+        }]}
+        boto3.client().describe_scalable_targets.return_value = {'ScalableTargets': [{'ResourceId': 'x'}]}
+
+        controller.delete(cluster_name='test', service_name='app')
+
+        boto3.client().deregister_scalable_target.assert_called_with(
+            ServiceNamespace='ecs',
+            ResourceId='service/test/app',
+            ScalableDimension='ecs:service:DesiredCount'
+        )
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_skip_auto_scaling_deregistration_for_unscaled_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {'services': [{
+            'serviceName': 'app', 'status': 'ACTIVE', 'runningCount': 0
+        }]}
+        boto3.client().describe_scalable_targets.return_value = {'ScalableTargets': []}
+
+        controller.delete(cluster_name='test', service_name='app')
+
+        boto3.client().deregister_scalable_target.assert_not_called()
+        boto3.client().delete_service.assert_called_with(cluster='test', service='app')
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_delete_dedicated_target_group_and_listener_rules_of_service(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'runningCount': 0,
+                'loadBalancers': [{'targetGroupArn': 'app-tg-ARN'}, {'targetGroupArn': 'shared-ARN'}]
+            }]
+        }
+        boto3.client().describe_target_groups.side_effect = lambda TargetGroupArns: {
+            'TargetGroups': [{
+                'TargetGroupArn': TargetGroupArns[0],
+                'TargetGroupName': 'app-12345678' if TargetGroupArns == ['app-tg-ARN'] else 'test-internal-tg',
+                'LoadBalancerArns': ['alb-ARN']
+            }]
+        }
+        boto3.client().describe_listeners.return_value = {'Listeners': [{'ListenerArn': 'listener-ARN'}]}
+        boto3.client().describe_rules.return_value = {
+            'Rules': [
+                {
+                    'RuleArn': 'default-rule-ARN',
+                    'IsDefault': True,
+                    'Actions': [{'Type': 'forward', 'TargetGroupArn': 'shared-ARN'}]
+                },
+                {
+                    'RuleArn': 'app-rule-ARN',
+                    'IsDefault': False,
+                    'Actions': [{'Type': 'forward', 'TargetGroupArn': 'app-tg-ARN'}]
+                },
+                {
+                    # rule of another version still shifting traffic to the service
+                    'RuleArn': 'other-rule-ARN',
+                    'IsDefault': False,
+                    'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+                        {'TargetGroupArn': 'other-tg-ARN', 'Weight': 100},
+                        {'TargetGroupArn': 'app-tg-ARN', 'Weight': 0}
+                    ]}}]
+                }
+            ]
+        }
+
+        controller.delete(cluster_name='test', service_name='app')
+
+        boto3.client().delete_rule.assert_called_once_with(RuleArn='app-rule-ARN')
+        boto3.client().delete_target_group.assert_called_once_with(TargetGroupArn='app-tg-ARN')
+
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_raise_exception_when_service_to_delete_is_unknown(self, boto3):
-        controller = ServiceController()
+        controller = ServiceController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
         service_name = ''.join(random.choices(string.ascii_letters, k=10))
 
-        boto3.client().list_services.return_value = {'serviceArns': []}
+        boto3.client().describe_services.return_value = {'services': []}
 
         with self.assertRaisesRegex(Exception, 'Unknown service: \[{0}\]'.format(service_name)):
             controller.delete(cluster_name=cluster_name, service_name=service_name)
 
+    def mock_service_with_tasks(self, boto3, running_tasks, stopped_tasks, target_states):
+        boto3.client().describe_services.return_value = {
+            'services': [{
+                'serviceName': 'app', 'status': 'ACTIVE',
+                'deployments': [
+                    {'id': 'ecs-svc/2', 'status': 'PRIMARY', 'taskDefinition': 'app:2', 'desiredCount': 2,
+                     'createdAt': datetime(2020, 1, 1, 12, 0, 0)},
+                    {'id': 'ecs-svc/1', 'status': 'ACTIVE', 'taskDefinition': 'app:1', 'desiredCount': 2,
+                     'createdAt': datetime(2020, 1, 1, 11, 0, 0)}
+                ],
+                'loadBalancers': [{'targetGroupArn': 'tg-ARN', 'containerName': 'app', 'containerPort': 8080}]
+            }]
+        }
+        tasks = {'RUNNING': running_tasks, 'STOPPED': stopped_tasks}
+        boto3.client().get_paginator().paginate.side_effect = lambda cluster, serviceName, desiredStatus: [
+            {'taskArns': [i['taskArn'] for i in tasks[desiredStatus]]}
+        ]
+        boto3.client().describe_tasks.side_effect = lambda cluster, tasks: {
+            'tasks': [i for i in running_tasks + stopped_tasks if i['taskArn'] in tasks]
+        }
+        boto3.client().describe_container_instances.return_value = {
+            'containerInstances': [{'containerInstanceArn': 'ci-ARN', 'ec2InstanceId': 'i-1'}]
+        }
+        boto3.client().describe_target_health.return_value = {
+            'TargetHealthDescriptions': [
+                {'Target': {'Id': 'i-1', 'Port': port}, 'TargetHealth': {'State': state}}
+                for port, state in target_states.items()
+            ]
+        }
+
+    @staticmethod
+    def task(task_arn, task_definition, host_port, last_status='RUNNING', stopped_reason=None, exit_code=None,
+             started_by=None):
+        return {
+            'taskArn': task_arn,
+            'taskDefinitionArn': task_definition,
+            'startedBy': started_by or 'ecs-svc/' + task_definition.split(':')[-1],
+            'lastStatus': last_status,
+            'containerInstanceArn': 'ci-ARN',
+            'stoppedReason': stopped_reason,
+            'containers': [{
+                'name': 'app',
+                'exitCode': exit_code,
+                'networkBindings': [{'containerPort': 8080, 'hostPort': host_port}]
+            }]
+        }
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_return_when_tasks_of_primary_deployment_are_healthy(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.return_value = 0
+
+        self.mock_service_with_tasks(
+            boto3,
+            running_tasks=[self.task('t1', 'app:2', 32768), self.task('t2', 'app:2', 32769),
+                           self.task('t0', 'app:1', 32767)],
+            stopped_tasks=[],
+            target_states={32767: 'healthy', 32768: 'healthy', 32769: 'healthy'}
+        )
+
+        controller.wait_healthy(cluster_name='test', service_name='app')
+
+        time.sleep.assert_not_called()
+        boto3.client().describe_target_health.assert_called_with(TargetGroupArn='tg-ARN')
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_wait_with_backoff_until_timeout(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.side_effect = [0, 0, 5, 20, 100]
+
+        self.mock_service_with_tasks(
+            boto3,
+            running_tasks=[self.task('t1', 'app:2', 32768), self.task('t2', 'app:2', 32769)],
+            stopped_tasks=[],
+            target_states={32768: 'healthy', 32769: 'initial'}
+        )
+
+        with self.assertRaisesRegex(Exception, r'Timeout waiting for service \[app\] to become healthy \(1/2'):
+            controller.wait_healthy(cluster_name='test', service_name='app', timeout=30)
+
+        self.assertEqual([i[0][0] for i in time.sleep.call_args_list], [2, 4, 8])
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_accept_healthy_share_of_desired_tasks(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.return_value = 0
+
+        self.mock_service_with_tasks(
+            boto3,
+            running_tasks=[self.task('t1', 'app:2', 32768), self.task('t2', 'app:2', 32769)],
+            stopped_tasks=[],
+            target_states={32768: 'healthy', 32769: 'unhealthy'}
+        )
+
+        controller.wait_healthy(cluster_name='test', service_name='app', healthy_share=0.5)
+
+        time.sleep.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_fail_fast_when_tasks_keep_stopping(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.return_value = 0
+
+        self.mock_service_with_tasks(
+            boto3,
+            running_tasks=[],
+            stopped_tasks=[
+                self.task('s1', 'app:2', 0, 'STOPPED', 'Essential container in task exited', exit_code=1),
+                self.task('s2', 'app:2', 0, 'STOPPED', 'Essential container in task exited', exit_code=137),
+                self.task('s3', 'app:2', 0, 'STOPPED', 'Task failed ELB health checks'),
+                self.task('s4', 'app:1', 0, 'STOPPED', 'Scaling activity initiated by deployment', exit_code=1)
+            ],
+            target_states={}
+        )
+
+        with self.assertRaisesRegex(Exception, r'Tasks of service \[app\] keep stopping: '
+                                               r'Essential container in task exited; Task failed ELB health checks$'):
+            controller.wait_healthy(cluster_name='test', service_name='app')
+
+        time.sleep.assert_not_called()
+
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_not_count_tasks_stopped_regularly_or_by_earlier_deployments(self, boto3, time):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+        time.time.return_value = 0
+
+        self.mock_service_with_tasks(
+            boto3,
+            running_tasks=[self.task('t1', 'app:2', 32768), self.task('t2', 'app:2', 32769)],
+            stopped_tasks=[
+                # scaled in, exited cleanly on SIGTERM
+                self.task('s1', 'app:2', 0, 'STOPPED', 'Scaling activity initiated by deployment', exit_code=0),
+                self.task('s2', 'app:2', 0, 'STOPPED', 'Scaling activity initiated by deployment', exit_code=0),
+                # an earlier deployment of the same task definition
+                self.task('s3', 'app:2', 0, 'STOPPED', 'Essential container in task exited', exit_code=1,
+                          started_by='ecs-svc/0'),
+                self.task('s4', 'app:2', 0, 'STOPPED', 'Task failed ELB health checks', started_by='ecs-svc/0'),
+                self.task('s5', 'app:2', 0, 'STOPPED', 'Task failed ELB health checks', started_by='ecs-svc/0')
+            ],
+            target_states={32768: 'healthy', 32769: 'healthy'}
+        )
+
+        controller.wait_healthy(cluster_name='test', service_name='app')
+
+        time.sleep.assert_not_called()
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_stream_new_service_events_and_stopped_tasks(self, boto3, time, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        events = [{'createdAt': datetime(2020, 1, 1, 12, 0, 0), 'message': '(service app) has reached a steady state.'}]
+        stopped_task_arns = ['arn:aws:ecs:eu-central-1:1:task/test/t1']
+        stopped_tasks = {
+            'arn:aws:ecs:eu-central-1:1:task/test/t1': {
+                'taskArn': 'arn:aws:ecs:eu-central-1:1:task/test/t1',
+                'lastStatus': 'STOPPED',
+                'stoppedAt': datetime(2020, 1, 1, 12, 0, 5),
+                'stoppedReason': 'Essential container in task exited',
+                'containers': [{'name': 'app', 'exitCode': 1}]
+            },
+            'arn:aws:ecs:eu-central-1:1:task/test/t2': {
+                'taskArn': 'arn:aws:ecs:eu-central-1:1:task/test/t2',
+                'lastStatus': 'STOPPED',
+                'stoppedAt': datetime(2020, 1, 1, 12, 0, 20),
+                'stoppedReason': 'Task failed ELB health checks',
+                'containers': [{'name': 'app'}]
+            }
+        }
+
+        boto3.client().describe_services.side_effect = lambda cluster, services: {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'events': list(reversed(events))}]
+        }
+        boto3.client().get_paginator().paginate.side_effect = lambda **kwargs: [{'taskArns': list(stopped_task_arns)}]
+        boto3.client().describe_tasks.side_effect = lambda cluster, tasks: {
+            'tasks': [stopped_tasks[i] for i in tasks]
+        }
+
+        def next_poll(interval):
+            if time.sleep.call_count > 1:
+                raise KeyboardInterrupt()
+            events.append({'createdAt': datetime(2020, 1, 1, 12, 0, 10), 'message': '(service app) started 1 tasks.'})
+            stopped_task_arns.append('arn:aws:ecs:eu-central-1:1:task/test/t2')
+
+        time.sleep.side_effect = next_poll
+
+        with self.assertRaises(KeyboardInterrupt):
+            controller.events(cluster_name='test', service_name='app', follow=True)
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            '2020-01-01T12:00:00 (service app) has reached a steady state.',
+            '2020-01-01T12:00:05 (task t1) stopped: Essential container in task exited [app: 1]',
+            '2020-01-01T12:00:10 (service app) started 1 tasks.',
+            '2020-01-01T12:00:20 (task t2) stopped: Task failed ELB health checks'
+        ])
+        self.assertEqual([i[1]['tasks'] for i in boto3.client().describe_tasks.call_args_list], [
+            ['arn:aws:ecs:eu-central-1:1:task/test/t1'],
+            ['arn:aws:ecs:eu-central-1:1:task/test/t2'],
+        ])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_show_stopping_task_once_it_has_stopped(self, boto3, time, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        task = {
+            'taskArn': 'arn:aws:ecs:eu-central-1:1:task/test/t1',
+            'lastStatus': 'DEACTIVATING',
+            'stoppingAt': datetime(2020, 1, 1, 12, 0, 5),
+            'stoppedReason': 'Scaling activity initiated by deployment',
+            'containers': [{'name': 'app'}]
+        }
+
+        boto3.client().describe_services.return_value = {'services': [{
+            'serviceName': 'app', 'status': 'ACTIVE', 'events': []
+        }]}
+        boto3.client().get_paginator().paginate.return_value = [{'taskArns': [task['taskArn']]}]
+        boto3.client().describe_tasks.side_effect = lambda cluster, tasks: {'tasks': [dict(task)]}
+
+        def next_poll(interval):
+            if time.sleep.call_count > 2:
+                raise KeyboardInterrupt()
+            task.update({
+                'lastStatus': 'STOPPED',
+                'stoppedAt': datetime(2020, 1, 1, 12, 0, 8),
+                'stoppedReason': 'Essential container in task exited',
+                'containers': [{'name': 'app', 'exitCode': 137}]
+            })
+
+        time.sleep.side_effect = next_poll
+
+        with self.assertRaises(KeyboardInterrupt):
+            controller.events(cluster_name='test', service_name='app', follow=True)
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            '2020-01-01T12:00:08 (task t1) stopped: Essential container in task exited [app: 137]'
+        ])
+        self.assertEqual(boto3.client().describe_tasks.call_count, 2)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_only_show_events_since_given_time(self, boto3, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'events': [
+                {'createdAt': datetime(2020, 1, 1, 13, 0, 0), 'message': 'new'},
+                {'createdAt': datetime(2020, 1, 1, 11, 0, 0), 'message': 'old'}
+            ]}]
+        }
+        boto3.client().get_paginator().paginate.return_value = [{'taskArns': []}]
+
+        controller.events(cluster_name='test', service_name='app', since=datetime(2020, 1, 1, 12, 0, 0))
+
+        self.assertEqual(out.getvalue(), '2020-01-01T13:00:00 new\n')
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_merge_logs_of_all_tasks_in_timestamp_order(self, boto3, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'taskDefinition': 'app:1'}]
+        }
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {'containerDefinitions': [{
+            'name': 'app',
+            'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {'awslogs-group': '/cloudcrane/test', 'awslogs-stream-prefix': 'app'}
+            }
+        }]}}
+        events = {
+            'app/app/task1aaaaaaaa': [{'eventId': '1', 'timestamp': 1000, 'message': 'first\n'},
+                                      {'eventId': '3', 'timestamp': 3000, 'message': 'third\n'}],
+            'app/app/task2bbbbbbbb': [{'eventId': '2', 'timestamp': 2000, 'message': 'second\n'}]
+        }
+
+        def paginate(**kwargs):
+            if 'logStreamNames' not in kwargs:
+                return [{'taskArns': ['arn:aws:ecs:eu-central-1:1:task/test/task1aaaaaaaa',
+                                      'arn:aws:ecs:eu-central-1:1:task/test/task2bbbbbbbb']}]
+            self.assertEqual(kwargs['logGroupName'], '/cloudcrane/test')
+            self.assertEqual(kwargs['startTime'], 500)
+            return [{'events': [dict(event, logStreamName=stream_name)
+                                for stream_name in kwargs['logStreamNames'] for event in events[stream_name]]}]
+
+        boto3.client().get_paginator().paginate.side_effect = paginate
+
+        controller.logs(cluster_name='test', service_name='app', since=datetime.fromtimestamp(0.5, timezone.utc))
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            '1970-01-01T00:00:01+00:00 task1aaa/app first',
+            '1970-01-01T00:00:02+00:00 task2bbb/app second',
+            '1970-01-01T00:00:03+00:00 task1aaa/app third'
+        ])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.time')
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_follow_each_log_stream_from_its_last_event(self, boto3, time, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'taskDefinition': 'app:1'}]
+        }
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {'containerDefinitions': [{
+            'name': 'app',
+            'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {'awslogs-group': '/cloudcrane/test', 'awslogs-stream-prefix': 'app'}
+            }
+        }]}}
+        events = {
+            'app/app/task1aaaaaaaa': [{'eventId': '1', 'timestamp': 1000, 'message': 'first'},
+                                      {'eventId': '2', 'timestamp': 1500, 'message': 'second'},
+                                      {'eventId': '3', 'timestamp': 1800, 'message': 'third'}],
+            'app/app/task2bbbbbbbb': [{'eventId': '4', 'timestamp': 2000, 'message': 'fourth'},
+                                      {'eventId': '5', 'timestamp': 2200, 'message': 'fifth'}]
+        }
+
+        def paginate(**kwargs):
+            if 'logStreamNames' not in kwargs:
+                return [{'taskArns': ['arn:aws:ecs:eu-central-1:1:task/test/task1aaaaaaaa',
+                                      'arn:aws:ecs:eu-central-1:1:task/test/task2bbbbbbbb']}]
+            return [{'events': [dict(event, logStreamName=stream_name)
+                                for stream_name in kwargs['logStreamNames'] for event in events[stream_name]
+                                if event['timestamp'] >= kwargs['startTime']
+                                ][:kwargs['PaginationConfig']['MaxItems']]}]
+
+        boto3.client().get_paginator().paginate.side_effect = paginate
+
+        def next_poll(interval):
+            if time.sleep.call_count > 1:
+                raise KeyboardInterrupt()
+
+        time.sleep.side_effect = next_poll
+
+        with self.assertRaises(KeyboardInterrupt):
+            controller.logs(cluster_name='test', service_name='app', since=datetime.fromtimestamp(0.5, timezone.utc),
+                            follow=True, limit=2)
+
+        # the first stream had more new events than the limit, the third one is printed on the next poll
+        self.assertEqual(out.getvalue().splitlines(), [
+            '1970-01-01T00:00:01+00:00 task1aaa/app first',
+            '1970-01-01T00:00:01.500000+00:00 task1aaa/app second',
+            '1970-01-01T00:00:02+00:00 task2bbb/app fourth',
+            '1970-01-01T00:00:02.200000+00:00 task2bbb/app fifth',
+            '1970-01-01T00:00:01.800000+00:00 task1aaa/app third'
+        ])
+
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_raise_exception_when_service_has_no_cloudwatch_logs(self, boto3):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'taskDefinition': 'app:1'}]
+        }
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {'containerDefinitions': [
+            {'name': 'app'}
+        ]}}
+
+        with self.assertRaisesRegex(Exception, r'No CloudWatch Logs configuration for service: \[app\]'):
+            controller.logs(cluster_name='test', service_name='app')
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    @patch('cloudcrane.controllers.service_controller.boto3')
+    def test_should_skip_logs_of_containers_without_stream_prefix(self, boto3, out):
+        controller = ServiceController(locker=self.locker, journal=self.journal)
+
+        boto3.client().describe_services.return_value = {
+            'services': [{'serviceName': 'app', 'status': 'ACTIVE', 'taskDefinition': 'app:1'}]
+        }
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {'containerDefinitions': [
+            {'name': 'app', 'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {'awslogs-group': '/cloudcrane/test', 'awslogs-stream-prefix': 'app'}
+            }},
+            {'name': 'proxy', 'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {'awslogs-group': '/cloudcrane/test'}
+            }}
+        ]}}
+        log_stream_names = list()
+
+        def paginate(**kwargs):
+            if 'logStreamNames' not in kwargs:
+                return [{'taskArns': ['arn:aws:ecs:eu-central-1:1:task/test/task1aaaaaaaa']}]
+            log_stream_names.extend(kwargs['logStreamNames'])
+            return [{'events': []}]
+
+        boto3.client().get_paginator().paginate.side_effect = paginate
+
+        controller.logs(cluster_name='test', service_name='app')
+
+        self.assertEqual(log_stream_names, ['app/app/task1aaaaaaaa'])
+        self.assertEqual(out.getvalue().splitlines(), [
+            'WARNING: Skipping logs of container [proxy] without awslogs-stream-prefix'
+        ])
+
+        boto3.client().describe_task_definition.return_value = {'taskDefinition': {'containerDefinitions': [
+            {'name': 'proxy', 'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {'awslogs-group': '/cloudcrane/test'}
+            }}
+        ]}}
+        with self.assertRaisesRegex(Exception, r'No CloudWatch Logs configuration for service: \[app\]'):
+            controller.logs(cluster_name='test', service_name='app')
+
     @patch('cloudcrane.controllers.cluster_controller.clickclick.console')
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_list_deployed_services_sorted_by_name(self, boto3, console):
-        controller = ServiceController()
+        controller = ServiceController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
         service1_name = ''.join(random.choices(string.ascii_letters, k=10))
@@ -124,7 +1691,9 @@ class TestServiceController(TestCase):
         service3_name = ''.join(random.choices(string.ascii_letters, k=10))
         service3_arn = ''.join(random.choices(string.ascii_letters, k=10))
 
-        boto3.client().list_services.return_value = {'serviceArns': [service1_arn, service2_arn, service3_arn]}
+        boto3.client().get_paginator().paginate.return_value = [
+            {'serviceArns': [service1_arn, service2_arn, service3_arn]}
+        ]
         boto3.client().describe_services.return_value = {
             'services': [
                 {
@@ -150,7 +1719,11 @@ class TestServiceController(TestCase):
 
         controller.list(cluster_name=cluster_name)
 
-        boto3.client().list_services.assert_called_with(cluster=cluster_name)
+        boto3.client().get_paginator().paginate.assert_called_with(cluster=cluster_name)
+        boto3.client().describe_services.assert_called_with(
+            cluster=cluster_name,
+            services=[service1_arn, service2_arn, service3_arn]
+        )
 
         console.print_table.assert_called_with(
             ['service_name', 'status', 'tasks'],
@@ -178,15 +1751,16 @@ class TestServiceController(TestCase):
     @patch('cloudcrane.controllers.cluster_controller.clickclick.console')
     @patch('cloudcrane.controllers.service_controller.boto3')
     def test_should_show_empty_list_when_no_services_deployed(self, boto3, console):
-        controller = ServiceController()
+        controller = ServiceController(locker=self.locker, journal=self.journal)
 
         cluster_name = ''.join(random.choices(string.ascii_letters, k=10))
 
-        boto3.client().list_services.return_value = {'serviceArns': []}
+        boto3.client().get_paginator().paginate.return_value = [{'serviceArns': []}]
 
         controller.list(cluster_name=cluster_name)
 
-        boto3.client().list_services.assert_called_with(cluster=cluster_name)
+        boto3.client().get_paginator().paginate.assert_called_with(cluster=cluster_name)
+        boto3.client().describe_services.assert_not_called()
         console.print_table.assert_called_with(
             ['service_name', 'status', 'tasks'],
             [],